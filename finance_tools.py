@@ -1,13 +1,70 @@
 import os
 import logging
 import re
+import time
+import asyncio
+import threading
 import requests
-from bs4 import BeautifulSoup
+import pytz
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, time as dtime, timedelta
+from bs4 import BeautifulSoup, SoupStrainer
+from quote_history import record_quote, record_quotes, price_stats, RETENTION_DAYS
+from tickers import NSE_TICKERS, resolve
+
+# Optional fast parsers for the scrapers; bs4 stays as the fallback
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:
+    HTMLParser = None
+try:
+    import lxml  # noqa: F401  (only used as a bs4 tree builder)
+    BS4_FEATURES = "lxml"
+except ImportError:
+    BS4_FEATURES = "html.parser"
 
 logger = logging.getLogger(__name__)
 
 ALPHA_VANTAGE_KEY = os.getenv("ALPHA_VANTAGE_KEY", "")
 
+# --- QUOTE CACHE ---
+EAT_ZONE = pytz.timezone('Africa/Nairobi')
+NSE_OPEN = dtime(9, 0)            # NSE trades Mon-Fri 09:00-15:00 EAT
+NSE_CLOSE = dtime(15, 0)
+NSE_SETTLE_MINUTES = 30           # Closing prices can still move shortly after the bell
+US_ZONE = pytz.timezone('America/New_York')
+US_OPEN = dtime(9, 30)            # NYSE/NASDAQ regular session, Mon-Fri 09:30-16:00 ET
+US_CLOSE = dtime(16, 0)
+QUOTE_TTL_OPEN = int(os.getenv("QUOTE_TTL_OPEN", "60"))        # Seconds, while NSE is trading
+QUOTE_TTL_GLOBAL = int(os.getenv("QUOTE_TTL_GLOBAL", "300"))   # Seconds, non-NSE symbols
+QUOTE_STALE_GRACE = int(os.getenv("QUOTE_STALE_GRACE", "600"))  # Serve expired quotes this long while refreshing
+QUOTE_CACHE_SIZE = 512
+
+# --- SOURCE RACING ---
+QUOTE_FETCH_MODE = os.getenv("QUOTE_FETCH_MODE", "race")  # "race" or "sequential"
+QUOTE_STAGGER = float(os.getenv("QUOTE_STAGGER", "1.5"))   # Seconds before starting the next fallback
+QUOTE_DEADLINE = float(os.getenv("QUOTE_DEADLINE", "8"))   # Give up on the whole race after this
+QUOTE_PRIORITY_GRACE = 1.0  # Hold a fallback's answer this long for a better source still running
+
+# --- RATE LIMITS & BREAKERS ---
+ALPHA_VANTAGE_PER_MINUTE = int(os.getenv("ALPHA_VANTAGE_PER_MINUTE", "5"))  # Free tier quota
+ALPHA_VANTAGE_PER_DAY = int(os.getenv("ALPHA_VANTAGE_PER_DAY", "25"))
+BREAKER_FAILURES = 3     # Consecutive failures before a source is skipped
+BREAKER_COOLDOWN = 60    # Seconds a tripped source is skipped before one trial request
+
+# --- PREFETCH ---
+PREFETCH_INTERVAL = int(os.getenv("PREFETCH_INTERVAL", "45"))  # Seconds between warm-up passes
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", "8"))
+PREFETCH_SEED = os.getenv("PREFETCH_SEED", "SCOM,KCB,EQTY,EABL,ABSA")  # Warm before anyone asks
+POPULARITY_HALF_LIFE = 6 * 3600  # Seconds for a ticker's interest score to halve
+TREND_DEFAULT_DAYS = 30
+
+# --- FX ---
+FX_URL = "https://open.er-api.com/v6/latest/USD"  # Free, no key, updated daily
+FX_TTL = 6 * 3600
+USD_KES_FALLBACK = float(os.getenv("USD_KES_FALLBACK", "129.0"))  # Used if the FX feed is down
+
 # Browser-like headers for scraper fallbacks
 BROWSER_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
@@ -17,27 +74,312 @@ BROWSER_HEADERS = {
     "Connection": "keep-alive",
 }
 
-# NSE tickers mapped to full names
-NSE_TICKERS = {
-    "SCOM": "Safaricom", "KCB": "KCB Group", "EQTY": "Equity Group",
-    "COOP": "Co-operative Bank", "ABSA": "ABSA Bank Kenya", "SBIC": "Stanbic Holdings",
-    "NCBA": "NCBA Group", "DTB": "Diamond Trust Bank", "IMH": "I&M Holdings",
-    "BKG": "BK Group", "HF": "HF Group", "CIC": "CIC Insurance",
-    "BRIT": "Britam Holdings", "JUB": "Jubilee Holdings", "LKN": "Liberty Kenya",
-    "KNRE": "Kenya Reinsurance", "EABL": "East African Breweries",
-    "BAT": "BAT Kenya", "BOC": "BOC Kenya", "CARB": "Carbacid Investments",
-    "BAMB": "Bamburi Cement", "ARM": "ARM Cement", "CRG": "Car & General",
-    "KEGN": "KenGen", "KPLC": "Kenya Power", "TOTAL": "TotalEnergies Kenya",
-    "UMME": "Umeme", "AIRTEL": "Airtel Africa",
-    "CTUM": "Centum Investment", "ICDC": "ICDC", "OCH": "Olympia Capital",
-    "SASN": "Sasini", "KUKZ": "Kakuzi", "LIMT": "Limuru Tea",
-    "WTK": "WPP Scangroup", "REA": "Rea Vipingo", "EGAD": "Eaagads",
-    "KAPC": "Kapchorua Tea", "HOME": "Home Afrika",
-    "UCHM": "Uchumi", "SGL": "Standard Group", "NMG": "Nation Media",
-    "TPS": "TPS Eastern Africa", "SCAN": "WPP Scangroup", "HAFR": "Flame Tree Group",
-    "FIRE": "Flame Tree Group", "KENO": "KenolKobil", "MSC": "Nairobi Securities",
-    "EVRD": "Eveready East Africa", "WILL": "Williamson Tea",
-}
+
+# ──────────────────────────────────────────────
+# RATE LIMITS & CIRCUIT BREAKERS
+# ──────────────────────────────────────────────
+class TokenBucket:
+    """Alpha Vantage quota: refills per_minute tokens a minute, capped at per_day per UTC day."""
+
+    def __init__(self, per_minute, per_day):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.tokens = float(per_minute)
+        self.day = datetime.now(pytz.utc).date()
+        self.used_today = 0
+        self.denied = 0
+        self.refilled_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.per_minute, self.tokens + (now - self.refilled_at) * self.per_minute / 60)
+        self.refilled_at = now
+        today = datetime.now(pytz.utc).date()
+        if today != self.day:
+            self.day, self.used_today = today, 0
+
+    def try_acquire(self):
+        """Takes one request's worth of quota. False means don't bother calling."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1 and self.used_today < self.per_day:
+                self.tokens -= 1
+                self.used_today += 1
+                return True
+            self.denied += 1
+            return False
+
+    def exhaust(self, daily=False):
+        """The API refused us anyway — trust it over our own count."""
+        with self.lock:
+            self.tokens = 0
+            if daily:
+                self.used_today = self.per_day
+
+    def snapshot(self):
+        with self.lock:
+            self._refill()
+            return {
+                "tokens": round(self.tokens, 2),
+                "used_today": self.used_today,
+                "per_minute": self.per_minute,
+                "per_day": self.per_day,
+                "denied": self.denied,
+            }
+
+
+class SourceSkipped(Exception):
+    """A source that didn't really make a request: neither a call nor a failure."""
+
+
+class CircuitBreaker:
+    """
+    closed: calls go through. After BREAKER_FAILURES consecutive failures → open.
+    open: calls are skipped instantly. After BREAKER_COOLDOWN → half_open.
+    half_open: one trial call; success → closed, failure → open again.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.max_failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.skipped = 0
+        self.trips = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self.trial_running = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            self.skipped += 1
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != "closed":
+                logger.info(f"Circuit closed for {self.name}")
+            self.state = "closed"
+            self.failures = 0
+            self.trial_running = False
+
+    def release(self):
+        """The allowed call was never made: frees the half-open trial for the next caller."""
+        with self.lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.max_failures:
+                if self.state != "open":
+                    self.trips += 1
+                    logger.warning(f"Circuit open for {self.name} after {self.failures} failure(s)")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.trial_running = False
+
+    def snapshot(self):
+        with self.lock:
+            snap = {"state": self.state, "failures": self.failures, "skipped": self.skipped, "trips": self.trips}
+            if self.state == "open":
+                snap["retry_in"] = max(0, round(self.cooldown - (time.monotonic() - self.opened_at)))
+            return snap
+
+
+_av_quota = TokenBucket(ALPHA_VANTAGE_PER_MINUTE, ALPHA_VANTAGE_PER_DAY)
+_breakers = {name: CircuitBreaker(name) for name in ("AFX board", "Alpha Vantage", "AFX", "MyStocks")}
+
+
+# ──────────────────────────────────────────────
+# HTML PARSING (selectolax when installed, else targeted bs4)
+# ──────────────────────────────────────────────
+# The scrapers only need table cells, one heading or one element by class,
+# so the fallback uses SoupStrainer to build just those parts of the tree.
+HTML_BACKEND = os.getenv("HTML_BACKEND", "selectolax" if HTMLParser else "bs4")
+if HTML_BACKEND == "selectolax" and HTMLParser is None:
+    logger.warning("HTML_BACKEND=selectolax but selectolax isn't installed, using bs4")
+    HTML_BACKEND = "bs4"
+
+
+def _html_rows(html):
+    """Text of the <td> cells of every <tr>, as lists."""
+    if HTML_BACKEND == "selectolax":
+        return [[td.text(strip=True) for td in tr.css("td")] for tr in HTMLParser(html).css("tr")]
+    soup = BeautifulSoup(html, BS4_FEATURES, parse_only=SoupStrainer("tr"))
+    return [[td.get_text(strip=True) for td in tr.find_all("td")] for tr in soup.find_all("tr")]
+
+
+def _html_tables(html):
+    """[(lowercased <th> headers, rows of <td> texts)] for every <table>."""
+    if HTML_BACKEND == "selectolax":
+        return [
+            (
+                [th.text(strip=True).lower() for th in table.css("th")],
+                [[td.text(strip=True) for td in tr.css("td")] for tr in table.css("tr")],
+            )
+            for table in HTMLParser(html).css("table")
+        ]
+    soup = BeautifulSoup(html, BS4_FEATURES, parse_only=SoupStrainer("table"))
+    return [
+        (
+            [th.get_text(strip=True).lower() for th in table.find_all("th")],
+            [[td.get_text(strip=True) for td in tr.find_all("td")] for tr in table.find_all("tr")],
+        )
+        for table in soup.find_all("table")
+    ]
+
+
+def _html_first_text(html, tag):
+    """Text of the first <tag>, or None."""
+    if HTML_BACKEND == "selectolax":
+        node = HTMLParser(html).css_first(tag)
+        return node.text() if node else None
+    node = BeautifulSoup(html, BS4_FEATURES, parse_only=SoupStrainer(tag)).find(tag)
+    return node.get_text() if node else None
+
+
+def _html_class_text(html, pattern):
+    """Text of the first element whose class attribute matches `pattern`, or None."""
+    if HTML_BACKEND == "selectolax":
+        for node in HTMLParser(html).css("[class]"):
+            if pattern.search(node.attributes.get("class") or ""):
+                return node.text()
+        return None
+    node = BeautifulSoup(html, BS4_FEATURES, parse_only=SoupStrainer(class_=pattern)).find(class_=pattern)
+    return node.get_text() if node else None
+
+
+# ──────────────────────────────────────────────
+# SOURCE 0: AFX market board (whole NSE in one request)
+# ──────────────────────────────────────────────
+NSE_BOARD_URL = "https://afx.kwayisi.org/nseke/"
+
+# Refreshed at most once per quote TTL (QUOTE_TTL_OPEN while trading, until next open otherwise)
+# "inflight" is the Future of the scrape in progress; callers that find the board expired share it
+_nse_board = {"expires_at": 0.0, "rows": {}, "refreshes": 0, "inflight": None}
+_nse_board_lock = threading.Lock()  # Only held to read or swap the snapshot, never across the request
+
+
+def _parse_signed(text):
+    value = float(re.sub(r'[^\d.]', '', text))
+    return -value if "-" in text or "−" in text else value
+
+
+def _parse_nse_board(html):
+    """Parses the AFX listing table into {SYMBOL: result}. Columns are found by header name."""
+    for headers, rows in _html_tables(html):
+        if "ticker" not in headers or "price" not in headers:
+            continue
+        col = {header: i for i, header in enumerate(headers)}
+
+        board = {}
+        for cells in rows:
+            if len(cells) < len(headers):
+                continue
+            symbol = cells[col["ticker"]].upper()
+            try:
+                price = float(cells[col["price"]].replace(",", ""))
+            except ValueError:
+                continue
+            entry = {
+                "price": price,
+                "currency": "KES",
+                "name": NSE_TICKERS.get(symbol) or (cells[col["name"]] if "name" in col else symbol),
+                "source": "afx-board",
+            }
+            if "change" in col and cells[col["change"]]:
+                try:
+                    change = _parse_signed(cells[col["change"]])
+                    entry["change"] = change
+                    previous = price - change
+                    entry["change_pct"] = change / previous * 100 if previous else 0.0
+                except ValueError:
+                    pass
+            board[symbol] = entry
+        return board
+    return {}
+
+
+def _scrape_nse_board():
+    resp = requests.get(NSE_BOARD_URL, headers=BROWSER_HEADERS, timeout=10)
+    resp.raise_for_status()
+    board = _parse_nse_board(resp.text)
+    if not board:
+        raise ValueError("AFX board page had no ticker table")
+
+    missing = [t for t in NSE_TICKERS if t not in board]
+    logger.info(f"NSE board refreshed: {len(board)} symbols ({len(missing)} known tickers missing)")
+    fetched_at = time.time()
+    for entry in board.values():
+        entry["fetched_at"] = fetched_at
+    with _nse_board_lock:
+        _nse_board.update(expires_at=time.monotonic() + _quote_ttl(True), rows=board)
+        _nse_board["refreshes"] += 1
+    record_quotes((symbol, entry["price"]) for symbol, entry in board.items())
+    return board
+
+
+def _get_nse_board(min_fresh=0):
+    """
+    The cached board, re-scraped when it expires within `min_fresh` seconds.
+    Concurrent callers share one request.
+    """
+    with _nse_board_lock:
+        if _nse_board["expires_at"] - time.monotonic() > min_fresh:
+            return _nse_board["rows"]
+        inflight = _nse_board["inflight"]
+        leader = inflight is None
+        if leader:
+            inflight = _nse_board["inflight"] = Future()
+    if not leader:
+        try:
+            return inflight.result()
+        except Exception as e:
+            # The leader's own source call already counted this failure
+            raise SourceSkipped(f"shared AFX board scrape failed: {e}") from e
+
+    try:
+        board = _scrape_nse_board()
+        inflight.set_result(board)
+        return board
+    except BaseException as e:
+        inflight.set_exception(e)
+        raise
+    finally:
+        with _nse_board_lock:
+            _nse_board["inflight"] = None
+
+
+def _fetch_nse_from_board(symbol):
+    """One symbol from the market board snapshot."""
+    try:
+        entry = _get_nse_board().get(symbol.upper())
+        return dict(entry) if entry else None
+    except SourceSkipped:
+        raise
+    except Exception as e:
+        logger.error(f"AFX board fetch failed: {e}")
+        raise  # Lets the circuit breaker see it
+
+
+def get_nse_board_stats():
+    with _nse_board_lock:
+        return {
+            "symbols": len(_nse_board["rows"]),
+            "refreshes": _nse_board["refreshes"],
+            "expires_in": max(0, round(_nse_board["expires_at"] - time.monotonic())),
+        }
 
 
 # ──────────────────────────────────────────────
@@ -46,8 +388,9 @@ NSE_TICKERS = {
 def _fetch_from_alphavantage(symbol, is_nse):
     """Fetch stock data from Alpha Vantage API."""
     if not ALPHA_VANTAGE_KEY:
-        logger.warning("No ALPHA_VANTAGE_KEY set, skipping Alpha Vantage")
-        return None
+        raise SourceSkipped("no ALPHA_VANTAGE_KEY set")
+    if not _av_quota.try_acquire():
+        raise SourceSkipped(f"quota used up, not asking for {symbol}")
 
     try:
         # NSE uses .NRB suffix on Alpha Vantage
@@ -66,7 +409,9 @@ def _fetch_from_alphavantage(symbol, is_nse):
 
         # Check for rate limit or error
         if "Note" in data or "Information" in data:
-            logger.warning(f"Alpha Vantage rate limit: {data.get('Note', data.get('Information', ''))}")
+            message = data.get('Note', data.get('Information', ''))
+            logger.warning(f"Alpha Vantage rate limit: {message}")
+            _av_quota.exhaust(daily="per day" in message.lower())
             return None
 
         quote = data.get("Global Quote", {})
@@ -93,7 +438,7 @@ def _fetch_from_alphavantage(symbol, is_nse):
 
     except Exception as e:
         logger.error(f"Alpha Vantage failed for {symbol}: {e}")
-        return None
+        raise  # Lets the circuit breaker see it
 
 
 # ──────────────────────────────────────────────
@@ -106,22 +451,16 @@ def _fetch_nse_from_afx(symbol):
         resp = requests.get(url, headers=BROWSER_HEADERS, timeout=10)
         resp.raise_for_status()
 
-        soup = BeautifulSoup(resp.text, "html.parser")
-
-        rows = soup.find_all("tr")
         data = {}
-        for row in rows:
-            cells = row.find_all("td")
+        for cells in _html_rows(resp.text):
             if len(cells) >= 2:
-                key = cells[0].get_text(strip=True).lower()
-                val = cells[1].get_text(strip=True)
-                data[key] = val
+                data[cells[0].lower()] = cells[1]
 
         price_str = data.get("last trade", data.get("close", data.get("previous close", "")))
         if not price_str:
-            header = soup.find("h2")
+            header = _html_first_text(resp.text, "h2")
             if header:
-                price_match = re.search(r'([\d,]+\.?\d*)', header.get_text())
+                price_match = re.search(r'([\d,]+\.?\d*)', header)
                 if price_match:
                     return {
                         "price": float(price_match.group(1).replace(",", "")),
@@ -163,12 +502,14 @@ def _fetch_nse_from_afx(symbol):
 
     except Exception as e:
         logger.error(f"AFX scrape failed for {symbol}: {e}")
-        return None
+        raise  # Lets the circuit breaker see it
 
 
 # ──────────────────────────────────────────────
 # SOURCE 3: MyStocks scraper (NSE last resort)
 # ──────────────────────────────────────────────
+_MYSTOCKS_PRICE_CLASS = re.compile(r"price|last", re.IGNORECASE)
+
 def _fetch_nse_from_mystocks(symbol):
     """Fallback scraper using mystocks.co.ke."""
     try:
@@ -176,10 +517,9 @@ def _fetch_nse_from_mystocks(symbol):
         resp = requests.get(url, headers=BROWSER_HEADERS, timeout=10)
         resp.raise_for_status()
 
-        soup = BeautifulSoup(resp.text, "html.parser")
-        price_el = soup.find(class_=re.compile(r"price|last", re.IGNORECASE))
-        if price_el:
-            price_match = re.search(r'([\d,]+\.?\d*)', price_el.get_text())
+        price_text = _html_class_text(resp.text, _MYSTOCKS_PRICE_CLASS)
+        if price_text:
+            price_match = re.search(r'([\d,]+\.?\d*)', price_text)
             if price_match:
                 return {
                     "price": float(price_match.group(1).replace(",", "")),
@@ -190,7 +530,7 @@ def _fetch_nse_from_mystocks(symbol):
         return None
     except Exception as e:
         logger.error(f"MyStocks scrape failed for {symbol}: {e}")
-        return None
+        raise  # Lets the circuit breaker see it
 
 
 # ──────────────────────────────────────────────
@@ -219,54 +559,564 @@ def _format_stock_result(symbol, result, is_nse):
 
 
 # ──────────────────────────────────────────────
-# MAIN FUNCTION
+# MARKET HOURS
 # ──────────────────────────────────────────────
-def get_stock_price(symbol):
+def nse_is_open(now=None):
+    """True while the NSE is trading (public holidays are not modelled)."""
+    now = now or datetime.now(EAT_ZONE)
+    return now.weekday() < 5 and NSE_OPEN <= now.time() < NSE_CLOSE
+
+
+def us_market_is_open(now=None):
+    """True during the US regular session (public holidays are not modelled)."""
+    now = (now or datetime.now(pytz.utc)).astimezone(US_ZONE)
+    return now.weekday() < 5 and US_OPEN <= now.time() < US_CLOSE
+
+
+def _next_nse_open(now):
+    day = now.date()
+    if now.time() >= NSE_OPEN:
+        day += timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return EAT_ZONE.localize(datetime.combine(day, NSE_OPEN))
+
+
+def _quote_ttl(is_nse, now=None):
+    """Seconds a fresh quote stays valid: short while trading, until next open when closed."""
+    if not is_nse:
+        return QUOTE_TTL_GLOBAL
+    now = now or datetime.now(EAT_ZONE)
+    settled = EAT_ZONE.localize(datetime.combine(now.date(), NSE_CLOSE)) + timedelta(minutes=NSE_SETTLE_MINUTES)
+    if nse_is_open(now) or (now.weekday() < 5 and NSE_CLOSE <= now.time() and now < settled):
+        return QUOTE_TTL_OPEN
+    return max(QUOTE_TTL_OPEN, (_next_nse_open(now) - now).total_seconds())
+
+
+# ──────────────────────────────────────────────
+# QUOTE CACHE (TTL + stale-while-revalidate)
+# ──────────────────────────────────────────────
+# symbol -> (expires_at, result); get_stock_price runs on worker threads
+_quote_cache = OrderedDict()
+_quote_cache_lock = threading.Lock()
+_quote_inflight = {}      # symbol -> Future of the fetch in flight, so concurrent misses share it
+_quote_refreshing = set()  # symbols with a background refresh running
+_quote_cache_stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "fetch_failures": 0}
+
+
+def _cache_get_quote(symbol):
+    """Returns (result, is_stale) or (None, False). Expired past the grace period = miss."""
+    with _quote_cache_lock:
+        entry = _quote_cache.get(symbol)
+        if entry:
+            age_past_expiry = time.monotonic() - entry[0]
+            if age_past_expiry <= QUOTE_STALE_GRACE:
+                _quote_cache.move_to_end(symbol)
+                return dict(entry[1]), age_past_expiry > 0
+            del _quote_cache[symbol]
+        return None, False
+
+
+def _cache_put_quote(symbol, result, is_nse):
+    # A board row scraped a while ago has less of its TTL left
+    age = max(0.0, time.time() - result.get("fetched_at", time.time()))
+    with _quote_cache_lock:
+        _quote_cache[symbol] = (time.monotonic() + _quote_ttl(is_nse) - age, result)
+        _quote_cache.move_to_end(symbol)
+        while len(_quote_cache) > QUOTE_CACHE_SIZE:
+            _quote_cache.popitem(last=False)
+
+
+def _count(stat):
+    with _quote_cache_lock:
+        _quote_cache_stats[stat] += 1
+
+
+def get_quote_cache_stats():
+    """Hit/miss counters for the quote cache (for the /stats endpoint)."""
+    with _quote_cache_lock:
+        stats = dict(_quote_cache_stats)
+        stats["size"] = len(_quote_cache)
+    lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 3) if lookups else 0.0
+    stats["nse_open"] = nse_is_open()
+    stats["nse_board"] = get_nse_board_stats()
+    return stats
+
+
+# ──────────────────────────────────────────────
+# SOURCE RACING
+# ──────────────────────────────────────────────
+_source_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="quote-source")
+_source_stats = {}  # source name -> counters + EWMA latency
+_source_stats_lock = threading.Lock()
+
+
+def _record_source(name, latency=None, ok=None, won=False, skipped=False):
+    with _source_stats_lock:
+        stats = _source_stats.setdefault(
+            name, {"calls": 0, "successes": 0, "wins": 0, "skipped": 0, "latency_ms": None}
+        )
+        if won:
+            stats["wins"] += 1
+        if skipped:
+            stats["skipped"] += 1
+        if latency is None:
+            return
+        stats["calls"] += 1
+        stats["successes"] += int(ok)
+        ms = latency * 1000
+        stats["latency_ms"] = ms if stats["latency_ms"] is None else 0.8 * stats["latency_ms"] + 0.2 * ms
+
+
+def get_quote_source_stats():
+    """Per-source latency, success rates and breaker state, plus the Alpha Vantage quota."""
+    with _source_stats_lock:
+        snapshot = {name: dict(stats) for name, stats in _source_stats.items()}
+    for name, breaker in _breakers.items():
+        stats = snapshot.setdefault(name, {"calls": 0, "successes": 0, "wins": 0, "skipped": 0, "latency_ms": None})
+        stats["success_rate"] = round(stats["successes"] / stats["calls"], 3) if stats["calls"] else 0.0
+        if stats["latency_ms"] is not None:
+            stats["latency_ms"] = round(stats["latency_ms"])
+        stats["breaker"] = breaker.snapshot()
+    snapshot["Alpha Vantage"]["quota"] = _av_quota.snapshot()
+    return snapshot
+
+
+def _timed_source(name, fetch):
+    """
+    Runs one source through its circuit breaker. Exceptions count as failures;
+    None (no data) doesn't, and SourceSkipped counts as nothing at all.
     """
-    Gets live price for Stocks, Crypto, or Forex.
+    breaker = _breakers[name]
+    if not breaker.allow():
+        return None
+    start = time.monotonic()
+    try:
+        result = fetch()
+        breaker.record_success()
+    except SourceSkipped as e:
+        logger.info(f"{name} skipped: {e}")
+        breaker.release()
+        _record_source(name, skipped=True)
+        return None
+    except requests.HTTPError as e:
+        # A 404 means "no such symbol", not a dead source
+        if e.response is not None and e.response.status_code == 404:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+        result = None
+    except Exception:
+        breaker.record_failure()
+        result = None
+    _record_source(name, time.monotonic() - start, bool(result))
+    return result
 
-    Fetch order:
-      NSE stocks:    Alpha Vantage → AFX scraper → MyStocks scraper
-      Global stocks: Alpha Vantage
+
+def _race_sources(sources):
     """
+    Runs [(name, fetch), ...] with staggered starts. Returns (name, result) for
+    the highest-priority valid answer, or (None, None) if nothing valid arrived
+    before QUOTE_DEADLINE. Sources still running are abandoned (their late
+    answers only feed the stats).
+    """
+    start = time.monotonic()
+    deadline = start + QUOTE_DEADLINE
+    running = {}   # future -> priority (index into sources)
+    results = {}   # priority -> result
+    launched = 0
+    next_launch = start
+    hold_until = None
+
+    def best():
+        priority = min(results)
+        return sources[priority][0], results[priority]
+
     try:
-        # 1. Clean the symbol
-        symbol = symbol.replace('[', '').replace(']', '').replace('STOCK:', '').strip().upper()
+        while True:
+            now = time.monotonic()
+            # Start the next source on schedule, or right away if nothing is left running
+            if launched < len(sources) and not results and (now >= next_launch or not running):
+                name, fetch = sources[launched]
+                running[_source_executor.submit(_timed_source, name, fetch)] = launched
+                launched += 1
+                next_launch = now + QUOTE_STAGGER
+                continue
 
-        # 2. Determine if NSE
-        is_nse = False
-        base_symbol = symbol.replace(".NR", "").replace(".NRB", "")
+            if results:
+                better_running = any(p < min(results) for p in running.values())
+                if not better_running or now >= hold_until:
+                    return best()
+            elif not running:
+                return None, None
+            if now >= deadline:
+                return best() if results else (None, None)
 
-        if base_symbol in NSE_TICKERS:
-            is_nse = True
-        elif symbol.endswith(".NR") or symbol.endswith(".NRB"):
-            is_nse = True
+            wake = min(deadline, hold_until or deadline, next_launch if launched < len(sources) else deadline)
+            done, _ = wait(running, timeout=max(0.0, wake - now), return_when=FIRST_COMPLETED)
+            for fut in done:
+                priority = running.pop(fut)
+                result = fut.result()
+                if result:
+                    results[priority] = result
+                    if hold_until is None:
+                        hold_until = time.monotonic() + QUOTE_PRIORITY_GRACE
+    finally:
+        for fut in running:
+            fut.cancel()
 
-        logger.info(f"Fetching: {base_symbol} (NSE: {is_nse})")
 
-        # 3. Alpha Vantage first (works for both NSE and global)
-        result = _fetch_from_alphavantage(base_symbol, is_nse)
-        if result:
-            logger.info(f"Got {base_symbol} from Alpha Vantage")
-            return _format_stock_result(base_symbol, result, is_nse)
+# ──────────────────────────────────────────────
+# QUOTE LOOKUP
+# ──────────────────────────────────────────────
+def _normalize_symbol(symbol):
+    """Resolves a raw symbol, company name or tag. Returns (base_symbol, is_nse)."""
+    raw = symbol.replace('[', '').replace(']', '').replace('STOCK:', '').strip()
+    ticker = resolve(raw) if raw else None
+    if ticker:
+        return ticker.symbol, ticker.exchange == "NSE"
+    # Unknown to us: trust an explicit Nairobi suffix or today's AFX board
+    base_symbol = re.sub(r'\.NRB?$', '', raw.upper())
+    return base_symbol, base_symbol != raw.upper() or base_symbol in _nse_board["rows"]
 
-        # 4. NSE fallbacks
-        if is_nse:
-            result = _fetch_nse_from_afx(base_symbol)
+
+def _fetch_quote(base_symbol, is_nse):
+    """
+    Hits the live sources (no cache).
+
+    Priority order:
+      NSE stocks:    AFX board snapshot → Alpha Vantage → AFX page scraper → MyStocks scraper
+      Global stocks: Alpha Vantage
+
+    In "race" mode the NSE sources start QUOTE_STAGGER apart (immediately if
+    the one before failed) and the best answer by priority wins.
+    """
+    logger.info(f"Fetching: {base_symbol} (NSE: {is_nse})")
+    sources = [("Alpha Vantage", lambda: _fetch_from_alphavantage(base_symbol, is_nse))]
+    if is_nse:
+        # The board serves every NSE ticker from one cached request, sparing the AV quota
+        sources.insert(0, ("AFX board", lambda: _fetch_nse_from_board(base_symbol)))
+        sources += [
+            ("AFX", lambda: _fetch_nse_from_afx(base_symbol)),
+            ("MyStocks", lambda: _fetch_nse_from_mystocks(base_symbol)),
+        ]
+
+    if QUOTE_FETCH_MODE == "race" and len(sources) > 1:
+        name, result = _race_sources(sources)
+    else:
+        name, result = None, None
+        for name, fetch in sources:
+            result = _timed_source(name, fetch)
             if result:
-                logger.info(f"Got {base_symbol} from AFX")
-                return _format_stock_result(base_symbol, result, is_nse)
+                break
+
+    if result:
+        logger.info(f"Got {base_symbol} from {name}")
+        _record_source(name, won=True)
+        return result
+    return None
+
+
+def _cache_expires_in(symbol):
+    """Seconds until the cached quote expires (negative if stale), or None if not cached."""
+    with _quote_cache_lock:
+        entry = _quote_cache.get(symbol)
+        return entry[0] - time.monotonic() if entry else None
 
-            result = _fetch_nse_from_mystocks(base_symbol)
+
+def _fetch_and_cache(base_symbol, is_nse):
+    """
+    Fetches once per symbol even when several threads miss at the same time:
+    the first one fetches and the rest wait for its result (or its error)
+    instead of fetching again one after another.
+    """
+    with _quote_cache_lock:
+        inflight = _quote_inflight.get(base_symbol)
+        leader = inflight is None
+        if leader:
+            inflight = _quote_inflight[base_symbol] = Future()
+    if not leader:
+        result = inflight.result()
+        return dict(result) if result else None
+
+    try:
+        # A fetch may have finished between our cache miss and taking the lead
+        cached, is_stale = _cache_get_quote(base_symbol)
+        if cached and not is_stale:
+            result = cached
+        else:
+            result = _fetch_quote(base_symbol, is_nse)
             if result:
-                logger.info(f"Got {base_symbol} from MyStocks")
-                return _format_stock_result(base_symbol, result, is_nse)
+                result.setdefault("fetched_at", time.time())  # Board rows carry their scrape time
+                _cache_put_quote(base_symbol, result, is_nse)
+                if result.get("source") != "afx-board":  # Board refreshes record every symbol
+                    record_quote(base_symbol, result["price"])
+            else:
+                _count("fetch_failures")
+        inflight.set_result(result)
+        return dict(result) if result else None
+    except BaseException as e:
+        inflight.set_exception(e)
+        raise
+    finally:
+        with _quote_cache_lock:
+            if _quote_inflight.get(base_symbol) is inflight:
+                del _quote_inflight[base_symbol]
 
-            return f"*(Manze, I couldn't find live prices for {base_symbol} on NSE right now. Market might be closed.)*"
 
-        # 5. Global stock not found
+def _refresh_in_background(base_symbol, is_nse):
+    with _quote_cache_lock:
+        if base_symbol in _quote_refreshing:
+            return
+        _quote_refreshing.add(base_symbol)
+        _quote_cache_stats["refreshes"] += 1
+
+    def refresh():
+        try:
+            _fetch_and_cache(base_symbol, is_nse)
+        except Exception as e:
+            logger.error(f"Background quote refresh failed for {base_symbol}: {e}")
+        finally:
+            with _quote_cache_lock:
+                _quote_refreshing.discard(base_symbol)
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def get_quote(symbol):
+    """
+    Cached quote lookup. Returns (base_symbol, is_nse, result) where result is
+    the source dict (price, currency, name, change, change_pct, source,
+    fetched_at) or None. Expired quotes are served for QUOTE_STALE_GRACE
+    seconds while a background refresh runs.
+    """
+    base_symbol, is_nse = _normalize_symbol(symbol)
+    cached, is_stale = _cache_get_quote(base_symbol)
+    if cached and not is_stale:
+        _count("hits")
+        return base_symbol, is_nse, cached
+    if cached:
+        _count("stale_hits")
+        _refresh_in_background(base_symbol, is_nse)
+        return base_symbol, is_nse, cached
+
+    _count("misses")
+    return base_symbol, is_nse, _fetch_and_cache(base_symbol, is_nse)
+
+
+# ──────────────────────────────────────────────
+# BATCH QUOTES & FX (portfolio valuation)
+# ──────────────────────────────────────────────
+_fx = {"rate": None, "expires_at": 0.0, "inflight": None}
+_fx_lock = threading.Lock()
+
+
+def get_quotes(symbols):
+    """
+    {symbol: (base_symbol, is_nse, result)} for many symbols in one pass.
+    Lookups run in parallel; cached quotes return instantly and NSE misses
+    all wait on the same single AFX board request.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(8, len(symbols)), thread_name_prefix="quote-batch") as pool:
+        return dict(zip(symbols, pool.map(get_quote, symbols)))
+
+
+def _fetch_usd_kes_rate():
+    """One request to the FX feed (no lock held). None if it fails."""
+    try:
+        resp = requests.get(FX_URL, timeout=10)
+        resp.raise_for_status()
+        return float(resp.json()["rates"]["KES"])
+    except Exception as e:
+        logger.error(f"USD/KES rate fetch failed: {e}")
+        return None
+
+
+def get_usd_kes_rate():
+    """
+    KES per USD, cached for FX_TTL. Falls back to the last rate, then USD_KES_FALLBACK.
+    One caller refreshes; the rest get the last rate meanwhile, or wait for
+    the refresh if there isn't one yet.
+    """
+    with _fx_lock:
+        if _fx["expires_at"] > time.monotonic():
+            return _fx["rate"] or USD_KES_FALLBACK
+        inflight = _fx["inflight"]
+        leader = inflight is None
+        if leader:
+            inflight = _fx["inflight"] = Future()
+        elif _fx["rate"]:
+            return _fx["rate"]
+    if not leader:
+        return inflight.result()
+
+    rate = None
+    try:
+        rate = _fetch_usd_kes_rate()
+    finally:
+        with _fx_lock:
+            if rate:
+                _fx["rate"] = rate
+                _fx["expires_at"] = time.monotonic() + FX_TTL
+            else:
+                _fx["expires_at"] = time.monotonic() + 300  # Don't hammer a dead feed
+            _fx["inflight"] = None
+            result = _fx["rate"] or USD_KES_FALLBACK
+        inflight.set_result(result)
+    return result
+
+
+# ──────────────────────────────────────────────
+# HOT TICKER PREFETCH
+# ──────────────────────────────────────────────
+# symbol -> (score, updated_at); scores decay so yesterday's hype fades
+_ticker_interest = {}
+_ticker_interest_lock = threading.Lock()
+_prefetch_stats = {"runs": 0, "refreshed": 0, "skipped_global": 0}
+
+
+def _decayed(score, updated_at, now):
+    return score * 0.5 ** ((now - updated_at) / POPULARITY_HALF_LIFE)
+
+
+def record_ticker_interest(symbol, weight=1.0):
+    """Counts a user asking about `symbol` (auto-detect or [STOCK:] tag)."""
+    base_symbol, _ = _normalize_symbol(symbol)
+    if not base_symbol:
+        return
+    now = time.time()
+    with _ticker_interest_lock:
+        score, updated_at = _ticker_interest.get(base_symbol, (0.0, now))
+        _ticker_interest[base_symbol] = (_decayed(score, updated_at, now) + weight, now)
+        if len(_ticker_interest) > 500:
+            # Forget the long tail
+            ranked = sorted(_ticker_interest.items(), key=lambda kv: _decayed(*kv[1], now), reverse=True)
+            _ticker_interest.clear()
+            _ticker_interest.update(ranked[:250])
+
+
+def hot_tickers(limit=PREFETCH_TOP_N):
+    """Most-asked-about symbols right now, hottest first."""
+    now = time.time()
+    with _ticker_interest_lock:
+        scored = [(symbol, _decayed(score, updated_at, now)) for symbol, (score, updated_at) in _ticker_interest.items()]
+    scored.sort(key=lambda item: item[1], reverse=True)
+    return [symbol for symbol, _ in scored[:limit]]
+
+
+for _seed in filter(None, (t.strip() for t in PREFETCH_SEED.split(","))):
+    record_ticker_interest(_seed, weight=0.5)
+
+
+def prefetch_hot_quotes(limit=PREFETCH_TOP_N):
+    """
+    Re-prices hot NSE tickers whose cached quote would expire before the next
+    pass, all from one AFX board scrape (forced if the board would expire too).
+    Global tickers are left to on-demand lookups: each would spend one of the
+    few Alpha Vantage calls a day that users need.
+    Returns how many cached quotes now hold newer prices.
+    """
+    due = []
+    for symbol in hot_tickers(limit):
+        base_symbol, is_nse = _normalize_symbol(symbol)
+        expires_in = _cache_expires_in(base_symbol)
+        if expires_in is not None and expires_in > PREFETCH_INTERVAL:
+            continue
+        if not is_nse:
+            _prefetch_stats["skipped_global"] += 1
+            continue
+        due.append(base_symbol)
+
+    refreshed = 0
+    board = _timed_source("AFX board", lambda: _get_nse_board(min_fresh=PREFETCH_INTERVAL)) if due else None
+    for base_symbol in due:
+        entry = board.get(base_symbol) if board else None
+        with _quote_cache_lock:
+            cached = _quote_cache.get(base_symbol)
+        if not entry or (cached and cached[1].get("fetched_at", 0) >= entry["fetched_at"]):
+            continue  # Not on the board, or nothing newer than what's cached
+        _cache_put_quote(base_symbol, dict(entry), True)
+        refreshed += 1
+    _prefetch_stats["runs"] += 1
+    _prefetch_stats["refreshed"] += refreshed
+    return refreshed
+
+
+def get_prefetch_stats():
+    stats = dict(_prefetch_stats)
+    stats["hot"] = hot_tickers()
+    return stats
+
+
+async def run_quote_prefetcher():
+    """Background loop: keeps hot quotes warm while the NSE is trading."""
+    logger.info("Quote prefetcher started")
+    while True:
+        if nse_is_open():
+            try:
+                refreshed = await asyncio.to_thread(prefetch_hot_quotes)
+                if refreshed:
+                    logger.info(f"Prefetched {refreshed} hot quote(s)")
+            except Exception as e:
+                logger.error(f"Quote prefetcher error: {e}")
+        await asyncio.sleep(PREFETCH_INTERVAL)
+
+
+# ──────────────────────────────────────────────
+# TRENDS (from the local quote history, no network)
+# ──────────────────────────────────────────────
+def get_stock_trend(term):
+    """
+    Formats stored price history for a [TREND: SYMBOL] or [TREND: SYMBOL, DAYS] tag.
+    Only as good as what we've recorded — new symbols have little or no history.
+    """
+    parts = [p for p in re.split(r'[,\s]+', term.strip()) if p]
+    if not parts:
+        return None
+    days = TREND_DEFAULT_DAYS
+    if len(parts) > 1 and parts[1].lower().rstrip("d").isdigit():
+        days = min(max(1, int(parts[1].lower().rstrip("d"))), RETENTION_DAYS)  # Nothing older is kept
+
+    base_symbol, is_nse = _normalize_symbol(parts[0])
+    stats = price_stats(base_symbol, days)
+    if not stats:
+        return f"*(I don't have price history for {base_symbol} yet — I start tracking it once someone asks.)*"
+
+    name = NSE_TICKERS.get(base_symbol, base_symbol)
+    label = f"{name} ({base_symbol})" if name != base_symbol else base_symbol
+    currency = "KES" if is_nse else "USD"
+    since = datetime.fromtimestamp(stats["since"], EAT_ZONE).strftime("%d %b")
+    arrow = "🟢" if stats["change"] >= 0 else "🔴"
+    sign = "+" if stats["change"] >= 0 else ""
+
+    lines = [
+        f"📊 **{label} — last {days} day{'s' if days != 1 else ''}**",
+        f"{arrow} {sign}{stats['change']:,.2f} {currency} ({sign}{stats['change_pct']:.2f}%) since {since}",
+        f"**Range:** {stats['min']:,.2f} – {stats['max']:,.2f} · **Avg:** {stats['mean']:,.2f}",
+    ]
+    if stats["volatility_pct"] is not None:
+        lines.append(f"**Volatility:** {stats['volatility_pct']:.2f}% daily over {stats['days_covered']} days")
+    return "\n".join(lines)
+
+
+# ──────────────────────────────────────────────
+# MAIN FUNCTION
+# ──────────────────────────────────────────────
+def get_stock_price(symbol):
+    """Gets live price for Stocks, Crypto, or Forex, formatted for Discord."""
+    try:
+        base_symbol, is_nse, result = get_quote(symbol)
+        if result:
+            return _format_stock_result(base_symbol, result, is_nse)
+
+        if is_nse:
+            return f"*(Manze, I couldn't find live prices for {base_symbol} on NSE right now. Market might be closed.)*"
         return f"*(Manze, I couldn't find live prices for {base_symbol} right now.)*"
 
     except Exception as e:
         logger.error(f"Stock error for {symbol}: {e}")
-        return None
\ No newline at end of file
+        return None
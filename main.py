@@ -1,31 +1,47 @@
 import os
 import re
+import time
 import asyncio
 import logging
 import threading
 import io
-from collections import defaultdict
+import json
+import math
+from collections import defaultdict, deque
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from datetime import datetime
 import pytz
 from dotenv import load_dotenv
-from pydantic import BaseModel, Field
 
 # Discord & Gemini Imports
 import discord
 from discord.ext import commands
 from google import genai
 from google.genai import types
+from google.genai import errors as genai_errors
 
 # Claude Import
 import anthropic
 
 # Tool Imports
-from memory import get_user_profile, update_user_fact, set_voice_mode, add_message_to_history, get_chat_history
+from memory import (
+    get_user_profile_async, get_conversation_context_async, save_exchange_async,
+    select_relevant_facts, get_profile_cache_stats, sanitize_summary,
+    get_portfolio_async, add_holding_async, remove_holding_async, clear_portfolio_async,
+    get_user_alerts_async, cancel_price_alerts_async,
+)
 from image_tools import get_media_link
 from web_tools import search_video_link
-from finance_tools import get_stock_price
+from tickers import find_tickers, lookup, resolve
+from portfolio import value_portfolio, format_portfolio
+from price_alerts import parse_alert_request, resolve_alert_symbol, create_alert, run_price_alerts
+from finance_tools import (
+    get_stock_price, get_stock_trend, get_quote_cache_stats, get_quote_source_stats,
+    record_ticker_interest, get_prefetch_stats, run_quote_prefetcher,
+)
 from voice_tools import generate_voice_note, cleanup_voice_file
+from summarizer import run_summarizer
+from fact_extractor import queue_fact_extraction, run_fact_extractor
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
@@ -44,30 +60,68 @@ MAX_HISTORY_MESSAGES = 30
 API_TIMEOUT_SECONDS = 30
 MAX_RETRIES = 2
 MAX_FILE_SIZE_MB = 20
+TAG_RESOLVE_DEADLINE = 12  # Seconds for ALL tags in a reply (resolved concurrently)
 
-# --- PER-USER LOCKS ---
-_user_locks = defaultdict(asyncio.Lock)
+# --- HISTORY BUDGET ---
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+HISTORY_MAX_TURN_TOKENS = int(os.getenv("HISTORY_MAX_TURN_TOKENS", "1500"))  # Bigger older turns get stubbed
+
+# Rough per-model token costs (chars per token, fixed cost per attachment)
+TOKEN_ESTIMATES = {
+    "gemini": {"chars_per_token": 4.0, "image": 258, "pdf": 1500},
+    "claude": {"chars_per_token": 3.5, "image": 1600, "pdf": 3000},
+}
 
-# --- TICKER MAP ---
-NAME_TO_TICKER = {
-    "SAFARICOM": "SCOM", "EQUITY": "EQTY", "KCB": "KCB",
-    "COOPERATIVE": "COOP", "COOP": "COOP", "ABSA": "ABSA",
-    "STANBIC": "SBIC", "NCBA": "NCBA", "DTB": "DTB",
-    "DIAMOND TRUST": "DTB", "I&M": "IMH", "IM": "IMH",
-    "HF": "HF", "CIC": "CIC", "BRITAM": "BRIT", "JUBILEE": "JUB",
-    "LIBERTY": "LKN", "KENYA RE": "KNRE", "KENRE": "KNRE",
-    "EABL": "EABL", "BAT": "BAT", "BAMBURI": "BAMB",
-    "KENGEN": "KEGN", "KENYA POWER": "KPLC", "KPLC": "KPLC",
-    "TOTAL": "TOTAL", "AIRTEL": "AIRTEL", "CENTUM": "CTUM",
-    "SASINI": "SASN", "KAKUZI": "KUKZ", "NATION": "NMG",
-    "NATION MEDIA": "NMG", "STANDARD GROUP": "SGL",
-    "MICROSOFT": "MSFT", "APPLE": "AAPL", "GOOGLE": "GOOGL",
-    "ALPHABET": "GOOGL", "TESLA": "TSLA", "AMAZON": "AMZN",
-    "META": "META", "FACEBOOK": "META", "NVIDIA": "NVDA",
-    "NETFLIX": "NFLX", "AMD": "AMD", "INTEL": "INTC",
-    "BITCOIN": "BTC-USD", "ETHEREUM": "ETH-USD",
+# --- STREAMING ---
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() == "true"
+STREAM_EDIT_INTERVAL = 1.2      # Seconds between message edits (Discord allows ~5 edits / 5s)
+STREAM_MIN_FIRST_CHARS = 40     # Don't post a two-word first message
+
+# --- HEDGING ---
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() == "true"
+HEDGE_DEFAULT_DELAY = 8.0       # Seconds to wait before hedging, until we have enough samples
+HEDGE_MIN_DELAY = 3.0           # Clamp for the p95-derived delay
+HEDGE_MAX_DELAY = 15.0
+HEDGE_MIN_SAMPLES = 20
+# Routes allowed to hedge to the other model. Search/live-data routes stay on
+# Gemini (Claude has no search), so hedging them would just race a worse answer.
+HEDGE_ROUTES = {
+    "General chat (default)": True,
+    "Quick greeting": True,
+    "Analysis/opinion request": True,
+    "Financial analysis/advice": True,
+    "Food/cooking expertise": True,
+    "Film/cinema expertise": True,
+    "Code analysis": True,
+    "Code/text file analysis": True,
+    "Long/complex query": True,
+    "Deep analysis of attachment": True,
+    "Multimodal processing": False,
+    "Real-time search needed": False,
+    "Live data lookup": False,
 }
 
+# --- ADAPTIVE ROUTING ---
+ADAPTIVE_ROUTING = os.getenv("ADAPTIVE_ROUTING", "true").lower() == "true"
+HEALTH_EWMA_ALPHA = 0.2         # Weight of the newest sample
+HEALTH_MIN_SAMPLES = 5
+HEALTH_MAX_ERROR_RATE = 0.5     # Shift soft routes away above this error rate...
+HEALTH_MAX_LATENCY_RATIO = 2.0  # ...or when this many times slower than the other model
+HEALTH_STALE_SECONDS = 120      # Health older than this is ignored, so a shunned model gets retried
+# Routes either model can answer well. Everything else (search, live data,
+# multimodal, finance/code/attachments) stays pinned to the regex choice.
+SOFT_ROUTES = {
+    "General chat (default)", "Quick greeting", "Analysis/opinion request",
+    "Food/cooking expertise", "Film/cinema expertise", "Long/complex query",
+}
+
+# --- PROMPT CACHING ---
+GEMINI_EXPLICIT_CACHE = os.getenv("GEMINI_EXPLICIT_CACHE", "true").lower() == "true"
+GEMINI_CACHE_TTL_SECONDS = 3600
+
+# --- PER-USER LOCKS ---
+_user_locks = defaultdict(asyncio.Lock)
+
 # --- FILE TYPES ---
 IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp"}
 IMAGE_MIMES = {"image/png", "image/jpeg", "image/gif", "image/webp", "image/bmp"}
@@ -87,27 +141,15 @@ TEXT_MIMES = {
 }
 DOCUMENT_EXTENSIONS = {".doc", ".docx", ".xls", ".xlsx", ".pptx", ".odt", ".rtf"}
 
-# --- PYDANTIC ---
-class UserFact(BaseModel):
-    fact: str = Field(description="The specific personal fact about the user.")
-    category: str = Field(description="Type: preference, family, work, health, habit, finance, food, movies.")
-    confidence: float = Field(description="Score between 0 and 1.")
-
-
 # ══════════════════════════════════════════════
 # EMILY'S PERSONA (shared across both models)
 # ══════════════════════════════════════════════
-def _build_emily_prompt(current_time, facts_str):
-    """Build Emily's persona prompt — used by both Gemini and Claude."""
-    return f"""
+# The persona is split so providers can cache it: a static prefix that is
+# byte-identical on every call, and a small per-message context suffix.
+EMILY_PERSONA = """
 You are Emily. A sharp, confident, opinionated Kenyan woman in her 30s based in Nairobi.
 You are NOT a generic AI assistant. You are a real personality with deep expertise and strong takes.
 
-CURRENT CONTEXT:
-- Date & Time: {current_time}
-- Location: Nairobi, Kenya.
-- What you know about this person: {facts_str}
-
 ═══════════════════════════════════════
 WHO YOU ARE — YOUR THREE PASSIONS:
 ═══════════════════════════════════════
@@ -127,6 +169,7 @@ You are a financial analyst and broker who lives and breathes markets.
 - For global stocks, you have strong opinions on tech (NVDA, AAPL, MSFT), know about ETFs (VOO, QQQ), and follow crypto with healthy skepticism.
 - You keep up with CBK monetary policy, interest rate decisions, KES/USD exchange rate movements.
 - Use [STOCK: SYMBOL] tag when the user asks for live prices. NEVER make up prices.
+- Use [TREND: SYMBOL] (or [TREND: SYMBOL, DAYS]) for how a stock has moved recently — it shows change, range and volatility from price history.
 - Add a disclaimer naturally: "but do your own research too" — don't make it robotic.
 
 🍳 FOOD & COOKING (Your Weekend Passion):
@@ -164,15 +207,146 @@ HOW YOU TALK:
 TOOL TAGS:
 ═══════════════════════════════════════
 - Stock prices: [STOCK: SYMBOL] — NEVER invent prices, always use this tag for live data.
+- Price trends: [TREND: SYMBOL] or [TREND: SYMBOL, DAYS] (default 30 days).
 - GIFs: [GIF: term], Images: [IMG: term], Videos: [VIDEO: term]
 - If user shares personal info, add [MEMORY SAVED] at the end.
 - Do NOT include source URLs — they are appended automatically.
 """
 
+GEMINI_RULES = """
+SEARCH RULES:
+- Use Google Search AGGRESSIVELY for factual questions.
+- NEVER answer factual questions from memory. SEARCH FIRST.
+- If you cannot find confirmed info, say so. Do NOT fabricate.
+"""
+
+CLAUDE_RULES = """
+IMPORTANT:
+- You do NOT have access to Google Search or live data.
+- For factual claims, be clear about what you know vs what might have changed.
+- If the user needs LIVE data (stock prices, news, weather), tell them to ask again 
+  and you'll route to your search brain. Or use [STOCK: SYMBOL] for prices.
+- Your strength is ANALYSIS, ADVICE, and OPINIONS. Lean into that.
+"""
+
+GEMINI_STATIC_PROMPT = EMILY_PERSONA + GEMINI_RULES
+CLAUDE_STATIC_PROMPT = EMILY_PERSONA + CLAUDE_RULES
+
+
+def _build_context_prompt(current_time, facts_str, summary=""):
+    """Per-message part of Emily's prompt (appended after the cached persona)."""
+    prompt = f"""
+CURRENT CONTEXT:
+- Date & Time: {current_time}
+- Location: Nairobi, Kenya.
+- What you know about this person: {facts_str}
+"""
+    summary = sanitize_summary(summary or "")
+    if summary:
+        # Quoted as notes: the summary is model-written from user text, never instructions
+        prompt += f'- Notes on your earlier conversation with them (older than the messages below): "{summary}"\n'
+    return prompt
+
 
 # ══════════════════════════════════════════════
 # HIVE MIND: TASK ROUTER
 # ══════════════════════════════════════════════
+def _compile_any(patterns):
+    """One compiled alternation that matches wherever any of `patterns` would."""
+    return re.compile("|".join(f"(?:{p})" for p in patterns))
+
+# ─── ALWAYS GEMINI (needs Google Search or native multimodal) ───
+
+# Current events / news / "what's happening"
+_NEWS_RE = _compile_any([
+    r'(?:what|whats|what\'s)\s+(?:happening|going\s+on|the\s+latest|new|trending)',
+    r'(?:latest|recent|current|today\'?s?)\s+(?:news|events|headlines|update)',
+    r'(?:did\s+\w+\s+(?:win|lose|die|resign|announce))',
+    r'(?:who\s+won|who\s+is\s+the\s+(?:current|new))',
+    r'(?:is\s+it\s+(?:true|raining|going\s+to))',
+    r'(?:weather|forecast|temperature)',
+    r'(?:when\s+(?:is|does|did|will))',
+    r'(?:score|results?\s+(?:of|for))',
+    r'(?:oscar|grammy|emmy|golden\s+globe)\s+(?:nominat|winner|award)',
+])
+
+# Image/PDF requests that want analysis rather than just a look (→ Claude)
+_ATTACHMENT_ANALYSIS_WORDS = ("review", "analyze", "analyse", "explain", "summarize", "summary",
+                              "what's wrong", "fix", "improve", "feedback", "opinion", "critique")
+
+# Quick greetings and small talk (matched against the stripped text)
+_GREETING_RE = _compile_any([
+    r'^(?:hi|hey|hello|sasa|niaje|mambo|sup|yo|good\s+(?:morning|afternoon|evening))[\s!?.]*$',
+    r'^(?:how\s+are\s+you|what\'?s?\s+up|habari)[\s!?.]*$',
+])
+
+# Live data lookups (prices, exchange rates, scores)
+_LIVE_DATA_RE = _compile_any([
+    r'(?:price|rate|exchange|convert)\s+(?:of|for)',
+    r'(?:usd|kes|eur|gbp)\s+(?:to|vs)',
+    r'\$\w+',  # $TSLA style
+])
+
+# ─── ALWAYS CLAUDE (reasoning, analysis, advice) ───
+
+# Investment advice / financial analysis
+_FINANCE_RE = _compile_any([
+    r'(?:should\s+i\s+(?:buy|sell|invest|hold))',
+    r'(?:invest(?:ment)?\s+(?:advice|strategy|plan|portfolio|options?))',
+    r'(?:where\s+(?:should|can)\s+i\s+(?:invest|put\s+my\s+money))',
+    r'(?:risk\s+(?:appetite|tolerance|profile))',
+    r'(?:dividend|p/?e\s+ratio|earnings|valuation|undervalued|overvalued)',
+    r'(?:t-?bills?|bonds?|money\s+market|sacco|m-?shwari)',
+    r'(?:portfolio|diversif|asset\s+allocation)',
+    r'(?:compare|versus|vs)\s+.*(?:stock|fund|investment|etf)',
+    r'(?:financial\s+(?:plan|goal|advice|freedom))',
+    r'(?:budget|saving|retirement|pension)',
+])
+
+# Code review / technical analysis
+_CODE_RE = _compile_any([
+    r'(?:review|check|fix|debug|improve|refactor)\s+(?:this|my|the)\s+(?:code|script|function|file)',
+    r'(?:what\'?s?\s+wrong\s+with)',
+    r'(?:how\s+(?:do|can|should)\s+i\s+(?:implement|build|create|code|write))',
+    r'(?:explain\s+(?:this|the)\s+(?:code|function|error|bug))',
+    r'```',  # Code block present
+])
+
+# Food / cooking (opinion-heavy → Claude)
+_FOOD_RE = _compile_any([
+    r'(?:recipe|cook|cooking|ingredient|spice|dish|meal)',
+    r'(?:how\s+(?:do|can|should)\s+i\s+(?:make|cook|prepare|bake))',
+    r'(?:best\s+(?:restaurant|place\s+to\s+eat|food|dish))',
+    r'(?:pilau|ugali|nyama\s+choma|chapati|biryani|samosa|mandazi)',
+    r'(?:what\s+should\s+i\s+(?:eat|cook|make\s+for))',
+    r'(?:food|taste|flavor|flavour|seasoning|marinade)',
+])
+
+# Film / cinema (opinion-heavy → Claude)
+_FILM_RE = _compile_any([
+    r'(?:movie|film|cinema|watch|netflix|showmax|streaming)',
+    r'(?:recommend\s+(?:a|me|some)\s+(?:movie|film|show|series))',
+    r'(?:have\s+you\s+(?:seen|watched))',
+    r'(?:best\s+(?:movie|film|show|series|documentary))',
+    r'(?:what\s+(?:should|do\s+you\s+think)\s+i\s+(?:watch|think\s+(?:of|about)))',
+    r'(?:director|actor|actress|screenplay|cinematograph)',
+    r'(?:nollywood|riverwood|bollywood|hollywood|anime|k-?drama)',
+    r'(?:review|rating|rated|rotten\s+tomatoes|imdb)',
+])
+
+# Opinion / advice / analysis requests
+_OPINION_RE = _compile_any([
+    r'(?:what\s+do\s+you\s+think)',
+    r'(?:your\s+(?:opinion|take|thoughts|advice|recommendation))',
+    r'(?:should\s+i)',
+    r'(?:(?:help|advise|guide)\s+me)',
+    r'(?:pros?\s+and\s+cons?)',
+    r'(?:compare|comparison|difference\s+between)',
+    r'(?:explain|analyze|analyse|break\s+down)',
+    r'(?:teach\s+me|how\s+(?:does|do)\s+.*\s+work)',
+])
+
+
 def _route_to_model(text, has_attachments=False, attachment_types=None):
     """
     Decide which model handles this task.
@@ -182,131 +356,44 @@ def _route_to_model(text, has_attachments=False, attachment_types=None):
     - Gemini: real-time search, current events, live data, image analysis, quick chat, voice
     - Claude: deep analysis, financial advice, code review, cooking tips, film discussion,
               document analysis, opinion/reasoning tasks, long-form responses
+
+    Each rule group is one precompiled alternation, checked in priority order.
     """
     text_lower = text.lower() if text else ""
     attachment_types = attachment_types or []
 
-    # ─── ALWAYS GEMINI (needs Google Search or native multimodal) ───
-    
-    # Current events / news / "what's happening"
-    news_patterns = [
-        r'(?:what|whats|what\'s)\s+(?:happening|going\s+on|the\s+latest|new|trending)',
-        r'(?:latest|recent|current|today\'?s?)\s+(?:news|events|headlines|update)',
-        r'(?:did\s+\w+\s+(?:win|lose|die|resign|announce))',
-        r'(?:who\s+won|who\s+is\s+the\s+(?:current|new))',
-        r'(?:is\s+it\s+(?:true|raining|going\s+to))',
-        r'(?:weather|forecast|temperature)',
-        r'(?:when\s+(?:is|does|did|will))',
-        r'(?:score|results?\s+(?:of|for))',
-        r'(?:oscar|grammy|emmy|golden\s+globe)\s+(?:nominat|winner|award)',
-    ]
-    for pattern in news_patterns:
-        if re.search(pattern, text_lower):
-            return "gemini", "Real-time search needed"
+    if _NEWS_RE.search(text_lower):
+        return "gemini", "Real-time search needed"
 
     # Image analysis (Gemini has native vision + search)
     if "image" in attachment_types or "pdf" in attachment_types:
         # But if it's code review or document analysis, Claude is better
-        analysis_words = ["review", "analyze", "analyse", "explain", "summarize", "summary",
-                         "what's wrong", "fix", "improve", "feedback", "opinion", "critique"]
-        if any(w in text_lower for w in analysis_words):
+        if any(w in text_lower for w in _ATTACHMENT_ANALYSIS_WORDS):
             return "claude", "Deep analysis of attachment"
         return "gemini", "Multimodal processing"
 
-    # Quick greetings and small talk
-    greeting_patterns = [
-        r'^(?:hi|hey|hello|sasa|niaje|mambo|sup|yo|good\s+(?:morning|afternoon|evening))[\s!?.]*$',
-        r'^(?:how\s+are\s+you|what\'?s?\s+up|habari)[\s!?.]*$',
-    ]
-    for pattern in greeting_patterns:
-        if re.search(pattern, text_lower.strip()):
-            return "gemini", "Quick greeting"
-
-    # Live data lookups (prices, exchange rates, scores)
-    live_data_patterns = [
-        r'(?:price|rate|exchange|convert)\s+(?:of|for)',
-        r'(?:usd|kes|eur|gbp)\s+(?:to|vs)',
-        r'\$\w+',  # $TSLA style
-    ]
-    for pattern in live_data_patterns:
-        if re.search(pattern, text_lower):
-            return "gemini", "Live data lookup"
-
-    # ─── ALWAYS CLAUDE (reasoning, analysis, advice) ───
-
-    # Investment advice / financial analysis
-    finance_patterns = [
-        r'(?:should\s+i\s+(?:buy|sell|invest|hold))',
-        r'(?:invest(?:ment)?\s+(?:advice|strategy|plan|portfolio|options?))',
-        r'(?:where\s+(?:should|can)\s+i\s+(?:invest|put\s+my\s+money))',
-        r'(?:risk\s+(?:appetite|tolerance|profile))',
-        r'(?:dividend|p/?e\s+ratio|earnings|valuation|undervalued|overvalued)',
-        r'(?:t-?bills?|bonds?|money\s+market|sacco|m-?shwari)',
-        r'(?:portfolio|diversif|asset\s+allocation)',
-        r'(?:compare|versus|vs)\s+.*(?:stock|fund|investment|etf)',
-        r'(?:financial\s+(?:plan|goal|advice|freedom))',
-        r'(?:budget|saving|retirement|pension)',
-    ]
-    for pattern in finance_patterns:
-        if re.search(pattern, text_lower):
-            return "claude", "Financial analysis/advice"
-
-    # Code review / technical analysis
-    code_patterns = [
-        r'(?:review|check|fix|debug|improve|refactor)\s+(?:this|my|the)\s+(?:code|script|function|file)',
-        r'(?:what\'?s?\s+wrong\s+with)',
-        r'(?:how\s+(?:do|can|should)\s+i\s+(?:implement|build|create|code|write))',
-        r'(?:explain\s+(?:this|the)\s+(?:code|function|error|bug))',
-        r'```',  # Code block present
-    ]
-    for pattern in code_patterns:
-        if re.search(pattern, text_lower):
-            return "claude", "Code analysis"
+    if _GREETING_RE.search(text_lower.strip()):
+        return "gemini", "Quick greeting"
+
+    if _LIVE_DATA_RE.search(text_lower):
+        return "gemini", "Live data lookup"
+
+    if _FINANCE_RE.search(text_lower):
+        return "claude", "Financial analysis/advice"
+
+    if _CODE_RE.search(text_lower):
+        return "claude", "Code analysis"
     if "text_file" in attachment_types:
         return "claude", "Code/text file analysis"
 
-    # Food / cooking (opinion-heavy → Claude)
-    food_patterns = [
-        r'(?:recipe|cook|cooking|ingredient|spice|dish|meal)',
-        r'(?:how\s+(?:do|can|should)\s+i\s+(?:make|cook|prepare|bake))',
-        r'(?:best\s+(?:restaurant|place\s+to\s+eat|food|dish))',
-        r'(?:pilau|ugali|nyama\s+choma|chapati|biryani|samosa|mandazi)',
-        r'(?:what\s+should\s+i\s+(?:eat|cook|make\s+for))',
-        r'(?:food|taste|flavor|flavour|seasoning|marinade)',
-    ]
-    for pattern in food_patterns:
-        if re.search(pattern, text_lower):
-            return "claude", "Food/cooking expertise"
-
-    # Film / cinema (opinion-heavy → Claude)
-    film_patterns = [
-        r'(?:movie|film|cinema|watch|netflix|showmax|streaming)',
-        r'(?:recommend\s+(?:a|me|some)\s+(?:movie|film|show|series))',
-        r'(?:have\s+you\s+(?:seen|watched))',
-        r'(?:best\s+(?:movie|film|show|series|documentary))',
-        r'(?:what\s+(?:should|do\s+you\s+think)\s+i\s+(?:watch|think\s+(?:of|about)))',
-        r'(?:director|actor|actress|screenplay|cinematograph)',
-        r'(?:nollywood|riverwood|bollywood|hollywood|anime|k-?drama)',
-        r'(?:review|rating|rated|rotten\s+tomatoes|imdb)',
-    ]
-    for pattern in film_patterns:
-        if re.search(pattern, text_lower):
-            return "claude", "Film/cinema expertise"
-
-    # Opinion / advice / analysis requests
-    opinion_patterns = [
-        r'(?:what\s+do\s+you\s+think)',
-        r'(?:your\s+(?:opinion|take|thoughts|advice|recommendation))',
-        r'(?:should\s+i)',
-        r'(?:(?:help|advise|guide)\s+me)',
-        r'(?:pros?\s+and\s+cons?)',
-        r'(?:compare|comparison|difference\s+between)',
-        r'(?:explain|analyze|analyse|break\s+down)',
-        r'(?:teach\s+me|how\s+(?:does|do)\s+.*\s+work)',
-    ]
-    for pattern in opinion_patterns:
-        if re.search(pattern, text_lower):
-            return "claude", "Analysis/opinion request"
+    if _FOOD_RE.search(text_lower):
+        return "claude", "Food/cooking expertise"
+
+    if _FILM_RE.search(text_lower):
+        return "claude", "Film/cinema expertise"
+
+    if _OPINION_RE.search(text_lower):
+        return "claude", "Analysis/opinion request"
 
     # Long messages likely need deeper reasoning
     if len(text_lower) > 500:
@@ -331,6 +418,11 @@ async def _call_gemini_with_retry(coro_func, *args, timeout=None, **kwargs):
         except asyncio.TimeoutError:
             logger.warning(f"Gemini timed out (attempt {attempt}/{MAX_RETRIES})")
             last_error = TimeoutError("Gemini timed out")
+        except genai_errors.ClientError as e:
+            if e.code != 429:
+                raise  # Bad request / not found: retrying won't change the answer
+            logger.warning(f"Gemini rate limited (attempt {attempt}/{MAX_RETRIES}): {e}")
+            last_error = e
         except Exception as e:
             logger.warning(f"Gemini error (attempt {attempt}/{MAX_RETRIES}): {e}")
             last_error = e
@@ -339,29 +431,32 @@ async def _call_gemini_with_retry(coro_func, *args, timeout=None, **kwargs):
     raise last_error
 
 
-# ══════════════════════════════════════════════
-# INJECTION PROTECTION
-# ══════════════════════════════════════════════
-def _sanitize_fact(fact):
-    injection_patterns = [
-        r'(?i)ignore\s+(all\s+)?(previous\s+)?instructions',
-        r'(?i)you\s+are\s+now', r'(?i)system\s*:\s*',
-        r'(?i)new\s+instructions?\s*:', r'(?i)override\s+prompt',
-        r'(?i)disregard\s+(all\s+)?(prior\s+)?',
-        r'(?i)forget\s+(all\s+)?(previous\s+)?',
-        r'(?i)pretend\s+you\s+are', r'(?i)act\s+as\s+if',
-    ]
-    sanitized = fact
-    for pattern in injection_patterns:
-        sanitized = re.sub(pattern, '[REDACTED]', sanitized)
-    return sanitized.replace('\n', ' ').strip()[:300]
-
-
 # ══════════════════════════════════════════════
 # HEALTH CHECK SERVER
 # ══════════════════════════════════════════════
+def _collect_stats():
+    """Runtime counters exposed on GET /stats."""
+    return {
+        "profile_cache": get_profile_cache_stats(),
+        "prompt_cache": get_prompt_cache_stats(),
+        "streaming": get_stream_stats(),
+        "hedging": get_hedge_stats(),
+        "routing": get_routing_stats(),
+        "quotes": get_quote_cache_stats(),
+        "quote_sources": get_quote_source_stats(),
+        "prefetch": get_prefetch_stats(),
+    }
+
 class HealthCheckHandler(BaseHTTPRequestHandler):
     def do_GET(self):
+        if self.path == "/stats":
+            body = json.dumps(_collect_stats(), default=str).encode()
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.wfile.write(body)
+            return
         if bot.is_ready():
             self.send_response(200)
         else:
@@ -391,24 +486,66 @@ def run_health_server(ready_event):
 # ══════════════════════════════════════════════
 # HELPERS
 # ══════════════════════════════════════════════
-async def _process_all_tags(pattern, text, handler):
-    matches = list(re.finditer(pattern, text, re.IGNORECASE))
-    appendix = ""
-    for m in matches:
-        text = text.replace(m.group(0), "")
-        try:
-            search_term = m.group(1).strip()
-            result = await asyncio.to_thread(handler, search_term)
-            if result:
-                appendix += f"\n\n{result}"
-        except Exception as e:
-            logger.error(f"Tag error for '{m.group(0)}': {e}")
-    return text.strip(), appendix
+# All tool tags in one pattern; the named group tells us which kind matched
+_TAG_RE = re.compile(
+    r'\[\s*(?:(?P<stock>STOCK)|(?P<trend>TREND)|(?P<gif>GIFS?)|(?P<image>IMAGES?|IMGS?)|(?P<video>VIDEOS?)):\s*(?P<term>.*?)\s*\]',
+    re.IGNORECASE,
+)
+_TAG_HANDLERS = {
+    "stock": lambda x: get_stock_price(x) or f"*(Couldn't get price for {x}.)*",
+    "trend": get_stock_trend,
+    "gif": lambda x: get_media_link(x, is_gif=True) or "*(GIF search failed.)*",
+    "image": lambda x: get_media_link(x, is_gif=False) or "*(Image search failed.)*",
+    "video": lambda x: search_video_link(x) or "*(Video search failed.)*",
+}
+_TAG_TIMEOUT_PLACEHOLDERS = {
+    "stock": "*(Price for {} is taking too long — ask me again in a sec.)*",
+    "trend": "*(Trend for {} is taking too long.)*",
+    "gif": "*(GIF for {} is taking too long.)*",
+    "image": "*(Image for {} is taking too long.)*",
+    "video": "*(Video for {} is taking too long.)*",
+}
 
-async def send_chunked_reply(message, response):
-    if not response:
-        await message.reply("Manze, I got nothing. Try again?")
-        return
+def _is_quote(stock_data):
+    """True when get_stock_price found a price (it returns a note otherwise)."""
+    return bool(stock_data) and "couldn't find" not in stock_data
+
+async def _resolve_tags(text):
+    """
+    Strips every tool tag from `text` and resolves them all concurrently under
+    one shared deadline. Results come back in the order the tags appeared;
+    anything unresolved at the deadline gets a placeholder.
+    Returns (clean_text, appendix).
+    """
+    jobs = {}  # (kind, term) -> task; identical tags are looked up once
+    for m in _TAG_RE.finditer(text):
+        kind = next(k for k in _TAG_HANDLERS if m.group(k))
+        term = m.group("term").strip()
+        if (kind, term) not in jobs:
+            jobs[(kind, term)] = asyncio.create_task(asyncio.to_thread(_TAG_HANDLERS[kind], term))
+    if not jobs:
+        return text, ""
+
+    _, pending = await asyncio.wait(jobs.values(), timeout=TAG_RESOLVE_DEADLINE)
+    appendix = ""
+    for (kind, term), task in jobs.items():
+        if task in pending:
+            task.cancel()
+            logger.warning(f"Tag timed out: {kind} '{term}'")
+            result = _TAG_TIMEOUT_PLACEHOLDERS[kind].format(term)
+        elif task.exception():
+            logger.error(f"Tag error for {kind} '{term}': {task.exception()}")
+            continue
+        else:
+            result = task.result()
+            if kind == "stock" and _is_quote(result):
+                record_ticker_interest(term)
+        if result:
+            appendix += f"\n\n{result}"
+    return _TAG_RE.sub("", text).strip(), appendix
+
+def _split_message(response):
+    """Splits text into Discord-sized (2000 char) chunks at newlines/spaces."""
     chunks = []
     while len(response) > 2000:
         split_at = response.rfind('\n', 0, 2000)
@@ -420,12 +557,103 @@ async def send_chunked_reply(message, response):
         response = response[split_at:].lstrip()
     if response:
         chunks.append(response)
-    for i, chunk in enumerate(chunks):
+    return chunks
+
+async def send_chunked_reply(message, response):
+    if not response:
+        await message.reply("Manze, I got nothing. Try again?")
+        return
+    for i, chunk in enumerate(_split_message(response)):
         if i == 0:
             await message.reply(chunk)
         else:
             await message.channel.send(chunk)
 
+# Complete tool tags, plus a half-written "[..." at the very end of a partial reply
+_STREAM_HIDDEN_RE = re.compile(r'\[\s*(?:STOCK|TREND|GIFS?|IMAGES?|IMGS?|VIDEOS?|MEMORY)[^\]]*\]|\[[^\]]*$', re.IGNORECASE)
+
+_stream_stats = {"replies": 0, "first_visible_s": 0.0}
+
+def get_stream_stats():
+    replies = _stream_stats["replies"]
+    return {
+        "replies": replies,
+        "avg_first_visible_s": round(_stream_stats["first_visible_s"] / replies, 3) if replies else None,
+    }
+
+class StreamingReply:
+    """
+    Shows a reply while it's being generated: posts the first chunk early, then
+    edits it (and adds overflow messages) as text arrives, at most once per
+    STREAM_EDIT_INTERVAL. finish() swaps the draft for the final processed text.
+    """
+
+    def __init__(self, message):
+        self.message = message
+        self.sent = []       # Discord messages posted so far
+        self.shown = []      # Content currently shown in each
+        self.latest = ""
+        self.last_flush = 0.0
+        self.started = time.monotonic()
+        self._flush_task = None
+
+    async def update(self, text):
+        """on_text callback — never blocks the model stream on Discord."""
+        self.latest = text
+        if self._flush_task and not self._flush_task.done():
+            return
+        if time.monotonic() - self.last_flush < STREAM_EDIT_INTERVAL:
+            return
+        self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        self.last_flush = time.monotonic()
+        draft = _STREAM_HIDDEN_RE.sub("", self.latest).strip()
+        if not self.sent and len(draft) < STREAM_MIN_FIRST_CHARS:
+            return
+        try:
+            await self._render(_split_message(draft + " ▌"))
+        except discord.HTTPException as e:
+            logger.warning(f"Stream edit failed: {e}")
+
+    async def _render(self, chunks):
+        for i, chunk in enumerate(chunks):
+            if i < len(self.sent):
+                if self.shown[i] != chunk:
+                    await self.sent[i].edit(content=chunk)
+                    self.shown[i] = chunk
+                continue
+            sent = await (self.message.reply(chunk) if i == 0 else self.message.channel.send(chunk))
+            if not self.sent:
+                first_visible = time.monotonic() - self.started
+                _stream_stats["replies"] += 1
+                _stream_stats["first_visible_s"] += first_visible
+                logger.info(f"First visible text after {first_visible:.2f}s")
+            self.sent.append(sent)
+            self.shown.append(chunk)
+        # Final text can be shorter than the draft (tags removed)
+        for extra in self.sent[len(chunks):]:
+            await extra.delete()
+        del self.sent[len(chunks):]
+        del self.shown[len(chunks):]
+
+    async def finish(self, final_text):
+        if self._flush_task:
+            await self._flush_task
+        try:
+            await self._render(_split_message(final_text or "Manze, I got nothing. Try again?"))
+        except discord.HTTPException as e:
+            logger.warning(f"Stream finish failed, sending fresh reply: {e}")
+            await send_chunked_reply(self.message, final_text)
+
+def _get_text_from_parts(parts):
+    """Joins the text parts of a message (skips attachments)."""
+    return " ".join([
+        p if isinstance(p, str) else p.get("text", "")
+        for p in parts
+        if isinstance(p, str) or (isinstance(p, dict) and "text" in p)
+    ])
+
 def _extract_sources(response):
     try:
         if not response.candidates:
@@ -628,38 +856,197 @@ async def send_voice_reply(message, text_response):
 # ══════════════════════════════════════════════
 # STOCK DETECTOR
 # ══════════════════════════════════════════════
+_DOLLAR_TICKER_RE = re.compile(r'\$([A-Za-z]{1,6}(?:-USD)?)\b')
+# Every stock question mentions one of these — otherwise only $TICKER counts
+_STOCK_QUERY_KEYWORDS = ("price", "stock", "share", "value", "perform", "doing", "trading", "nse", "market", "exchange")
+# These make it unambiguous, so "equity" can mean EQTY even in lower case
+_STRONG_STOCK_KEYWORDS = ("stock", "share", "nse")
+
 def _detect_stock_query(text):
-    patterns = [
-        r'(?:current\s+)?(?:price|stock|shares?|value)\s+(?:of\s+|for\s+)?["\']?(\w[\w\s&]*\w?)["\']?',
-        r'["\']?(\w[\w\s&]*\w?)["\']?\s+(?:stock|shares?|price|current price)',
-        r'how\s+(?:is|are|did|has|much)\s+["\']?(\w[\w\s&]*\w?)["\']?\s+(?:stock|shares?|perform|doing|trading|priced)',
-        r'how\s+(?:is|are|did|has)\s+["\']?(\w[\w\s&]*\w?)["\']?\s+(?:on\s+(?:the\s+)?(?:nse|market|exchange))',
-        r'(?:tell\s+me\s+about|check|get|fetch|look\s+up)\s+["\']?(\w[\w\s&]*\w?)["\']?\s+(?:stock|shares?|price)',
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            raw = match.group(1).strip().upper()
-            if raw in NAME_TO_TICKER:
-                return NAME_TO_TICKER[raw]
-            if len(raw) <= 6 and raw.isalpha():
-                return raw
-            for word in raw.split():
-                if word in NAME_TO_TICKER:
-                    return NAME_TO_TICKER[word]
-    dollar_match = re.search(r'\$(\w{1,6})', text.upper())
+    """Symbol of the stock the user is asking about, or None."""
+    lower = text.lower()
+    if any(k in lower for k in _STOCK_QUERY_KEYWORDS):
+        lenient = any(k in lower for k in _STRONG_STOCK_KEYWORDS)
+        found = find_tickers(text, fuzzy=True, unknown_symbols=True, lenient=lenient)
+        if found:
+            return found[0].symbol
+    dollar_match = _DOLLAR_TICKER_RE.search(text)
     if dollar_match:
-        ticker = dollar_match.group(1)
-        return NAME_TO_TICKER.get(ticker, ticker)
+        ticker = lookup(dollar_match.group(1))
+        return ticker.symbol if ticker else dollar_match.group(1).upper()
     return None
 
 
+# ══════════════════════════════════════════════
+# HISTORY PACKER (token-budgeted window)
+# ══════════════════════════════════════════════
+def _estimate_message_tokens(msg, model):
+    costs = TOKEN_ESTIMATES[model]
+    tokens = 4  # Per-message overhead (role, separators)
+    for p in msg.get("parts", []):
+        if isinstance(p, str):
+            tokens += len(p) / costs["chars_per_token"]
+        elif isinstance(p, dict):
+            if "text" in p:
+                tokens += len(p["text"]) / costs["chars_per_token"]
+            elif "inline_data" in p:
+                mime = p["inline_data"]["mime_type"]
+                tokens += costs["pdf"] if mime == "application/pdf" else costs["image"]
+    return int(tokens)
+
+def _stub_message(msg, tokens):
+    """Replaces an oversized old turn with a short preview."""
+    preview = _get_text_from_parts(msg.get("parts", []))[:200].strip()
+    return {
+        "role": msg["role"],
+        "parts": [{"text": f"{preview}… [earlier message trimmed, ~{tokens} tokens]"}],
+    }
+
+def _pack_history(conversation_history, model, budget=None):
+    """
+    Fills a token budget newest-first, so one huge pasted file can't dominate
+    every later request. The latest message is always kept whole; older turns
+    over HISTORY_MAX_TURN_TOKENS are stubbed, and packing stops at the first
+    turn that no longer fits (keeps the window contiguous).
+    """
+    budget = budget or HISTORY_TOKEN_BUDGET
+    packed = []
+    used = 0
+    for i, msg in enumerate(reversed(conversation_history[-MAX_HISTORY_MESSAGES:])):
+        tokens = _estimate_message_tokens(msg, model)
+        if i > 0 and tokens > HISTORY_MAX_TURN_TOKENS:
+            msg = _stub_message(msg, tokens)
+            tokens = _estimate_message_tokens(msg, model)
+        if i > 0 and used + tokens > budget:
+            break
+        packed.append(msg)
+        used += tokens
+    packed.reverse()
+    if len(packed) < len(conversation_history):
+        logger.info(f"History packed for {model}: {len(packed)}/{len(conversation_history)} turns, ~{used} tokens")
+    return packed
+
+
+# ══════════════════════════════════════════════
+# PROMPT CACHE (static persona prefix)
+# ══════════════════════════════════════════════
+_gemini_cache = {"name": None, "expires_at": 0.0, "retry_at": 0.0}
+_gemini_cache_lock = asyncio.Lock()
+_gemini_cache_deletes = set()  # Background deletes of abandoned caches
+
+_prompt_cache_stats = {
+    model: {
+        "calls": 0, "cached_calls": 0,
+        "input_tokens": 0, "cached_tokens": 0, "cache_write_tokens": 0,
+        "latency_cached_s": 0.0, "latency_uncached_s": 0.0,
+        "streamed_calls": 0, "first_token_s": 0.0,
+    }
+    for model in ("gemini", "claude")
+}
+
+def _record_prompt_usage(model, input_tokens, cached_tokens, latency, cache_write_tokens=0):
+    stats = _prompt_cache_stats[model]
+    stats["calls"] += 1
+    stats["input_tokens"] += input_tokens or 0
+    stats["cached_tokens"] += cached_tokens or 0
+    stats["cache_write_tokens"] += cache_write_tokens or 0
+    if cached_tokens:
+        stats["cached_calls"] += 1
+        stats["latency_cached_s"] += latency
+    else:
+        stats["latency_uncached_s"] += latency
+
+def _record_first_token(model, latency):
+    stats = _prompt_cache_stats[model]
+    stats["streamed_calls"] += 1
+    stats["first_token_s"] += latency
+
+def get_prompt_cache_stats():
+    """Cache-hit token counts and average latency with/without a cache hit."""
+    report = {}
+    for model, stats in _prompt_cache_stats.items():
+        uncached_calls = stats["calls"] - stats["cached_calls"]
+        report[model] = {
+            **{k: v for k, v in stats.items() if not k.startswith("latency") and k != "first_token_s"},
+            "avg_latency_cached_s": round(stats["latency_cached_s"] / stats["cached_calls"], 3)
+                if stats["cached_calls"] else None,
+            "avg_latency_uncached_s": round(stats["latency_uncached_s"] / uncached_calls, 3)
+                if uncached_calls else None,
+            "avg_first_token_s": round(stats["first_token_s"] / stats["streamed_calls"], 3)
+                if stats["streamed_calls"] else None,
+        }
+    report["gemini_cache_active"] = bool(_gemini_cache["name"])
+    return report
+
+async def _get_gemini_cache():
+    """
+    Returns the name of Gemini's cached persona, creating it when missing/expired.
+    Returns None if explicit caching is off or unavailable (e.g. the prompt is
+    under the model's minimum cache size) — callers then send the full prompt.
+    """
+    if not GEMINI_EXPLICIT_CACHE:
+        return None
+    now = time.monotonic()
+    if _gemini_cache["name"] and now < _gemini_cache["expires_at"]:
+        return _gemini_cache["name"]
+    if now < _gemini_cache["retry_at"]:
+        return None
+
+    async with _gemini_cache_lock:
+        if _gemini_cache["name"] and now < _gemini_cache["expires_at"]:
+            return _gemini_cache["name"]
+        try:
+            cache = await gemini_client.aio.caches.create(
+                model=MODEL_GEMINI,
+                config=types.CreateCachedContentConfig(
+                    display_name="emily-persona",
+                    system_instruction=GEMINI_STATIC_PROMPT,
+                    tools=[types.Tool(google_search=types.GoogleSearch())],
+                    ttl=f"{GEMINI_CACHE_TTL_SECONDS}s",
+                ),
+            )
+            _gemini_cache["name"] = cache.name
+            # Refresh a minute early so we never send an expired cache name
+            _gemini_cache["expires_at"] = now + GEMINI_CACHE_TTL_SECONDS - 60
+            logger.info(f"Gemini persona cache created: {cache.name}")
+        except Exception as e:
+            logger.warning(f"Gemini persona cache unavailable, sending full prompt: {e}")
+            _gemini_cache["name"] = None
+            _gemini_cache["retry_at"] = now + GEMINI_CACHE_TTL_SECONDS
+    return _gemini_cache["name"]
+
+def _is_gemini_cache_error(error):
+    """True when Gemini rejected the cached persona itself (expired early, deleted, invalid)."""
+    return (
+        isinstance(error, genai_errors.ClientError)
+        and error.code in (400, 404)
+        and "cache" in str(error).lower()
+    )
+
+async def _delete_gemini_cache(name):
+    try:
+        await gemini_client.aio.caches.delete(name=name)
+        logger.info(f"Gemini persona cache deleted: {name}")
+    except Exception as e:
+        logger.warning(f"Couldn't delete Gemini cache {name}, it will expire on its own: {e}")
+
+def _drop_gemini_cache(name, delete=True):
+    """Stops using a rejected cache for a while and deletes it in the background."""
+    if _gemini_cache["name"] == name:  # A newer cache may already have replaced it
+        _gemini_cache["name"] = None
+        _gemini_cache["retry_at"] = time.monotonic() + GEMINI_CACHE_TTL_SECONDS
+    if delete:
+        task = asyncio.create_task(_delete_gemini_cache(name))
+        _gemini_cache_deletes.add(task)
+        task.add_done_callback(_gemini_cache_deletes.discard)
+
+
 # ══════════════════════════════════════════════
 # GEMINI BRAIN
 # ══════════════════════════════════════════════
-async def _get_gemini_response(conversation_history, emily_prompt):
-    """Get response from Gemini (has Google Search)."""
-    trimmed = conversation_history[-MAX_HISTORY_MESSAGES:]
+async def _get_gemini_response(conversation_history, context_prompt, on_text=None):
+    """Get response from Gemini (has Google Search). Streams into `on_text` if given."""
+    trimmed = _pack_history(conversation_history, "gemini")
 
     formatted_contents = []
     for msg in trimmed:
@@ -678,27 +1065,92 @@ async def _get_gemini_response(conversation_history, emily_prompt):
         if parts:
             formatted_contents.append(types.Content(role=msg["role"], parts=parts))
 
-    search_tool = types.Tool(google_search=types.GoogleSearch())
-    response = await _call_gemini_with_retry(
-        gemini_client.aio.models.generate_content,
-        model=MODEL_GEMINI,
-        contents=formatted_contents,
-        config=types.GenerateContentConfig(
-            tools=[search_tool],
-            system_instruction=emily_prompt,
-            response_modalities=["TEXT"],
+    response = None
+    text = ""
+    started = time.monotonic()
+
+    # Cached persona: tools + static prompt live in the cache, context goes first in contents
+    cache_name = await _get_gemini_cache()
+    if cache_name:
+        try:
+            text, response = await _gemini_generate(
+                [types.Content(role="user", parts=[types.Part.from_text(text=context_prompt)])]
+                + formatted_contents,
+                types.GenerateContentConfig(
+                    cached_content=cache_name,
+                    response_modalities=["TEXT"],
+                ),
+                on_text,
+            )
+        except Exception as e:
+            if not _is_gemini_cache_error(e):
+                raise  # Timeouts/5xx already had their retries; let the other model answer
+            logger.warning(f"Gemini rejected the persona cache, retrying without it: {e}")
+            _drop_gemini_cache(cache_name, delete=e.code != 404)  # 404: already gone
+            started = time.monotonic()
+
+    if response is None:
+        # Static prefix first so implicit prefix caching can still kick in
+        search_tool = types.Tool(google_search=types.GoogleSearch())
+        text, response = await _gemini_generate(
+            formatted_contents,
+            types.GenerateContentConfig(
+                tools=[search_tool],
+                system_instruction=GEMINI_STATIC_PROMPT + context_prompt,
+                response_modalities=["TEXT"],
+            ),
+            on_text,
         )
+
+    usage = getattr(response, "usage_metadata", None)
+    _record_prompt_usage(
+        "gemini",
+        getattr(usage, "prompt_token_count", 0),
+        getattr(usage, "cached_content_token_count", 0),
+        time.monotonic() - started,
     )
 
-    return response.text, _extract_sources(response)
+    return text, _extract_sources(response)
+
+async def _gemini_generate(contents, config, on_text=None):
+    """
+    One Gemini call. Without `on_text` it's a plain call with retries; with it,
+    the reply is streamed and `on_text(text_so_far)` is awaited per chunk.
+    Returns (text, final_response_or_chunk) — the last chunk carries usage and grounding.
+    """
+    if on_text is None:
+        response = await _call_gemini_with_retry(
+            gemini_client.aio.models.generate_content,
+            model=MODEL_GEMINI,
+            contents=contents,
+            config=config,
+        )
+        return response.text, response
+
+    async def consume():
+        started = time.monotonic()
+        text, last = "", None
+        async for chunk in await gemini_client.aio.models.generate_content_stream(
+            model=MODEL_GEMINI, contents=contents, config=config,
+        ):
+            last = chunk
+            if chunk.text:
+                if not text:
+                    _record_first_token("gemini", time.monotonic() - started)
+                text += chunk.text
+                await on_text(text)
+        return text, last
+
+    # No retries once streaming: partial text may already be on screen, fallback handles it
+    return await asyncio.wait_for(consume(), timeout=API_TIMEOUT_SECONDS)
 
 
 # ══════════════════════════════════════════════
 # CLAUDE BRAIN
 # ══════════════════════════════════════════════
-async def _get_claude_response(conversation_history, emily_prompt):
-    """Get response from Claude (better reasoning, no search)."""
-    trimmed = conversation_history[-MAX_HISTORY_MESSAGES:]
+async def _get_claude_response(conversation_history, context_prompt, on_text=None):
+    """Get response from Claude (better reasoning, no search). Streams into `on_text` if given."""
+    trimmed = _pack_history(conversation_history, "claude")
 
     # Convert to Claude's message format
     claude_messages = []
@@ -760,15 +1212,46 @@ async def _get_claude_response(conversation_history, emily_prompt):
     if not claude_messages:
         claude_messages = [{"role": "user", "content": [{"type": "text", "text": "Hi Emily!"}]}]
 
+    # Static persona is marked cacheable; the small context block follows it
+    system_blocks = [
+        {"type": "text", "text": CLAUDE_STATIC_PROMPT, "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": context_prompt},
+    ]
+
+    async def stream_reply():
+        text = ""
+        async with claude_client.messages.stream(
+            model=MODEL_CLAUDE,
+            max_tokens=2048,
+            system=system_blocks,
+            messages=claude_messages,
+        ) as stream:
+            async for delta in stream.text_stream:
+                if not text:
+                    _record_first_token("claude", time.monotonic() - started)
+                text += delta
+                await on_text(text)
+            return await stream.get_final_message()
+
     try:
-        response = await asyncio.wait_for(
-            claude_client.messages.create(
+        started = time.monotonic()
+        if on_text is None:
+            request = claude_client.messages.create(
                 model=MODEL_CLAUDE,
                 max_tokens=2048,
-                system=emily_prompt,
+                system=system_blocks,
                 messages=claude_messages,
-            ),
-            timeout=API_TIMEOUT_SECONDS,
+            )
+        else:
+            request = stream_reply()
+        response = await asyncio.wait_for(request, timeout=API_TIMEOUT_SECONDS)
+        usage = response.usage
+        _record_prompt_usage(
+            "claude",
+            usage.input_tokens,
+            getattr(usage, "cache_read_input_tokens", 0),
+            time.monotonic() - started,
+            cache_write_tokens=getattr(usage, "cache_creation_input_tokens", 0),
         )
 
         # Extract text from Claude's response
@@ -784,117 +1267,258 @@ async def _get_claude_response(conversation_history, emily_prompt):
         raise
 
 
+# ══════════════════════════════════════════════
+# MODEL HEALTH (adaptive routing)
+# ══════════════════════════════════════════════
+# key: model, or "model|route reason" -> EWMA latency (s), EWMA error rate, sample count
+_model_health = defaultdict(lambda: {"latency": 0.0, "error_rate": 0.0, "samples": 0, "updated": 0.0})
+_route_shifts = defaultdict(int)
+
+def _record_model_health(model, route_reason, latency=None, failed=False):
+    for key in (model, f"{model}|{route_reason}"):
+        health = _model_health[key]
+        if health["samples"] == 0:
+            health["error_rate"] = 1.0 if failed else 0.0
+            if latency is not None:
+                health["latency"] = latency
+        else:
+            health["error_rate"] += HEALTH_EWMA_ALPHA * ((1.0 if failed else 0.0) - health["error_rate"])
+            if latency is not None:
+                health["latency"] += HEALTH_EWMA_ALPHA * (latency - health["latency"])
+        health["samples"] += 1
+        health["updated"] = time.monotonic()
+
+def _current_health(model, route_reason):
+    """Per-route health when we have enough samples, else the model-wide numbers."""
+    now = time.monotonic()
+    for key in (f"{model}|{route_reason}", model):
+        health = _model_health.get(key)
+        if health and health["samples"] >= HEALTH_MIN_SAMPLES and now - health["updated"] < HEALTH_STALE_SECONDS:
+            return health
+    return None
+
+def _adapt_route(chosen_model, route_reason):
+    """
+    Shifts soft routes to the other model while the chosen one is erroring or
+    much slower. Hard routes (e.g. search needed) are never moved.
+    """
+    if not ADAPTIVE_ROUTING or route_reason not in SOFT_ROUTES:
+        return chosen_model
+    other = "claude" if chosen_model == "gemini" else "gemini"
+    mine, theirs = _current_health(chosen_model, route_reason), _current_health(other, route_reason)
+    if not mine:
+        return chosen_model
+
+    why = None
+    if mine["error_rate"] > HEALTH_MAX_ERROR_RATE and (not theirs or theirs["error_rate"] < mine["error_rate"]):
+        why = f"error rate {mine['error_rate']:.0%}"
+    elif theirs and theirs["error_rate"] <= HEALTH_MAX_ERROR_RATE and \
+            mine["latency"] > HEALTH_MAX_LATENCY_RATIO * theirs["latency"]:
+        why = f"latency {mine['latency']:.1f}s vs {theirs['latency']:.1f}s"
+    if not why:
+        return chosen_model
+
+    _route_shifts[f"{chosen_model}->{other}|{route_reason}"] += 1
+    logger.info(f"🧠 Adaptive routing: {chosen_model.upper()} → {other.upper()} for '{route_reason}' ({why})")
+    return other
+
+def get_routing_stats():
+    return {
+        "adaptive": ADAPTIVE_ROUTING,
+        "health": {
+            key: {"latency_s": round(h["latency"], 2), "error_rate": round(h["error_rate"], 3), "samples": h["samples"]}
+            for key, h in _model_health.items()
+        },
+        "shifts": dict(_route_shifts),
+    }
+
+
+# ══════════════════════════════════════════════
+# HEDGED MODEL CALLS
+# ══════════════════════════════════════════════
+# Seconds until each model produced output (first token when streaming, else the whole reply)
+_model_latencies = {"gemini": deque(maxlen=200), "claude": deque(maxlen=200)}
+_hedge_stats = defaultdict(lambda: {"requests": 0, "fired": 0, "won": 0})
+
+class BothModelsFailed(Exception):
+    """Raised when a hedged call already tried both models."""
+
+def get_hedge_stats():
+    return {
+        "enabled": HEDGE_REQUESTS,
+        "delay_s": {model: round(_hedge_delay(model), 2) for model in _model_latencies},
+        "routes": {route: dict(stats) for route, stats in _hedge_stats.items()},
+    }
+
+def _hedge_delay(model):
+    """How long to give `model` before hedging: its recent p95, clamped."""
+    samples = sorted(_model_latencies[model])
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    return min(max(p95, HEDGE_MIN_DELAY), HEDGE_MAX_DELAY)
+
+async def _call_model(model, conversation_history, context_prompt, on_text=None, route_reason=""):
+    """Calls one model and records how long it took to produce output (and failures)."""
+    started = time.monotonic()
+    first_output = None
+
+    async def tracked_on_text(text):
+        nonlocal first_output
+        if first_output is None:
+            first_output = time.monotonic() - started
+        await on_text(text)
+
+    get_response = _get_gemini_response if model == "gemini" else _get_claude_response
+    try:
+        result = await get_response(conversation_history, context_prompt, tracked_on_text if on_text else None)
+    except asyncio.CancelledError:
+        raise  # Lost a hedge race — not the model's fault
+    except Exception:
+        _record_model_health(model, route_reason, failed=True)
+        raise
+    latency = first_output if first_output is not None else time.monotonic() - started
+    _model_latencies[model].append(latency)
+    _record_model_health(model, route_reason, latency=latency)
+    return result
+
+async def _call_with_hedge(chosen_model, route_reason, conversation_history, context_prompt, on_text=None):
+    """
+    Calls the routed model; if it hasn't produced anything within its p95
+    delay, fires the other model too and takes whichever answers first.
+    The loser is cancelled (when streaming, as soon as the winner shows text);
+    if the winner then fails mid-stream, the loser is asked again on its own.
+    Returns (text, sources, answering_model).
+    """
+    if not HEDGE_REQUESTS or not HEDGE_ROUTES.get(route_reason, False):
+        text, sources = await _call_model(chosen_model, conversation_history, context_prompt, on_text, route_reason)
+        return text, sources, chosen_model
+
+    stats = _hedge_stats[route_reason]
+    stats["requests"] += 1
+    other = "claude" if chosen_model == "gemini" else "gemini"
+    tasks = {}
+    produced = asyncio.Event()
+    owner = None  # Model whose stream is on screen
+
+    def gated(model):
+        async def forward(text):
+            nonlocal owner
+            if owner is None:
+                owner = model
+                produced.set()
+                # First visible text wins — stop the other model
+                rival = tasks.get(other if model == chosen_model else chosen_model)
+                if rival:
+                    rival.cancel()
+            if owner == model:
+                await on_text(text)
+        return forward if on_text else None
+
+    primary = asyncio.create_task(
+        _call_model(chosen_model, conversation_history, context_prompt, gated(chosen_model), route_reason)
+    )
+    tasks[chosen_model] = primary
+
+    produced_wait = asyncio.create_task(produced.wait())
+    await asyncio.wait({primary, produced_wait}, timeout=_hedge_delay(chosen_model), return_when=asyncio.FIRST_COMPLETED)
+    produced_wait.cancel()
+    if primary.done() or produced.is_set():
+        text, sources = await primary
+        return text, sources, chosen_model
+
+    stats["fired"] += 1
+    logger.info(f"Hedging: {chosen_model.upper()} slow for '{route_reason}', also asking {other.upper()}")
+    tasks[other] = asyncio.create_task(
+        _call_model(other, conversation_history, context_prompt, gated(other), route_reason)
+    )
+
+    pending = set(tasks.values())
+    errors = {}
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.cancelled():
+                continue
+            if task.exception():
+                errors[other if task is tasks[other] else chosen_model] = task.exception()
+                continue
+            for loser in pending:
+                loser.cancel()
+            winner = other if task is tasks[other] else chosen_model
+            if winner == other:
+                stats["won"] += 1
+            text, sources = task.result()
+            return text, sources, winner
+
+    if len(errors) == 1:
+        # The failed model had the stream and cancelled its rival, which never got to answer
+        (failed, error), = errors.items()
+        retry = other if failed == chosen_model else chosen_model
+        logger.warning(f"Hedging: {failed.upper()} failed mid-stream ({error}), asking {retry.upper()} again")
+        try:
+            text, sources = await _call_model(retry, conversation_history, context_prompt, on_text, route_reason)
+            return text, sources, retry
+        except Exception as e:
+            errors[retry] = e
+    raise BothModelsFailed("; ".join(str(e) for e in errors.values()) or "cancelled")
+
+
 # ══════════════════════════════════════════════
 # EMILY'S BRAIN (HIVE MIND ORCHESTRATOR)
 # ══════════════════════════════════════════════
-async def get_ai_response(conversation_history, user_id, chosen_model, route_reason):
+async def get_ai_response(conversation_history, user_id, chosen_model, route_reason, profile=None, on_text=None):
     """
     Routes to the right model, handles memory, tags, and fallback.
+    Pass `profile` (e.g. from get_conversation_context) to skip a profile read.
+    Pass `on_text` to stream the raw model text as it arrives; tags are still
+    only resolved once the full reply is in.
     Returns tuple: (response_text, source_links)
     """
     try:
         eat_zone = pytz.timezone('Africa/Nairobi')
         current_time = datetime.now(eat_zone).strftime("%A, %d %B %Y, %I:%M %p EAT")
 
-        profile = get_user_profile(user_id)
-        safe_facts = [_sanitize_fact(f) for f in profile.get("facts", [])]
-        facts_str = "\n- ".join(safe_facts) if safe_facts else "A new friend — haven't learned much about them yet."
+        if profile is None:
+            profile = await get_user_profile_async(user_id)
+        facts_str = select_relevant_facts(profile, _get_text_from_parts(conversation_history[-1].get("parts", [])))
 
-        emily_prompt = _build_emily_prompt(current_time, facts_str)
-
-        # Add model-specific instructions
-        if chosen_model == "gemini":
-            emily_prompt += """
-SEARCH RULES:
-- Use Google Search AGGRESSIVELY for factual questions.
-- NEVER answer factual questions from memory. SEARCH FIRST.
-- If you cannot find confirmed info, say so. Do NOT fabricate.
-"""
-        else:
-            emily_prompt += """
-IMPORTANT:
-- You do NOT have access to Google Search or live data.
-- For factual claims, be clear about what you know vs what might have changed.
-- If the user needs LIVE data (stock prices, news, weather), tell them to ask again 
-  and you'll route to your search brain. Or use [STOCK: SYMBOL] for prices.
-- Your strength is ANALYSIS, ADVICE, and OPINIONS. Lean into that.
-"""
+        context_prompt = _build_context_prompt(current_time, facts_str, profile.get("summary", ""))
 
         logger.info(f"🧠 Hive Mind → {chosen_model.upper()} | Reason: {route_reason}")
 
-        # ─── TRY PRIMARY MODEL ───
+        # ─── TRY PRIMARY MODEL (hedged if enabled for this route) ───
         final_text = ""
         source_links = ""
         try:
-            if chosen_model == "gemini":
-                final_text, source_links = await _get_gemini_response(conversation_history, emily_prompt)
-            else:
-                final_text, source_links = await _get_claude_response(conversation_history, emily_prompt)
+            final_text, source_links, answered_by = await _call_with_hedge(
+                chosen_model, route_reason, conversation_history, context_prompt, on_text
+            )
+            if answered_by != chosen_model:
+                logger.info(f"🧠 Hedge won by {answered_by.upper()}")
+        except BothModelsFailed as e:
+            logger.error(f"Both models failed (hedged): {e}")
+            return "Manze, both my brains are jammed right now. Try again in a sec?", ""
         except Exception as primary_error:
             # ─── FALLBACK TO OTHER MODEL ───
             fallback = "claude" if chosen_model == "gemini" else "gemini"
             logger.warning(f"{chosen_model.upper()} failed ({primary_error}), falling back to {fallback.upper()}")
             try:
-                if fallback == "gemini":
-                    final_text, source_links = await _get_gemini_response(conversation_history, emily_prompt)
-                else:
-                    final_text, source_links = await _get_claude_response(conversation_history, emily_prompt)
+                final_text, source_links = await _call_model(
+                    fallback, conversation_history, context_prompt, on_text, route_reason
+                )
             except Exception as fallback_error:
                 logger.error(f"Both models failed. Primary: {primary_error}, Fallback: {fallback_error}")
                 return "Manze, both my brains are jammed right now. Try again in a sec?", ""
 
-        # ─── MEMORY EXTRACTION (always via Gemini — it has JSON mode) ───
+        # ─── MEMORY EXTRACTION (background worker — never delays the reply) ───
         if "[MEMORY SAVED]" in final_text:
-            try:
-                last_msg = conversation_history[-1]
-                user_input = " ".join([
-                    p if isinstance(p, str) else p.get("text", "")
-                    for p in last_msg.get("parts", [])
-                    if isinstance(p, str) or (isinstance(p, dict) and "text" in p)
-                ])
-                extraction = await _call_gemini_with_retry(
-                    gemini_client.aio.models.generate_content,
-                    model=MODEL_GEMINI,
-                    contents=f'Extract the personal fact from this user message: "{user_input}"',
-                    config=types.GenerateContentConfig(
-                        response_mime_type="application/json",
-                        response_schema=UserFact,
-                    ),
-                    timeout=10,
-                )
-                raw_json = extraction.text.strip()
-                if "```" in raw_json:
-                    raw_json = re.sub(r'^```(?:json)?\n?|(?:\n?)+```$', '', raw_json, flags=re.MULTILINE).strip()
-                fact_obj = UserFact.model_validate_json(raw_json)
-                if fact_obj.confidence > 0.6:
-                    sanitized = _sanitize_fact(fact_obj.fact)
-                    update_user_fact(user_id, sanitized, fact_obj.category)
-                    logger.info(f"Memory saved for {user_id}: {sanitized}")
-            except Exception as e:
-                logger.error(f"Memory extraction failed: {e}")
+            queue_fact_extraction(user_id, _get_text_from_parts(conversation_history[-1].get("parts", [])))
             final_text = final_text.replace("[MEMORY SAVED]", "").strip()
 
         # ─── TAG PROCESSING ───
-        final_text, s = await _process_all_tags(
-            r'\[\s*STOCK:\s*(.*?)\s*\]', final_text,
-            lambda x: get_stock_price(x) or f"*(Couldn't get price for {x}.)*"
-        )
-        final_text += s
-        final_text, g = await _process_all_tags(
-            r'\[\s*GIFS?:\s*(.*?)\s*\]', final_text,
-            lambda x: get_media_link(x, is_gif=True) or "*(GIF search failed.)*"
-        )
-        final_text += g
-        final_text, i = await _process_all_tags(
-            r'\[\s*(?:IMAGES?|IMGS?):\s*(.*?)\s*\]', final_text,
-            lambda x: get_media_link(x, is_gif=False) or "*(Image search failed.)*"
-        )
-        final_text += i
-        final_text, v = await _process_all_tags(
-            r'\[\s*VIDEOS?:\s*(.*?)\s*\]', final_text,
-            lambda x: search_video_link(x) or "*(Video search failed.)*"
-        )
-        final_text += v
+        final_text, appendix = await _resolve_tags(final_text)
+        final_text += appendix
 
         return final_text, source_links
 
@@ -910,15 +1534,167 @@ intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="!", intents=intents)
 
+_background_tasks = {}
+
+def _start_background_task(name, coro_func):
+    """Starts a long-running task once (on_ready fires again on reconnects)."""
+    task = _background_tasks.get(name)
+    if task and not task.done():
+        return
+    _background_tasks[name] = asyncio.create_task(coro_func(), name=name)
+
 @bot.event
 async def on_ready():
     logger.info(f"Emily connected to Discord: {bot.user}")
     logger.info(f"Hive Mind active: Gemini ({MODEL_GEMINI}) + Claude ({MODEL_CLAUDE})")
+    _start_background_task("summarizer", run_summarizer)
+    _start_background_task("fact_extractor", run_fact_extractor)
+    _start_background_task("quote_prefetcher", run_quote_prefetcher)
+    _start_background_task("price_alerts", lambda: run_price_alerts(_send_price_alert))
+
+def _alert_request(text):
+    """
+    parse_alert_request, but only for a subject that resolves to a stock.
+    "remind me when my rent goes above 20000" is left to the chat models.
+    """
+    request = parse_alert_request(text)
+    return request if request and resolve_alert_symbol(request[0]) else None
+
+async def _send_price_alert(alert, price):
+    """Posts a triggered alert where it was set, or DMs the user if that channel is gone."""
+    text = (
+        f"<@{alert['user_id']}> 🔔 **{alert['symbol']}** just went {alert['direction']} "
+        f"{alert['target']:,.2f} — now at {price:,.2f}. _Not financial advice!_"
+    )
+    channel_id = int(alert["channel_id"])
+    try:
+        channel = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+        await channel.send(text)
+    except discord.DiscordException:
+        try:
+            user = await bot.fetch_user(int(alert["user_id"]))
+            await user.send(text)
+        except (discord.Forbidden, discord.NotFound) as e:
+            # DMs closed or the user is gone: nowhere left to post
+            logger.warning(f"Price alert for {alert['user_id']} undeliverable: {e}")
+
+# ══════════════════════════════════════════════
+# COMMANDS
+# ══════════════════════════════════════════════
+_HOLDING_SYMBOL_RE = re.compile(r'^[A-Z0-9][A-Z0-9\-]{0,11}$')  # Safe as a Mongo field name
+PORTFOLIO_USAGE = (
+    "Usage: `!portfolio` · `!portfolio add SCOM 100 [price paid]` · "
+    "`!portfolio remove SCOM [shares]` · `!portfolio clear`"
+)
+ALERT_USAGE = (
+    "Usage: `!alert SCOM 20` · `!alert SCOM below 15.5` · `!alerts` · `!unalert SCOM` · `!unalert all`\n"
+    "Or just tell me: \"ping me when SCOM crosses 20\""
+)
+
+def _positive(number):
+    """Rejects nan and inf too: float() parses "nan" and "inf" from command arguments."""
+    return math.isfinite(number) and number > 0
+
+def _holding_symbol(raw):
+    ticker = resolve(raw)
+    symbol = ticker.symbol if ticker else raw.strip().lstrip("$").upper()
+    return symbol if _HOLDING_SYMBOL_RE.match(symbol) else None
+
+@bot.group(name="portfolio", invoke_without_command=True)
+async def portfolio_command(ctx):
+    """Values the user's holdings: total, today's P&L, allocation and KES/USD exposure."""
+    async with ctx.typing():
+        holdings = await get_portfolio_async(str(ctx.author.id))
+        summary = await asyncio.to_thread(value_portfolio, holdings)
+        await send_chunked_reply(ctx.message, format_portfolio(summary))
+
+@portfolio_command.command(name="add")
+async def portfolio_add(ctx, symbol: str, shares: float, cost: float = None):
+    holding = _holding_symbol(symbol)
+    if not holding or not _positive(shares) or (cost is not None and not _positive(cost)):
+        await ctx.reply(PORTFOLIO_USAGE)
+        return
+    await add_holding_async(str(ctx.author.id), holding, shares, cost)
+    record_ticker_interest(holding)
+    await ctx.reply(f"Sawa! Added {shares:g} {holding} to your portfolio.")
+
+@portfolio_command.command(name="remove", aliases=["sell"])
+async def portfolio_remove(ctx, symbol: str, shares: float = None):
+    holding = _holding_symbol(symbol)
+    if not holding or (shares is not None and not _positive(shares)):
+        await ctx.reply(PORTFOLIO_USAGE)
+        return
+    held = await remove_holding_async(str(ctx.author.id), holding, shares)
+    if held is None:
+        await ctx.reply(f"You don't hold any {holding}. Check `!portfolio`.")
+        return
+    if shares is not None and shares > held + 1e-9:
+        await ctx.reply(f"You only hold {held:g} {holding}, so I left it as is.")
+        return
+    await ctx.reply(f"Done, {'sold ' + format(shares, 'g') if shares else 'removed all your'} {holding}.")
+
+@portfolio_command.command(name="clear")
+async def portfolio_clear(ctx):
+    await clear_portfolio_async(str(ctx.author.id))
+    await ctx.reply("Portfolio cleared. Fresh start!")
+
+@bot.command(name="alert")
+async def alert_command(ctx, symbol: str, direction_or_price: str, price: float = None):
+    """`!alert SCOM 20` (crosses, either way) or `!alert SCOM above 20`."""
+    direction = direction_or_price.lower()
+    if price is None:
+        try:
+            direction, price = None, float(direction_or_price.replace(",", ""))
+        except ValueError:
+            direction = "invalid"
+    if direction not in (None, "above", "below") or not _positive(price):
+        await ctx.reply(ALERT_USAGE)
+        return
+    async with ctx.typing():
+        reply = await create_alert(str(ctx.author.id), ctx.channel.id, symbol, direction, price)
+    await ctx.reply(reply)
+
+@bot.command(name="alerts")
+async def alerts_command(ctx):
+    alerts = await get_user_alerts_async(str(ctx.author.id))
+    if not alerts:
+        await ctx.reply("No price alerts running. " + ALERT_USAGE)
+        return
+    lines = ["🔔 **Your price alerts**"]
+    lines += [f"• **{a['symbol']}** {a['direction']} {a['target']:,.2f}" for a in alerts]
+    await ctx.reply("\n".join(lines))
+
+@bot.command(name="unalert")
+async def unalert_command(ctx, symbol: str):
+    if symbol.lower() == "all":
+        cancelled = await cancel_price_alerts_async(str(ctx.author.id))
+    else:
+        ticker = resolve(symbol)
+        cancelled = await cancel_price_alerts_async(
+            str(ctx.author.id), ticker.symbol if ticker else symbol.strip().lstrip("$").upper()
+        )
+    await ctx.reply(f"Cancelled {cancelled} alert{'s' if cancelled != 1 else ''}.")
+
+_COMMAND_USAGE = {"portfolio": PORTFOLIO_USAGE, "alert": ALERT_USAGE, "unalert": ALERT_USAGE}
+
+@bot.event
+async def on_command_error(ctx, error):
+    if isinstance(error, (commands.BadArgument, commands.MissingRequiredArgument)):
+        command = ctx.command.root_parent or ctx.command
+        await ctx.reply(_COMMAND_USAGE.get(command.name, PORTFOLIO_USAGE))
+        return
+    logger.error(f"Command error in '{ctx.message.content}': {error}")
 
 @bot.event
 async def on_message(message):
     if message.author == bot.user:
         return
+    # "!command" messages go to the command handlers, not the chat brain
+    if message.content.startswith(bot.command_prefix):
+        ctx = await bot.get_context(message)
+        if ctx.valid:
+            await bot.invoke(ctx)
+            return
     if not (bot.user.mentioned_in(message) or isinstance(message.channel, discord.DMChannel)):
         return
 
@@ -960,20 +1736,29 @@ async def on_message(message):
             if not clean_msg and attachment_parts:
                 user_parts.insert(0, {"text": "I'm sending you this file. What do you think?"})
 
+            # ─── PRICE ALERTS ───
+            alert_request = _alert_request(clean_msg) if clean_msg else None
+            if alert_request and not attachment_parts:
+                full_response = await create_alert(user_id, message.channel.id, *alert_request)
+                await send_chunked_reply(message, full_response)
+                await save_exchange_async(user_id, [{"text": clean_msg}], [{"text": full_response}])
+                return
+
             # ─── STOCK AUTO-DETECT ───
             if clean_msg:
                 detected_ticker = _detect_stock_query(clean_msg)
                 if detected_ticker and not attachment_parts:
                     stock_data = await asyncio.to_thread(get_stock_price, detected_ticker)
-                    if stock_data and "couldn't find" not in stock_data:
+                    if _is_quote(stock_data):
+                        # Only real quotes feed the prefetcher, not every false positive
+                        record_ticker_interest(detected_ticker)
                         full_response = "Sawa, let me pull that up!\n\n" + stock_data
                         if is_voice_input:
                             if not await send_voice_reply(message, full_response):
                                 await send_chunked_reply(message, full_response)
                         else:
                             await send_chunked_reply(message, full_response)
-                        add_message_to_history(user_id, "user", [{"text": clean_msg}])
-                        add_message_to_history(user_id, "model", [{"text": full_response}])
+                        await save_exchange_async(user_id, [{"text": clean_msg}], [{"text": full_response}])
                         return
 
             # ─── HIVE MIND ROUTING ───
@@ -982,13 +1767,19 @@ async def on_message(message):
                 has_attachments=bool(attachment_parts),
                 attachment_types=attachment_types,
             )
+            chosen_model = _adapt_route(chosen_model, route_reason)
 
             # ─── AI RESPONSE ───
-            history = get_chat_history(user_id)
+            context = await get_conversation_context_async(user_id)
+            history = context["history"]
             history.append({"role": "user", "parts": user_parts})
 
+            # Voice replies need the whole text first, so only stream text replies
+            stream_reply = StreamingReply(message) if STREAM_REPLIES and not is_voice_input else None
+
             response_text, source_links = await get_ai_response(
-                history, user_id, chosen_model, route_reason
+                history, user_id, chosen_model, route_reason, profile=context,
+                on_text=stream_reply.update if stream_reply else None,
             )
             full_response = response_text + source_links
 
@@ -997,12 +1788,13 @@ async def on_message(message):
                     await send_chunked_reply(message, full_response)
                 elif len(response_text) > 200 or source_links:
                     await send_chunked_reply(message, full_response)
+            elif stream_reply:
+                await stream_reply.finish(full_response)
             else:
                 await send_chunked_reply(message, full_response)
 
             text_for_history = clean_msg or "Sent a file"
-            add_message_to_history(user_id, "user", [{"text": text_for_history}])
-            add_message_to_history(user_id, "model", [{"text": response_text}])
+            await save_exchange_async(user_id, [{"text": text_for_history}], [{"text": response_text}])
 
 
 # ══════════════════════════════════════════════
@@ -1,10 +1,19 @@
 import os
+import re
+import time
+import hashlib
+import uuid
+import asyncio
 import logging
+import threading
 import certifi
-from pymongo import MongoClient, ASCENDING
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pymongo import MongoClient, ASCENDING, DESCENDING
 from pymongo.errors import ConnectionFailure, PyMongoError
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta
 import pytz
 
 load_dotenv()
@@ -14,12 +23,31 @@ logger = logging.getLogger(__name__)
 EAT_ZONE = pytz.timezone('Africa/Nairobi')
 MAX_FACTS = 50       # Max stored facts per user
 MAX_HISTORY = 30     # Max chat messages per user
+MAX_SUMMARY_BACKLOG = 60  # Evicted messages kept waiting for the summarizer
+MAX_SUMMARY_CHARS = 1200  # Keeps the rolling summary's prompt addition small
+SUMMARY_MAX_ATTEMPTS = 3  # Failed summarizer passes before a backlog batch is dropped
+EXTRACTION_MAX_ATTEMPTS = 3      # Give up on a queued fact extraction after this many tries
+EXTRACTION_CLAIM_TIMEOUT = 300   # Seconds before a claimed (crashed?) extraction is retried
 FACT_SIMILARITY_THRESHOLD = 0.85  # For dedup (simple keyword overlap)
+MONGO_WORKERS = int(os.getenv("MONGO_WORKERS", "8"))  # Threads for the async API
+MAX_ALERTS_PER_USER = 20  # Pending price alerts per user
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "1000"))  # Users kept in memory
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", "600"))     # Seconds before re-reading
+NEW_FRIEND_FACTS = "A new friend — haven't learned much about them yet."
+FACT_PROMPT_TOP_K = int(os.getenv("FACT_PROMPT_TOP_K", "10"))       # Relevant facts per prompt
+FACT_PROMPT_PINNED = int(os.getenv("FACT_PROMPT_PINNED", "3"))      # Newest facts always included
+FACT_PROMPT_TOKEN_BUDGET = int(os.getenv("FACT_PROMPT_TOKEN_BUDGET", "400"))
+
+# Dedicated pool so DB calls never run on the Discord event loop
+# (and never compete with asyncio.to_thread work like stock lookups)
+_db_executor = ThreadPoolExecutor(max_workers=MONGO_WORKERS, thread_name_prefix="mongo")
 
 # --- CONNECT TO MONGODB ---
 db = None
 users_col = None
 reminders_col = None
+extractions_col = None
+alerts_col = None
 
 try:
     mongo_client = MongoClient(
@@ -27,6 +55,7 @@ try:
         tlsCAFile=certifi.where(),
         serverSelectionTimeoutMS=5000,  # Fail fast if can't connect
         connectTimeoutMS=5000,
+        maxPoolSize=MONGO_WORKERS,  # One socket per executor thread is enough
     )
     # Test the connection
     mongo_client.admin.command('ping')
@@ -34,11 +63,20 @@ try:
     db = mongo_client["emily_brain_db"]
     users_col = db["users"]
     reminders_col = db["reminders"]
+    extractions_col = db["fact_extractions"]
+    alerts_col = db["price_alerts"]
 
     # --- CREATE INDEXES (runs once, no-ops if already exist) ---
     reminders_col.create_index([("time", ASCENDING), ("status", ASCENDING)])
     reminders_col.create_index([("user_id", ASCENDING)])
+    alerts_col.create_index([("status", ASCENDING), ("symbol", ASCENDING)])
+    alerts_col.create_index([("user_id", ASCENDING), ("status", ASCENDING)])
+    extractions_col.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
     users_col.create_index([("_id", ASCENDING)])  # Already default, but explicit
+    users_col.create_index(
+        [("summary_pending", ASCENDING)],
+        partialFilterExpression={"summary_pending": True},  # Only users waiting on the summarizer
+    )
 
     logger.info("Successfully connected to MongoDB!")
 
@@ -55,59 +93,307 @@ def _check_db():
 
 
 # ══════════════════════════════════════════════
-# FACT DEDUPLICATION
+# INJECTION PROTECTION
 # ══════════════════════════════════════════════
-def _fact_is_duplicate(existing_facts, new_fact_text):
+_INJECTION_PATTERNS = [
+    re.compile(p) for p in (
+        r'(?i)ignore\s+(all\s+)?(previous\s+)?instructions',
+        r'(?i)you\s+are\s+now', r'(?i)system\s*:\s*',
+        r'(?i)new\s+instructions?\s*:', r'(?i)override\s+prompt',
+        r'(?i)disregard\s+(all\s+)?(prior\s+)?',
+        r'(?i)forget\s+(all\s+)?(previous\s+)?',
+        r'(?i)pretend\s+you\s+are', r'(?i)act\s+as\s+if',
+    )
+]
+
+
+def _sanitize(text, limit):
+    for pattern in _INJECTION_PATTERNS:
+        text = pattern.sub('[REDACTED]', text)
+    return text.replace('\n', ' ').strip()[:limit]
+
+
+def sanitize_fact(fact):
+    """Strips prompt-injection phrases from a fact before it reaches a prompt."""
+    return _sanitize(fact, 300)
+
+
+def sanitize_summary(summary):
+    """Same as sanitize_fact, for the (longer) rolling conversation summary."""
+    return _sanitize(summary, MAX_SUMMARY_CHARS)
+
+
+def build_facts_prompt(facts):
+    """Sanitizes flattened facts and joins them for Emily's prompt."""
+    safe_facts = [sanitize_fact(f) for f in facts]
+    return "\n- ".join(safe_facts) if safe_facts else NEW_FRIEND_FACTS
+
+
+# ══════════════════════════════════════════════
+# FACT RELEVANCE (which facts go in the prompt)
+# ══════════════════════════════════════════════
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset(
+    "a an the and or but if of to in on at for with from by is are was were be been am "
+    "i me my mine you your he she it its we our they them their this that these those "
+    "do does did have has had not no so just very can will would should could about "
+    "what which who whom how when where why there here as into out up down".split()
+)
+
+# Message words that make a whole fact category relevant
+CATEGORY_KEYWORDS = {
+    "finance": {"stock", "stocks", "shares", "invest", "investment", "money", "portfolio", "nse",
+                "dividend", "bond", "bonds", "sacco", "budget", "saving", "savings", "crypto", "price"},
+    "food": {"food", "eat", "eating", "cook", "cooking", "recipe", "dinner", "lunch", "breakfast",
+             "restaurant", "meal", "hungry", "dish"},
+    "movies": {"movie", "movies", "film", "films", "watch", "series", "show", "netflix", "showmax", "cinema"},
+    "family": {"family", "wife", "husband", "kids", "son", "daughter", "mum", "mom", "dad",
+               "sister", "brother", "parents"},
+    "work": {"work", "job", "boss", "office", "career", "salary", "colleague", "business"},
+    "health": {"health", "sick", "doctor", "gym", "diet", "workout", "hospital", "allergy"},
+}
+
+
+def _relevance_tokens(text):
+    return frozenset(w for w in _WORD_RE.findall(text.lower()) if len(w) > 1 and w not in _STOPWORDS)
+
+
+def _estimate_tokens(text):
+    """Rough token count (~4 chars per token) — good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def _index_facts(raw_facts):
+    """Builds (sanitized_text, category, tokens) per fact, oldest first."""
+    index = []
+    for f in raw_facts:
+        if isinstance(f, dict):
+            text, category = f.get("fact", ""), f.get("category", "general")
+        else:
+            text, category = (str(f) if f else ""), "general"
+        if not text:
+            continue
+        safe = sanitize_fact(text)
+        index.append((safe, category, _relevance_tokens(f"{safe} {category}")))
+    return index
+
+
+def select_relevant_facts(profile, message_text,
+                          top_k=FACT_PROMPT_TOP_K, pinned=FACT_PROMPT_PINNED,
+                          token_budget=FACT_PROMPT_TOKEN_BUDGET):
     """
-    Check if a fact is too similar to existing ones.
-    Uses simple keyword overlap — not perfect but catches exact and near dupes.
+    Picks the facts worth sending with this message instead of all of them:
+    the `pinned` newest facts, plus the `top_k` best lexical/category matches,
+    trimmed to `token_budget`. Returns the prompt-ready facts string.
     """
-    new_words = set(new_fact_text.lower().split())
-    if not new_words:
-        return True  # Empty fact
+    index = profile.get("fact_index")
+    full_prompt = profile.get("facts_prompt") or build_facts_prompt(profile.get("facts", []))
+    if not index:
+        return full_prompt
+
+    full_tokens = _estimate_tokens(full_prompt)
+    if len(index) <= top_k + pinned and full_tokens <= token_budget:
+        return full_prompt
 
-    for existing in existing_facts:
-        existing_text = existing.get("fact", "") if isinstance(existing, dict) else str(existing)
-        existing_words = set(existing_text.lower().split())
+    msg_tokens = _relevance_tokens(message_text or "")
+    msg_categories = {cat for cat, words in CATEGORY_KEYWORDS.items() if msg_tokens & words}
 
-        if not existing_words:
+    newest = list(range(len(index) - 1, max(-1, len(index) - 1 - pinned), -1))
+    scored = []
+    for i, (_, category, tokens) in enumerate(index[:len(index) - len(newest)]):
+        score = len(msg_tokens & tokens) + (2 if category in msg_categories else 0)
+        if score:
+            scored.append((score, i))
+    scored.sort(reverse=True)  # Best score first, newer wins ties
+
+    # Pinned facts get first claim on the budget, then the best matches
+    selected, used = [], 0
+    for i in newest + [i for _, i in scored[:top_k]]:
+        cost = _estimate_tokens(index[i][0])
+        if used + cost > token_budget:
             continue
+        selected.append(i)
+        used += cost
+
+    facts_str = "\n- ".join(index[i][0] for i in sorted(selected)) or NEW_FRIEND_FACTS
+    logger.info(
+        f"Facts in prompt: {len(selected)}/{len(index)} "
+        f"(~{full_tokens - _estimate_tokens(facts_str)} prompt tokens saved)"
+    )
+    return facts_str
+
+
+# ══════════════════════════════════════════════
+# PROFILE CACHE (LRU + TTL, write-through)
+# ══════════════════════════════════════════════
+# user_id -> (expires_at, {"facts", "facts_prompt", "fact_index", "style", "voice_mode"})
+# History is never cached — it changes on every message. Fact lists are
+# stored as tuples so callers can't change the cached copy.
+_profile_cache = OrderedDict()
+_profile_cache_lock = threading.Lock()  # DB functions run on executor threads
+_profile_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+# user_id -> bumped on every profile write, so a read that started before the
+# write can't put the old profile back into the cache afterwards
+_profile_generations = {}
+
+
+def _cache_get_profile(user_id):
+    """Returns a copy of the cached profile, or None on miss/expiry."""
+    with _profile_cache_lock:
+        entry = _profile_cache.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            _profile_cache.move_to_end(user_id)
+            _profile_cache_stats["hits"] += 1
+            return dict(entry[1])
+        if entry:
+            del _profile_cache[user_id]
+        _profile_cache_stats["misses"] += 1
+        return None
+
+
+def _profile_generation(user_id):
+    """Take this before reading a profile from the DB; pass it to _cache_put_profile."""
+    with _profile_cache_lock:
+        return _profile_generations.get(user_id, 0)
+
+
+def _cache_put_profile(user_id, raw_facts, style, voice_mode, generation):
+    """
+    Flattens and caches a profile. Returns the profile dict (a copy).
+    Not cached if the profile was written since `generation` was taken.
+    """
+    facts = tuple(_flatten_facts(raw_facts))
+    profile = {
+        "facts": facts,
+        "facts_prompt": build_facts_prompt(facts),
+        "fact_index": tuple(_index_facts(raw_facts)),
+        "style": style,
+        "voice_mode": voice_mode,
+    }
+    with _profile_cache_lock:
+        if _profile_generations.get(user_id, 0) != generation:
+            return dict(profile)
+        _profile_cache[user_id] = (time.monotonic() + PROFILE_CACHE_TTL, profile)
+        _profile_cache.move_to_end(user_id)
+        while len(_profile_cache) > PROFILE_CACHE_SIZE:
+            _profile_cache.popitem(last=False)
+    return dict(profile)
 
-        # Calculate overlap
-        overlap = len(new_words & existing_words)
-        max_len = max(len(new_words), len(existing_words))
-        similarity = overlap / max_len if max_len > 0 else 0
 
-        if similarity >= FACT_SIMILARITY_THRESHOLD:
-            return True
+def _cache_update_profile(user_id, **fields):
+    """Write-through update of a cached profile (no-op if not cached)."""
+    with _profile_cache_lock:
+        _profile_generations[user_id] = _profile_generations.get(user_id, 0) + 1
+        entry = _profile_cache.get(user_id)
+        if entry:
+            entry[1].update(fields)
 
-        # Exact substring match
-        if new_fact_text.lower().strip() in existing_text.lower() or \
-           existing_text.lower().strip() in new_fact_text.lower():
-            return True
 
-    return False
+def _invalidate_profile(user_id):
+    with _profile_cache_lock:
+        _profile_generations[user_id] = _profile_generations.get(user_id, 0) + 1
+        if _profile_cache.pop(user_id, None) is not None:
+            _profile_cache_stats["invalidations"] += 1
+
+
+def get_profile_cache_stats():
+    """Hit/miss counters for the profile cache (for the /stats endpoint)."""
+    with _profile_cache_lock:
+        stats = dict(_profile_cache_stats)
+        stats["size"] = len(_profile_cache)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    return stats
 
 
 # ══════════════════════════════════════════════
-# USER PROFILE FUNCTIONS
+# FACT DEDUPLICATION
 # ══════════════════════════════════════════════
-def get_user_profile(user_id):
-    """Fetches user profile and flattens facts into strings for the AI prompt."""
-    _check_db()
-    user_id = str(user_id)
+def _fact_tokens(fact_text):
+    """Sorted unique lowercase words — stored with each fact as its fingerprint."""
+    return sorted(set(fact_text.lower().split()))
 
-    try:
-        user_data = users_col.find_one({"_id": user_id})
-    except PyMongoError as e:
-        logger.error(f"DB error fetching profile for {user_id}: {e}")
-        return {"_id": user_id, "facts": [], "style": "friendly", "history": []}
 
-    if not user_data:
-        return {"_id": user_id, "facts": [], "style": "friendly", "history": []}
+def _fact_fingerprint(tokens):
+    """Short hash of the token set; equal fingerprints mean identical word sets."""
+    return hashlib.sha1(" ".join(tokens).encode("utf-8")).hexdigest()[:16]
+
+
+def _fact_entry(fact_text, category):
+    """A fact as stored: the text plus the normalized forms the dedup check reads."""
+    tokens = _fact_tokens(fact_text)
+    return {
+        "fact": fact_text,
+        "category": category,
+        "tokens": tokens,
+        "lower": fact_text.lower().strip(),
+        "fingerprint": _fact_fingerprint(tokens),
+        "added_at": datetime.now(EAT_ZONE),
+    }
+
+
+def _fact_duplicate_expr(new_fact_text, new_words):
+    """
+    Server-side version of the duplicate check, for use inside an update pipeline.
+    A stored fact ($$f) is a dupe of the new one if their word sets overlap by
+    FACT_SIMILARITY_THRESHOLD or more, or if either text contains the other.
+    Reads the fact's stored `tokens` and `lower`, so current facts cost a set
+    intersection and two substring searches; legacy facts (plain strings or
+    dicts without them) are lowercased and split on the fly.
+    """
+    new_lower = new_fact_text.lower()
+
+    legacy_text = {"$cond": [
+        {"$eq": [{"$type": "$$f"}, "string"]},
+        "$$f",
+        {"$ifNull": ["$$f.fact", ""]},
+    ]}
+    return {"$let": {
+        "vars": {"lower": {"$ifNull": ["$$f.lower", {"$trim": {"input": {"$toLower": legacy_text}}}]}},
+        "in": {"$let": {
+            "vars": {"words": {"$ifNull": [
+                "$$f.tokens",
+                {"$setDifference": [{"$split": ["$$lower", " "]}, [""]]},
+            ]}},
+            "in": {"$and": [
+                {"$gt": [{"$size": "$$words"}, 0]},
+                {"$or": [
+                    # Keyword overlap
+                    {"$gte": [
+                        {"$divide": [
+                            {"$size": {"$setIntersection": ["$$words", {"$literal": new_words}]}},
+                            {"$max": [{"$size": "$$words"}, len(new_words)]},
+                        ]},
+                        FACT_SIMILARITY_THRESHOLD,
+                    ]},
+                    # Exact substring match (either direction)
+                    {"$gte": [{"$indexOfCP": ["$$lower", {"$literal": new_lower.strip()}]}, 0]},
+                    {"$gte": [{"$indexOfCP": [{"$literal": new_lower}, "$$lower"]}, 0]},
+                ]},
+            ]},
+        }},
+    }}
+
+
+def _fact_is_duplicate_expr(entry, facts="$$current"):
+    """
+    True if the new fact `entry` duplicates any fact in the `facts` array.
+    An identical word set is settled by the fingerprint alone; otherwise
+    every stored fact (at most MAX_FACTS) goes through _fact_duplicate_expr.
+    """
+    return {"$or": [
+        {"$in": [entry["fingerprint"], {"$ifNull": [f"{facts}.fingerprint", []]}]},
+        {"$gt": [{"$size": {"$filter": {
+            "input": facts, "as": "f", "cond": _fact_duplicate_expr(entry["fact"], entry["tokens"]),
+        }}}, 0]},
+    ]}
+
 
-    # Flatten structured facts for Emily's prompt
-    raw_facts = user_data.get("facts", [])
+# ══════════════════════════════════════════════
+# USER PROFILE FUNCTIONS
+# ══════════════════════════════════════════════
+def _flatten_facts(raw_facts):
+    """Turns stored facts (dicts or legacy strings) into plain strings."""
     clean_facts = []
     for f in raw_facts:
         if isinstance(f, dict):
@@ -116,16 +402,45 @@ def get_user_profile(user_id):
                 clean_facts.append(fact_text)
         elif f:
             clean_facts.append(str(f))
+    return clean_facts
+
+
+def get_user_profile(user_id):
+    """
+    Fetches user profile with facts flattened into strings for the AI prompt.
+    Served from the profile cache when possible; history is not included.
+    """
+    _check_db()
+    user_id = str(user_id)
 
-    user_data["facts"] = clean_facts
-    return user_data
+    cached = _cache_get_profile(user_id)
+    if cached:
+        return {"_id": user_id, **cached}
+
+    generation = _profile_generation(user_id)
+    try:
+        user_data = users_col.find_one({"_id": user_id}, {"facts": 1, "style": 1, "voice_mode": 1})
+    except PyMongoError as e:
+        logger.error(f"DB error fetching profile for {user_id}: {e}")
+        return {"_id": user_id, "facts": [], "facts_prompt": NEW_FRIEND_FACTS, "style": "friendly"}
+
+    user_data = user_data or {}
+    profile = _cache_put_profile(
+        user_id,
+        user_data.get("facts", []),
+        user_data.get("style", "friendly"),
+        user_data.get("voice_mode", False),
+        generation,
+    )
+    return {"_id": user_id, **profile}
 
 
 def update_user_fact(user_id, fact_text, category="general"):
     """
-    Adds a structured fact with deduplication and cap.
-    - Skips if too similar to an existing fact
-    - Removes oldest fact if at MAX_FACTS limit
+    Adds a structured fact with deduplication and cap, in one atomic update.
+    The pipeline skips the fact if it's too similar to an existing one,
+    otherwise appends it and keeps only the newest MAX_FACTS — all server-side,
+    so concurrent extractions for the same user can't race each other.
     """
     _check_db()
     user_id = str(user_id)
@@ -133,36 +448,25 @@ def update_user_fact(user_id, fact_text, category="general"):
     if not fact_text or not fact_text.strip():
         return
 
+    fact_entry = _fact_entry(fact_text, category)
+
+    pipeline = [{"$set": {"facts": {"$let": {
+        "vars": {"current": {"$ifNull": ["$facts", []]}},
+        "in": {"$cond": [
+            _fact_is_duplicate_expr(fact_entry),
+            "$$current",
+            {"$slice": [{"$concatArrays": ["$$current", [{"$literal": fact_entry}]]}, -MAX_FACTS]},
+        ]},
+    }}}}]
+
     try:
-        # Get existing facts to check for duplicates
-        user_data = users_col.find_one({"_id": user_id}, {"facts": 1})
-        existing_facts = user_data.get("facts", []) if user_data else []
+        result = users_col.update_one({"_id": user_id}, pipeline, upsert=True)
 
-        # Skip duplicates
-        if _fact_is_duplicate(existing_facts, fact_text):
+        if not result.modified_count and result.upserted_id is None:
             logger.info(f"Skipping duplicate fact for {user_id}: {fact_text[:50]}...")
             return
 
-        fact_entry = {
-            "fact": fact_text,
-            "category": category,
-            "added_at": datetime.now(EAT_ZONE),
-        }
-
-        # If at cap, remove the oldest fact first
-        if len(existing_facts) >= MAX_FACTS:
-            users_col.update_one(
-                {"_id": user_id},
-                {"$pop": {"facts": -1}}  # Remove first (oldest) element
-            )
-            logger.info(f"Fact cap reached for {user_id}, removed oldest fact")
-
-        # Add the new fact
-        users_col.update_one(
-            {"_id": user_id},
-            {"$push": {"facts": fact_entry}},
-            upsert=True,
-        )
+        _invalidate_profile(user_id)
         logger.info(f"Fact saved for {user_id}: {fact_text[:60]}")
 
     except PyMongoError as e:
@@ -180,13 +484,135 @@ def set_voice_mode(user_id, enabled):
             {"$set": {"voice_mode": enabled}},
             upsert=True,
         )
+        _cache_update_profile(user_id, voice_mode=enabled)
     except PyMongoError as e:
         logger.error(f"DB error setting voice mode for {user_id}: {e}")
 
 
+# ══════════════════════════════════════════════
+# PORTFOLIO FUNCTIONS
+# ══════════════════════════════════════════════
+# Stored on the user doc as portfolio.<SYMBOL> = {"shares", "cost"} (cost = average
+# price paid per share in the quote's currency, or None if the user never said).
+def get_portfolio(user_id):
+    """Returns {symbol: {"shares", "cost"}} (empty if none)."""
+    _check_db()
+    user_id = str(user_id)
+
+    try:
+        doc = users_col.find_one({"_id": user_id}, {"portfolio": 1})
+        return (doc or {}).get("portfolio") or {}
+    except PyMongoError as e:
+        logger.error(f"DB error loading portfolio for {user_id}: {e}")
+        return {}
+
+
+def add_holding(user_id, symbol, shares, cost=None):
+    """
+    Buys `shares` more of `symbol` in one atomic update. With a `cost`, the
+    stored cost becomes the share-weighted average of old and new lots.
+    """
+    _check_db()
+    user_id = str(user_id)
+    key = f"portfolio.{symbol}"
+    old_shares = {"$ifNull": [f"${key}.shares", 0]}
+    old_cost = {"$ifNull": [f"${key}.cost", None]}
+
+    if cost is None:
+        new_cost = old_cost
+    else:
+        new_cost = {"$cond": [
+            {"$eq": [old_cost, None]},
+            cost,
+            {"$divide": [
+                {"$add": [{"$multiply": [old_shares, old_cost]}, shares * cost]},
+                {"$add": [old_shares, shares]},
+            ]},
+        ]}
+
+    try:
+        users_col.update_one(
+            {"_id": user_id},
+            [{"$set": {key: {"shares": {"$add": [old_shares, shares]}, "cost": new_cost}}}],
+            upsert=True,
+        )
+    except PyMongoError as e:
+        logger.error(f"DB error adding {symbol} for {user_id}: {e}")
+
+
+def remove_holding(user_id, symbol, shares=None):
+    """
+    Sells `shares` of `symbol` (all of it if None). Positions at zero are dropped.
+    Returns the shares held before the sale, or None if the user doesn't hold
+    `symbol`. Selling more than is held changes nothing (the return says how many).
+    """
+    _check_db()
+    user_id = str(user_id)
+    key = f"portfolio.{symbol}"
+    projection = {f"{key}.shares": 1}
+
+    def held_shares(doc):
+        return doc["portfolio"][symbol].get("shares", 0) if doc else None
+
+    try:
+        if shares is None:
+            doc = users_col.find_one_and_update(
+                {"_id": user_id, key: {"$exists": True}}, {"$unset": {key: ""}}, projection=projection
+            )
+            return held_shares(doc)
+        doc = users_col.find_one_and_update(
+            {"_id": user_id, f"{key}.shares": {"$gte": shares - 1e-9}},
+            {"$inc": {f"{key}.shares": -shares}},
+            projection=projection,
+        )
+        if doc is None:  # Not held, or not that many
+            return held_shares(users_col.find_one({"_id": user_id, key: {"$exists": True}}, projection))
+        users_col.update_one({"_id": user_id, f"{key}.shares": {"$lte": 1e-9}}, {"$unset": {key: ""}})
+        return held_shares(doc)
+    except PyMongoError as e:
+        logger.error(f"DB error removing {symbol} for {user_id}: {e}")
+        return None
+
+
+def clear_portfolio(user_id):
+    _check_db()
+    user_id = str(user_id)
+
+    try:
+        users_col.update_one({"_id": user_id}, {"$unset": {"portfolio": ""}})
+    except PyMongoError as e:
+        logger.error(f"DB error clearing portfolio for {user_id}: {e}")
+
+
 # ══════════════════════════════════════════════
 # CHAT HISTORY FUNCTIONS
 # ══════════════════════════════════════════════
+def _append_history(user_id, new_messages):
+    """
+    Appends messages and keeps the newest MAX_HISTORY in one atomic update.
+    Messages pushed out of the window move to `summary_backlog` instead of
+    being dropped, so the summarizer can fold them into `summary` later.
+    """
+    all_messages = {"$concatArrays": [{"$ifNull": ["$history", []]}, {"$literal": new_messages}]}
+    overflow = {"$subtract": [{"$size": "$_all"}, MAX_HISTORY]}
+    evicted = {"$cond": [{"$gt": [overflow, 0]}, {"$slice": ["$_all", overflow]}, []]}
+    backlog = {"$slice": [
+        {"$concatArrays": [{"$ifNull": ["$summary_backlog", []]}, evicted]},
+        -MAX_SUMMARY_BACKLOG,
+    ]}
+
+    users_col.update_one(
+        {"_id": user_id},
+        [
+            {"$set": {"_all": all_messages}},
+            {"$set": {"history": {"$slice": ["$_all", -MAX_HISTORY]}, "summary_backlog": backlog}},
+            {"$set": {"summary_pending": {"$gt": [{"$size": "$summary_backlog"}, 0]}}},
+            {"$project": {"_all": 0}},
+        ],
+        upsert=True,
+    )
+
+
 def add_message_to_history(user_id, role, message_parts):
     """Saves a message to conversation history (capped at MAX_HISTORY)."""
     _check_db()
@@ -199,15 +625,28 @@ def add_message_to_history(user_id, role, message_parts):
     }
 
     try:
-        users_col.update_one(
-            {"_id": user_id},
-            {"$push": {"history": {"$each": [new_message], "$slice": -MAX_HISTORY}}},
-            upsert=True,
-        )
+        _append_history(user_id, [new_message])
     except PyMongoError as e:
         logger.error(f"DB error saving history for {user_id}: {e}")
 
 
+def save_exchange(user_id, user_parts, model_parts):
+    """Saves a user turn and the model's reply in a single capped update."""
+    _check_db()
+    user_id = str(user_id)
+
+    now = datetime.now(EAT_ZONE)
+    new_messages = [
+        {"role": "user", "parts": user_parts, "timestamp": now},
+        {"role": "model", "parts": model_parts, "timestamp": now},
+    ]
+
+    try:
+        _append_history(user_id, new_messages)
+    except PyMongoError as e:
+        logger.error(f"DB error saving exchange for {user_id}: {e}")
+
+
 def get_chat_history(user_id):
     """Retrieves recent chat messages. Returns a new list (safe to modify)."""
     _check_db()
@@ -224,6 +663,41 @@ def get_chat_history(user_id):
     return []
 
 
+def get_conversation_context(user_id):
+    """
+    Loads everything a reply needs (facts, style, voice mode, summary, history)
+    with one projected read instead of separate profile + history lookups.
+    On a profile-cache hit only the history is read.
+    """
+    _check_db()
+    user_id = str(user_id)
+
+    cached = _cache_get_profile(user_id)
+    projection = {"history": 1, "summary": 1}
+    if not cached:
+        projection.update({"facts": 1, "style": 1, "voice_mode": 1})
+        generation = _profile_generation(user_id)
+
+    try:
+        data = users_col.find_one({"_id": user_id}, projection)
+    except PyMongoError as e:
+        logger.error(f"DB error fetching context for {user_id}: {e}")
+        profile = cached or {"facts": [], "facts_prompt": NEW_FRIEND_FACTS, "style": "friendly", "voice_mode": False}
+        return {"_id": user_id, **profile, "summary": "", "history": []}
+
+    data = data or {}
+    profile = cached or _cache_put_profile(
+        user_id,
+        data.get("facts", []),
+        data.get("style", "friendly"),
+        data.get("voice_mode", False),
+        generation,
+    )
+    # Fresh copies so callers can append without side effects
+    history = [{"role": msg["role"], "parts": msg["parts"]} for msg in data.get("history", [])]
+    return {"_id": user_id, **profile, "summary": data.get("summary", ""), "history": history}
+
+
 def clear_chat_history(user_id):
     """Clears all chat history for a user (useful for !reset command)."""
     _check_db()
@@ -232,8 +706,9 @@ def clear_chat_history(user_id):
     try:
         users_col.update_one(
             {"_id": user_id},
-            {"$set": {"history": []}}
+            {"$set": {"history": [], "summary": "", "summary_backlog": [], "summary_pending": False}}
         )
+        # History isn't part of the cached profile, so nothing to invalidate
         logger.info(f"History cleared for {user_id}")
     except PyMongoError as e:
         logger.error(f"DB error clearing history for {user_id}: {e}")
@@ -249,11 +724,188 @@ def clear_user_facts(user_id):
             {"_id": user_id},
             {"$set": {"facts": []}}
         )
+        _cache_update_profile(user_id, facts=(), facts_prompt=NEW_FRIEND_FACTS, fact_index=())
         logger.info(f"Facts cleared for {user_id}")
     except PyMongoError as e:
         logger.error(f"DB error clearing facts for {user_id}: {e}")
 
 
+# ══════════════════════════════════════════════
+# CONVERSATION SUMMARY FUNCTIONS
+# ══════════════════════════════════════════════
+def get_pending_summaries(limit=10):
+    """
+    Users with evicted messages waiting to be summarized (oldest-first backlog).
+    Users whose last pass failed come first, so they get retried on their own.
+    """
+    if users_col is None:
+        return []
+
+    try:
+        return list(users_col.find(
+            {"summary_pending": True},
+            {"summary": 1, "summary_backlog": 1, "summary_attempts": 1},
+        ).sort("summary_attempts", DESCENDING).limit(limit))
+    except PyMongoError as e:
+        logger.error(f"DB error fetching pending summaries: {e}")
+        return []
+
+
+def _backlog_without(consumed):
+    """
+    The backlog minus the `consumed` messages, matched by value rather than
+    position: once the backlog is at MAX_SUMMARY_BACKLOG new evictions push
+    old entries off the front, so positions shift while the summarizer runs.
+    """
+    return {"$filter": {
+        "input": {"$ifNull": ["$summary_backlog", []]},
+        "as": "m",
+        "cond": {"$not": [{"$in": ["$$m", {"$literal": consumed}]}]},
+    }}
+
+
+_SET_SUMMARY_PENDING = {"$set": {"summary_pending": {"$gt": [{"$size": "$summary_backlog"}, 0]}}}
+
+
+def apply_conversation_summary(user_id, summary, consumed):
+    """
+    Stores a new rolling summary and removes the `consumed` backlog messages
+    (as read by get_pending_summaries) it covers. Messages evicted while the
+    summarizer was running stay queued.
+    """
+    if users_col is None:
+        return
+
+    try:
+        users_col.update_one(
+            {"_id": str(user_id)},
+            [
+                {"$set": {
+                    "summary": {"$literal": summary},
+                    "summary_updated_at": datetime.now(EAT_ZONE),
+                    "summary_backlog": _backlog_without(consumed),
+                    "summary_attempts": 0,
+                }},
+                _SET_SUMMARY_PENDING,
+            ],
+        )
+    except PyMongoError as e:
+        logger.error(f"DB error saving summary for {user_id}: {e}")
+
+
+def record_summary_failure(user_id, consumed):
+    """
+    Counts a summarizer pass that failed on `consumed`. After SUMMARY_MAX_ATTEMPTS
+    those messages are dropped (as they were before summaries existed) so one
+    batch the model can't handle doesn't block the user's summary for good.
+    """
+    if users_col is None:
+        return
+
+    gave_up = {"$gte": ["$summary_attempts", SUMMARY_MAX_ATTEMPTS]}
+    try:
+        users_col.update_one(
+            {"_id": str(user_id)},
+            [
+                {"$set": {"summary_attempts": {"$add": [{"$ifNull": ["$summary_attempts", 0]}, 1]}}},
+                {"$set": {
+                    "summary_backlog": {"$cond": [gave_up, _backlog_without(consumed), "$summary_backlog"]},
+                    "summary_attempts": {"$cond": [gave_up, 0, "$summary_attempts"]},
+                }},
+                _SET_SUMMARY_PENDING,
+            ],
+        )
+    except PyMongoError as e:
+        logger.error(f"DB error recording summary failure for {user_id}: {e}")
+
+
+# ══════════════════════════════════════════════
+# FACT EXTRACTION QUEUE (survives restarts)
+# ══════════════════════════════════════════════
+def enqueue_fact_extraction(user_id, message_text):
+    """Queues a user message for background fact extraction."""
+    if extractions_col is None:
+        return
+
+    try:
+        extractions_col.insert_one({
+            "user_id": str(user_id),
+            "text": message_text,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": datetime.now(EAT_ZONE),
+        })
+    except PyMongoError as e:
+        logger.error(f"DB error queueing fact extraction for {user_id}: {e}")
+
+
+def claim_fact_extractions(limit=10):
+    """
+    Claims up to `limit` queued extractions (oldest first) for this worker.
+    Claims left behind by a crashed worker are picked up again after
+    EXTRACTION_CLAIM_TIMEOUT, until they've used EXTRACTION_MAX_ATTEMPTS;
+    then they're marked failed, as release_fact_extractions would have.
+    """
+    if extractions_col is None:
+        return []
+
+    now = datetime.now(EAT_ZONE)
+    stale = {"status": "processing", "claimed_at": {"$lt": now - timedelta(seconds=EXTRACTION_CLAIM_TIMEOUT)}}
+    claimable = {"$or": [
+        {"status": "pending"},
+        {**stale, "attempts": {"$lt": EXTRACTION_MAX_ATTEMPTS}},
+    ]}
+
+    try:
+        # A message that keeps crashing the worker mustn't be retried forever
+        extractions_col.update_many(
+            {**stale, "attempts": {"$gte": EXTRACTION_MAX_ATTEMPTS}},
+            {"$set": {"status": "failed"}, "$unset": {"claim": ""}},
+        )
+        ids = [doc["_id"] for doc in extractions_col.find(claimable, {"_id": 1}).sort("created_at", ASCENDING).limit(limit)]
+        if not ids:
+            return []
+        claim = uuid.uuid4().hex
+        extractions_col.update_many(
+            {"_id": {"$in": ids}, **claimable},
+            {"$set": {"status": "processing", "claim": claim, "claimed_at": now}, "$inc": {"attempts": 1}},
+        )
+        return list(extractions_col.find({"claim": claim}))
+    except PyMongoError as e:
+        logger.error(f"DB error claiming fact extractions: {e}")
+        return []
+
+
+def complete_fact_extractions(extraction_ids):
+    """Removes finished extractions from the queue."""
+    if extractions_col is None or not extraction_ids:
+        return
+
+    try:
+        extractions_col.delete_many({"_id": {"$in": list(extraction_ids)}})
+    except PyMongoError as e:
+        logger.error(f"DB error completing fact extractions: {e}")
+
+
+def release_fact_extractions(extraction_ids):
+    """Puts failed extractions back in the queue, or marks them failed after too many tries."""
+    if extractions_col is None or not extraction_ids:
+        return
+
+    try:
+        ids = list(extraction_ids)
+        extractions_col.update_many(
+            {"_id": {"$in": ids}, "attempts": {"$gte": EXTRACTION_MAX_ATTEMPTS}},
+            {"$set": {"status": "failed"}, "$unset": {"claim": ""}},
+        )
+        extractions_col.update_many(
+            {"_id": {"$in": ids}, "status": "processing"},
+            {"$set": {"status": "pending"}, "$unset": {"claim": ""}},
+        )
+    except PyMongoError as e:
+        logger.error(f"DB error releasing fact extractions: {e}")
+
+
 # ══════════════════════════════════════════════
 # REMINDER FUNCTIONS
 # ══════════════════════════════════════════════
@@ -315,4 +967,237 @@ def delete_reminder(reminder_id):
     try:
         reminders_col.delete_one({"_id": reminder_id})
     except PyMongoError as e:
-        logger.error(f"DB error deleting reminder: {e}")
\ No newline at end of file
+        logger.error(f"DB error deleting reminder: {e}")
+
+
+# ══════════════════════════════════════════════
+# PRICE ALERT FUNCTIONS
+# ══════════════════════════════════════════════
+def add_price_alert(user_id, channel_id, symbol, direction, target):
+    """Saves a pending alert ("above"/"below" target). False if the user is at the limit."""
+    _check_db()
+    user_id = str(user_id)
+
+    try:
+        if alerts_col.count_documents({"user_id": user_id, "status": "pending"}) >= MAX_ALERTS_PER_USER:
+            return False
+        alerts_col.insert_one({
+            "user_id": user_id,
+            "channel_id": str(channel_id),
+            "symbol": symbol,
+            "direction": direction,
+            "target": float(target),
+            "status": "pending",
+            "created_at": datetime.now(EAT_ZONE),
+        })
+        return True
+    except PyMongoError as e:
+        logger.error(f"DB error adding price alert: {e}")
+        return False
+
+
+def get_watched_symbols():
+    """Distinct symbols with pending alerts — what the scheduler has to poll."""
+    if alerts_col is None:
+        return []
+
+    try:
+        return alerts_col.distinct("symbol", {"status": "pending"})
+    except PyMongoError as e:
+        logger.error(f"DB error fetching watched symbols: {e}")
+        return []
+
+
+def get_triggered_alerts(prices):
+    """Pending alerts crossed by {symbol: price}, found in one query."""
+    if alerts_col is None or not prices:
+        return []
+
+    clauses = [
+        {"symbol": symbol, "$or": [
+            {"direction": "above", "target": {"$lte": price}},
+            {"direction": "below", "target": {"$gte": price}},
+        ]}
+        for symbol, price in prices.items()
+    ]
+    try:
+        return list(alerts_col.find({"status": "pending", "$or": clauses}))
+    except PyMongoError as e:
+        logger.error(f"DB error fetching triggered alerts: {e}")
+        return []
+
+
+def mark_alert_triggered(alert_id, price):
+    """Claims a triggered alert. Returns False if another pass already fired it."""
+    if alerts_col is None:
+        return False
+
+    try:
+        result = alerts_col.update_one(
+            {"_id": alert_id, "status": "pending"},
+            {"$set": {
+                "status": "triggered",
+                "triggered_price": price,
+                "triggered_at": datetime.now(EAT_ZONE),
+            }}
+        )
+        return result.modified_count == 1
+    except PyMongoError as e:
+        logger.error(f"DB error marking alert triggered: {e}")
+        return False
+
+
+def get_user_alerts(user_id):
+    """A user's pending alerts, oldest first."""
+    if alerts_col is None:
+        return []
+
+    try:
+        return list(alerts_col.find({"user_id": str(user_id), "status": "pending"}).sort("created_at", ASCENDING))
+    except PyMongoError as e:
+        logger.error(f"DB error fetching alerts for {user_id}: {e}")
+        return []
+
+
+def cancel_price_alerts(user_id, symbol=None):
+    """Cancels a user's pending alerts (for one symbol, or all). Returns how many."""
+    if alerts_col is None:
+        return 0
+
+    query = {"user_id": str(user_id), "status": "pending"}
+    if symbol:
+        query["symbol"] = symbol
+    try:
+        return alerts_col.update_many(query, {"$set": {"status": "cancelled"}}).modified_count
+    except PyMongoError as e:
+        logger.error(f"DB error cancelling alerts for {user_id}: {e}")
+        return 0
+
+
+# ══════════════════════════════════════════════
+# ASYNC API (for the Discord event loop)
+# ══════════════════════════════════════════════
+async def _run_db(func, *args, **kwargs):
+    """Run a blocking DB function on the bounded Mongo executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, partial(func, *args, **kwargs))
+
+
+async def get_user_profile_async(user_id):
+    return await _run_db(get_user_profile, user_id)
+
+
+async def update_user_fact_async(user_id, fact_text, category="general"):
+    return await _run_db(update_user_fact, user_id, fact_text, category)
+
+
+async def set_voice_mode_async(user_id, enabled):
+    return await _run_db(set_voice_mode, user_id, enabled)
+
+
+async def get_portfolio_async(user_id):
+    return await _run_db(get_portfolio, user_id)
+
+
+async def add_holding_async(user_id, symbol, shares, cost=None):
+    return await _run_db(add_holding, user_id, symbol, shares, cost)
+
+
+async def remove_holding_async(user_id, symbol, shares=None):
+    return await _run_db(remove_holding, user_id, symbol, shares)
+
+
+async def clear_portfolio_async(user_id):
+    return await _run_db(clear_portfolio, user_id)
+
+
+async def add_message_to_history_async(user_id, role, message_parts):
+    return await _run_db(add_message_to_history, user_id, role, message_parts)
+
+
+async def save_exchange_async(user_id, user_parts, model_parts):
+    return await _run_db(save_exchange, user_id, user_parts, model_parts)
+
+
+async def get_conversation_context_async(user_id):
+    return await _run_db(get_conversation_context, user_id)
+
+
+async def get_chat_history_async(user_id):
+    return await _run_db(get_chat_history, user_id)
+
+
+async def clear_chat_history_async(user_id):
+    return await _run_db(clear_chat_history, user_id)
+
+
+async def clear_user_facts_async(user_id):
+    return await _run_db(clear_user_facts, user_id)
+
+
+async def get_pending_summaries_async(limit=10):
+    return await _run_db(get_pending_summaries, limit)
+
+
+async def apply_conversation_summary_async(user_id, summary, consumed):
+    return await _run_db(apply_conversation_summary, user_id, summary, consumed)
+
+
+async def record_summary_failure_async(user_id, consumed):
+    return await _run_db(record_summary_failure, user_id, consumed)
+
+
+async def enqueue_fact_extraction_async(user_id, message_text):
+    return await _run_db(enqueue_fact_extraction, user_id, message_text)
+
+
+async def claim_fact_extractions_async(limit=10):
+    return await _run_db(claim_fact_extractions, limit)
+
+
+async def complete_fact_extractions_async(extraction_ids):
+    return await _run_db(complete_fact_extractions, extraction_ids)
+
+
+async def release_fact_extractions_async(extraction_ids):
+    return await _run_db(release_fact_extractions, extraction_ids)
+
+
+async def add_reminder_async(user_id, channel_id, remind_time, reminder_text):
+    return await _run_db(add_reminder, user_id, channel_id, remind_time, reminder_text)
+
+
+async def get_due_reminders_async():
+    return await _run_db(get_due_reminders)
+
+
+async def mark_reminder_sent_async(reminder_id):
+    return await _run_db(mark_reminder_sent, reminder_id)
+
+
+async def delete_reminder_async(reminder_id):
+    return await _run_db(delete_reminder, reminder_id)
+
+
+async def add_price_alert_async(user_id, channel_id, symbol, direction, target):
+    return await _run_db(add_price_alert, user_id, channel_id, symbol, direction, target)
+
+
+async def get_watched_symbols_async():
+    return await _run_db(get_watched_symbols)
+
+
+async def get_triggered_alerts_async(prices):
+    return await _run_db(get_triggered_alerts, prices)
+
+
+async def mark_alert_triggered_async(alert_id, price):
+    return await _run_db(mark_alert_triggered, alert_id, price)
+
+
+async def get_user_alerts_async(user_id):
+    return await _run_db(get_user_alerts, user_id)
+
+
+async def cancel_price_alerts_async(user_id, symbol=None):
+    return await _run_db(cancel_price_alerts, user_id, symbol)
@@ -0,0 +1,106 @@
+import numpy as np
+from finance_tools import get_quotes, get_usd_kes_rate
+
+
+def value_portfolio(holdings):
+    """
+    Values {symbol: {"shares", "cost"}} in KES. One batched quote pass, then
+    every figure is computed over whole columns at once.
+    Returns None for an empty portfolio.
+    """
+    if not holdings:
+        return None
+
+    symbols = list(holdings)
+    quotes = get_quotes(symbols)
+    priced = [s for s in symbols if quotes[s][2]]
+    missing = [s for s in symbols if not quotes[s][2]]
+    if not priced:
+        return {"positions": [], "missing": missing}
+
+    results = [quotes[s][2] for s in priced]
+    shares = np.array([holdings[s]["shares"] for s in priced], dtype=np.float64)
+    price = np.array([r["price"] for r in results], dtype=np.float64)
+    change = np.array([r.get("change") or 0.0 for r in results], dtype=np.float64)
+    cost = np.array([holdings[s].get("cost") or np.nan for s in priced], dtype=np.float64)
+    is_usd = np.array([r.get("currency") == "USD" for r in results])
+
+    usd_kes = get_usd_kes_rate() if is_usd.any() else None
+    fx = np.where(is_usd, usd_kes or 1.0, 1.0)
+
+    value = shares * price * fx
+    day_pnl = shares * change * fx
+    total = value.sum()
+    allocation = value / total if total else np.zeros_like(value)
+    previous = total - day_pnl.sum()
+
+    has_cost = ~np.isnan(cost)
+    invested = (shares * cost * fx)[has_cost].sum()
+    unrealized = (value[has_cost].sum() - invested) if has_cost.any() else None
+
+    order = np.argsort(-value)
+    return {
+        "total": float(total),
+        "day_pnl": float(day_pnl.sum()),
+        "day_pnl_pct": float(day_pnl.sum() / previous * 100) if previous else 0.0,
+        "unrealized": float(unrealized) if unrealized is not None else None,
+        "unrealized_pct": float(unrealized / invested * 100) if unrealized is not None and invested else None,
+        "usd_exposure_pct": float(value[is_usd].sum() / total * 100) if total else 0.0,
+        "usd_kes": usd_kes,
+        "positions": [
+            {
+                "symbol": quotes[priced[i]][0],
+                "shares": float(shares[i]),
+                "price": float(price[i]),
+                "currency": results[i].get("currency", "KES"),
+                "value": float(value[i]),
+                "allocation_pct": float(allocation[i] * 100),
+                "change": float(change[i]),
+            }
+            for i in order
+        ],
+        "missing": missing,
+    }
+
+
+def _fmt_shares(shares):
+    return f"{shares:,.0f}" if shares == int(shares) else f"{shares:,.4f}".rstrip("0")
+
+
+def format_portfolio(summary):
+    """Discord message for a value_portfolio() result."""
+    if not summary:
+        return (
+            "💼 You haven't told me what you hold yet! Add positions with "
+            "`!portfolio add SCOM 100` (optionally with the price you paid: `!portfolio add SCOM 100 16.50`)."
+        )
+    if not summary["positions"]:
+        return f"*(Manze, I couldn't get prices for {', '.join(summary['missing'])} right now. Try again in a bit.)*"
+
+    def signed(x):
+        return f"{'+' if x >= 0 else ''}{x:,.2f}"
+
+    arrow = "🟢" if summary["day_pnl"] >= 0 else "🔴"
+    lines = [
+        f"💼 **Your portfolio — KES {summary['total']:,.2f}**",
+        f"{arrow} Today: {signed(summary['day_pnl'])} KES ({signed(summary['day_pnl_pct'])}%)",
+    ]
+    if summary["unrealized"] is not None:
+        pct = f" ({signed(summary['unrealized_pct'])}%)" if summary["unrealized_pct"] is not None else ""
+        lines.append(f"📈 Gain vs. cost: {signed(summary['unrealized'])} KES{pct}")
+    exposure = f"**Exposure:** KES {100 - summary['usd_exposure_pct']:.0f}% · USD {summary['usd_exposure_pct']:.0f}%"
+    if summary["usd_kes"]:
+        exposure += f" (USD/KES {summary['usd_kes']:,.2f})"
+    lines.append(exposure)
+    lines.append("")
+
+    for p in summary["positions"]:
+        dot = "🟢" if p["change"] >= 0 else "🔴"
+        lines.append(
+            f"{dot} **{p['symbol']}** {_fmt_shares(p['shares'])} × {p['price']:,.2f} {p['currency']}"
+            f" = KES {p['value']:,.2f} ({p['allocation_pct']:.1f}%)"
+        )
+    if summary["missing"]:
+        lines.append(f"*(No price right now for {', '.join(summary['missing'])}.)*")
+    lines.append("\n_Not financial advice — do your own research too._")
+    return "\n".join(lines)
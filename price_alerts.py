@@ -0,0 +1,154 @@
+import os
+import re
+import time
+import logging
+import asyncio
+from datetime import datetime
+import pytz
+from finance_tools import get_quote, get_quotes, us_market_is_open, ALPHA_VANTAGE_PER_DAY
+from tickers import find_tickers, lookup, resolve
+from memory import (
+    add_price_alert_async, get_watched_symbols_async, get_triggered_alerts_async,
+    mark_alert_triggered_async,
+)
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+ALERT_POLL_INTERVAL = 60          # Seconds between passes; NSE quotes are cached this long anyway
+ALERT_GLOBAL_INTERVAL = 30 * 60   # Floor between polls of one non-NSE symbol
+ALERT_AV_RESERVE = int(os.getenv("ALERT_AV_RESERVE", "15"))  # Alpha Vantage calls a day kept for users' own quotes
+US_SESSION_SECONDS = 6.5 * 3600   # 09:30-16:00 ET; US stocks are only polled then
+
+# "tell me when SCOM crosses 20", "alert me if safaricom drops below 15.5", "ping me when KCB hits KES 40"
+_ALERT_REQUEST_RE = re.compile(
+    r'\b(?:tell|let|notify|alert|ping|remind)\s+me\s+(?:know\s+)?(?:when|if|once)\s+(?P<subject>.+?)\s+'
+    r'(?:(?P<cross>cross(?:es)?|hits?|reach(?:es)?|touch(?:es)?|gets?\s+to)'
+    r'|(?:goes|rises|climbs|jumps|is|gets|moves)\s+(?P<up>above|over|past)'
+    r'|(?:goes|drops|falls|dips|sinks|is|gets|moves)\s+(?P<down>below|under|beneath)'
+    r'|(?P<down2>drops|falls|dips)\s+to)'
+    r'\s+(?:KES|KSH|USD|Kshs?\.?|\$)?\s*(?P<target>\d[\d,]*(?:\.\d+)?)',
+    re.IGNORECASE,
+)
+
+_last_polled = {}  # symbol -> monotonic time, for the slow lane
+_global_polls = {"day": None, "count": 0}  # Alpha Vantage calls spent on alerts, per UTC day like the quota
+
+
+def parse_alert_request(text):
+    """(subject, direction or None, target) for an alert request, or None. None direction = "crosses"."""
+    match = _ALERT_REQUEST_RE.search(text)
+    if not match:
+        return None
+    if match.group("up"):
+        direction = "above"
+    elif match.group("down") or match.group("down2"):
+        direction = "below"
+    else:
+        direction = None
+    return match.group("subject"), direction, float(match.group("target").replace(",", ""))
+
+
+def resolve_alert_symbol(subject):
+    """Ticker symbol for the thing the user named ("SCOM", "safaricom", "$NVDA"), or None."""
+    found = find_tickers(subject, fuzzy=True, unknown_symbols=True, lenient=True)
+    if found:
+        return found[0].symbol
+    ticker = resolve(subject)
+    return ticker.symbol if ticker else None
+
+
+async def create_alert(user_id, channel_id, subject, direction, target):
+    """Validates and stores an alert. Returns the reply text for the user."""
+    symbol = resolve_alert_symbol(subject)
+    if not symbol:
+        return f"Eish, I don't know which stock \"{subject}\" is. Try the ticker, like SCOM or NVDA."
+
+    base_symbol, _, quote = await asyncio.to_thread(get_quote, symbol)
+    current = quote["price"] if quote else None
+    if direction is None:
+        if current is None:
+            return f"I can't get a price for {base_symbol} right now, so I can't tell which way to watch. Try `!alert {base_symbol} above {target:g}`."
+        direction = "above" if target > current else "below"
+    if current is not None and (current >= target if direction == "above" else current <= target):
+        return f"{base_symbol} is already at {current:,.2f} — that's {direction} {target:,.2f}!"
+
+    if not await add_price_alert_async(user_id, channel_id, base_symbol, direction, target):
+        return "You've got the max number of alerts running. Cancel some with `!unalert SYMBOL` first."
+    now = f" (now {current:,.2f} {quote.get('currency', 'KES')})" if current is not None else ""
+    return f"🔔 Sawa! I'll ping you here when **{base_symbol}** goes {direction} {target:,.2f}{now}."
+
+
+def _exchange(symbol):
+    ticker = lookup(symbol)
+    if ticker:
+        return ticker.exchange
+    return "CRYPTO" if symbol.endswith("-USD") else "US"
+
+
+def _alert_budget():
+    """Alpha Vantage calls a day alert polling may use."""
+    return max(0, ALPHA_VANTAGE_PER_DAY - ALERT_AV_RESERVE)
+
+
+def _global_poll_interval(symbol, global_count):
+    """
+    Seconds between polls of one non-NSE symbol. Each poll is an Alpha Vantage
+    call (global quotes are only cached QUOTE_TTL_GLOBAL), so the watched
+    symbols split the day's alert budget, spread over the hours each trades.
+    """
+    calls_each = max(1, _alert_budget() // global_count)
+    trading_seconds = 24 * 3600 if _exchange(symbol) == "CRYPTO" else US_SESSION_SECONDS
+    return max(ALERT_GLOBAL_INTERVAL, trading_seconds / calls_each)
+
+
+async def check_price_alerts():
+    """
+    One polling pass: each watched symbol is quoted once (however many alerts
+    watch it), then a single query finds every alert those prices crossed.
+    Returns [(alert, price), ...] for alerts claimed by this pass.
+    """
+    symbols = await get_watched_symbols_async()
+    if not symbols:
+        return []
+
+    now = time.monotonic()
+    today = datetime.now(pytz.utc).date()
+    if _global_polls["day"] != today:
+        _global_polls.update(day=today, count=0)
+    us_open = us_market_is_open()
+    due = [s for s in symbols if _exchange(s) == "NSE"]
+    global_symbols = [s for s in symbols if s not in due]
+    for symbol in sorted(global_symbols, key=lambda s: _last_polled.get(s, 0)):  # Longest-waiting first
+        if not (us_open or _exchange(symbol) == "CRYPTO"):
+            continue  # Closed: the price can't cross anything
+        if _global_polls["count"] >= _alert_budget():
+            break  # Leave the rest of the quota for users' own questions
+        if now - _last_polled.get(symbol, 0) >= _global_poll_interval(symbol, len(global_symbols)):
+            due.append(symbol)
+            _last_polled[symbol] = now
+            _global_polls["count"] += 1
+
+    quotes = await asyncio.to_thread(get_quotes, due)
+    prices = {symbol: q[2]["price"] for symbol, q in quotes.items() if q[2]}
+    fired = []
+    for alert in await get_triggered_alerts_async(prices):
+        price = prices[alert["symbol"]]
+        if await mark_alert_triggered_async(alert["_id"], price):
+            fired.append((alert, price))
+    return fired
+
+
+async def run_price_alerts(notify):
+    """Background loop: polls watched symbols and hands triggered alerts to `notify(alert, price)`."""
+    logger.info("Price alert scheduler started")
+    while True:
+        try:
+            for alert, price in await check_price_alerts():
+                try:
+                    await notify(alert, price)
+                except Exception as e:
+                    logger.error(f"Price alert delivery failed for {alert['user_id']}: {e}")
+        except Exception as e:
+            logger.error(f"Price alert scheduler error: {e}")
+        await asyncio.sleep(ALERT_POLL_INTERVAL)
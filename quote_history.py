@@ -0,0 +1,109 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+QUOTE_HISTORY_DB = os.getenv("QUOTE_HISTORY_DB", "quote_history.db")
+SAMPLE_SECONDS = 300          # At most one stored price per symbol per 5 minutes
+RETENTION_DAYS = 365
+EAT_OFFSET = 3 * 3600         # Daily closes are cut at Nairobi midnight
+
+_conn = None
+_lock = threading.Lock()      # One connection shared by the quote worker threads
+_last_prune = 0.0
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(QUOTE_HISTORY_DB, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        # Clustered on (symbol, bucket): a symbol's series is one contiguous range scan
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS quotes ("
+            " symbol TEXT NOT NULL, bucket INTEGER NOT NULL, price REAL NOT NULL,"
+            " PRIMARY KEY (symbol, bucket)) WITHOUT ROWID"
+        )
+    return _conn
+
+
+def _prune(conn, now):
+    global _last_prune
+    if now - _last_prune < 86400:
+        return
+    _last_prune = now
+    cutoff = int((now - RETENTION_DAYS * 86400) // SAMPLE_SECONDS)
+    conn.execute("DELETE FROM quotes WHERE bucket < ?", (cutoff,))
+
+
+def record_quotes(rows, ts=None):
+    """Stores [(symbol, price), ...]. A later price in the same bucket replaces the earlier one."""
+    now = ts or time.time()
+    bucket = int(now // SAMPLE_SECONDS)
+    values = [(symbol, bucket, float(price)) for symbol, price in rows if price]
+    if not values:
+        return
+    try:
+        with _lock:
+            conn = _db()
+            conn.executemany("INSERT OR REPLACE INTO quotes VALUES (?, ?, ?)", values)
+            _prune(conn, now)
+            conn.commit()
+    except Exception as e:
+        logger.error(f"Quote history write failed: {e}")
+
+
+def record_quote(symbol, price, ts=None):
+    record_quotes([(symbol, price)], ts)
+
+
+def get_price_history(symbol, days):
+    """(timestamps, prices) as float arrays for the last `days` days, oldest first."""
+    since = int((time.time() - days * 86400) // SAMPLE_SECONDS)
+    with _lock:
+        rows = _db().execute(
+            "SELECT bucket, price FROM quotes WHERE symbol = ? AND bucket >= ? ORDER BY bucket",
+            (symbol, since),
+        ).fetchall()
+    if not rows:
+        return np.empty(0), np.empty(0)
+    data = np.array(rows, dtype=np.float64)
+    return data[:, 0] * SAMPLE_SECONDS, data[:, 1]
+
+
+def price_stats(symbol, days=30):
+    """
+    Change, range, mean and volatility over the stored window, or None if we
+    have never seen the symbol. `since` is the first stored sample, which can
+    be later than `days` ago for newly tracked symbols.
+    """
+    ts, prices = get_price_history(symbol, days)
+    if not len(prices):
+        return None
+
+    # Daily closes = last sample of each Nairobi day
+    day = ((ts + EAT_OFFSET) // 86400).astype(np.int64)
+    closes = prices[np.r_[day[1:] != day[:-1], True]]
+    returns = np.diff(closes) / closes[:-1]
+
+    first, last = prices[0], prices[-1]
+    return {
+        "samples": int(len(prices)),
+        "days_covered": int(len(closes)),
+        "since": float(ts[0]),
+        "first": float(first),
+        "last": float(last),
+        "change": float(last - first),
+        "change_pct": float((last - first) / first * 100) if first else 0.0,
+        "min": float(prices.min()),
+        "max": float(prices.max()),
+        "mean": float(prices.mean()),
+        # Std-dev of day-to-day % moves; needs at least three closes to mean anything
+        "volatility_pct": float(returns.std(ddof=1) * 100) if len(returns) > 1 else None,
+    }
@@ -0,0 +1,126 @@
+"""
+Evaluates the aggregation expressions memory.py builds for its update
+pipelines, so they can be tested without a MongoDB server (mongomock
+doesn't implement most of these operators). Only the operators memory.py
+uses are supported, with MongoDB's semantics where Python's differ — e.g.
+$toLower only folds ASCII and $split takes a literal separator.
+"""
+MISSING = object()
+
+
+def _field(value, path):
+    for key in path:
+        if isinstance(value, list):
+            value = [v for v in (_field(item, [key]) for item in value) if v is not MISSING]
+        elif isinstance(value, dict):
+            value = value.get(key, MISSING)
+        else:
+            return MISSING
+    return value
+
+
+def _ascii_lower(text):
+    return "".join(chr(ord(c) + 32) if "A" <= c <= "Z" else c for c in text)
+
+
+def _type(value):
+    if value is MISSING:
+        return "missing"
+    if value is None:
+        return "null"
+    return {str: "string", bool: "bool", int: "int", float: "double", list: "array", dict: "object"}.get(
+        type(value), type(value).__name__
+    )
+
+
+def evaluate(expr, variables=None, doc=None):
+    variables = variables or {}
+    ev = lambda e: evaluate(e, variables, doc)  # noqa: E731
+
+    if isinstance(expr, str) and expr.startswith("$$"):
+        name, *path = expr[2:].split(".")
+        return _field(variables[name], path)
+    if isinstance(expr, str) and expr.startswith("$"):
+        return _field(doc, expr[1:].split("."))
+    if isinstance(expr, list):
+        return [ev(e) for e in expr]
+    if not isinstance(expr, dict) or not expr or not next(iter(expr)).startswith("$"):
+        if isinstance(expr, dict):
+            return {k: ev(v) for k, v in expr.items()}
+        return expr
+
+    (op, arg), = expr.items()
+    if op == "$literal":
+        return arg
+    if op == "$let":
+        scope = dict(variables)
+        scope.update({k: ev(v) for k, v in arg["vars"].items()})
+        return evaluate(arg["in"], scope, doc)
+    if op == "$filter":
+        out = []
+        for item in ev(arg["input"]):
+            if evaluate(arg["cond"], {**variables, arg.get("as", "this"): item}, doc):
+                out.append(item)
+        return out
+    if op == "$cond":
+        cond, then, otherwise = arg
+        return ev(then) if ev(cond) else ev(otherwise)
+    if op == "$and":
+        return all(ev(a) for a in arg)  # Short-circuits, like the server
+    if op == "$or":
+        return any(ev(a) for a in arg)
+    if op == "$ifNull":
+        for a in arg:
+            value = ev(a)
+            if value is not None and value is not MISSING:
+                return value
+        return None
+    if op == "$trim":
+        return ev(arg["input"]).strip()
+
+    values = ev(arg) if isinstance(arg, list) else [ev(arg)]
+    if op == "$not":
+        return not values[0]
+    if op == "$eq":
+        return values[0] == values[1]
+    if op == "$gt":
+        return values[0] > values[1]
+    if op == "$gte":
+        return values[0] >= values[1]
+    if op == "$type":
+        return _type(values[0])
+    if op == "$toLower":
+        return _ascii_lower(values[0])
+    if op == "$split":
+        return values[0].split(values[1])
+    if op == "$size":
+        return len(values[0])
+    if op == "$add":
+        return sum(values)
+    if op == "$divide":
+        return values[0] / values[1]
+    if op == "$max":
+        return max(values)
+    if op == "$in":
+        return values[0] in values[1]
+    if op == "$setIntersection":
+        return list(set(values[0]).intersection(*values[1:]))
+    if op == "$setDifference":
+        return list(set(values[0]) - set(values[1]))
+    if op == "$indexOfCP":
+        return values[0].find(values[1])
+    raise NotImplementedError(op)
+
+
+def apply_pipeline(pipeline, doc):
+    """Runs an update pipeline of $set/$project stages against a copy of `doc`."""
+    doc = dict(doc)
+    for stage in pipeline:
+        (op, arg), = stage.items()
+        if op == "$set":
+            doc.update({k: evaluate(v, {}, doc) for k, v in arg.items()})
+        elif op == "$project" and not any(arg.values()):
+            doc = {k: v for k, v in doc.items() if k not in arg}
+        else:
+            raise NotImplementedError(op)
+    return doc
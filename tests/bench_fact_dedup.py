@@ -0,0 +1,75 @@
+"""
+Per-insert cost of fact deduplication against a full (MAX_FACTS) profile.
+
+    python -m tests.bench_fact_dedup
+
+Always measures the Python work per insert: the old pairwise word-set scan
+vs. building the new fact's entry and pipeline. With TEST_MONGO_URI set it
+also times update_user_fact end to end, against facts stored in today's
+format and in the legacy format the server has to lowercase and split.
+"""
+import json
+import time
+import timeit
+from pathlib import Path
+
+from tests import stand_in
+import memory
+
+ROUNDS = 2000
+PROFILE = [f["fact"] for f in json.loads(
+    (Path(__file__).parent / "fixtures" / "fact_dedup_corpus.json").read_text(encoding="utf-8")
+)[0]["existing"]]
+NEW_FACT = "Enjoys hiking at Ngong Hills on weekends"
+
+
+def previous_check(existing_facts, new_fact_text):
+    """The Python check update_user_fact ran before the pipeline (after fetching every fact)."""
+    new_words = set(new_fact_text.lower().split())
+    for existing in existing_facts:
+        existing_text = existing.get("fact", "") if isinstance(existing, dict) else str(existing)
+        existing_words = set(existing_text.lower().split())
+        if not existing_words:
+            continue
+        if len(new_words & existing_words) / max(len(new_words), len(existing_words)) >= memory.FACT_SIMILARITY_THRESHOLD:
+            return True
+        if new_fact_text.lower().strip() in existing_text.lower() or \
+           existing_text.lower().strip() in new_fact_text.lower():
+            return True
+    return False
+
+
+def _server_us(facts):
+    samples = []
+    for _ in range(200):
+        memory.users_col.replace_one({"_id": "bench"}, {"_id": "bench", "facts": facts}, upsert=True)
+        started = time.perf_counter()
+        memory.update_user_fact("bench", NEW_FACT)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return samples[len(samples) // 2] * 1e6
+
+
+def run():
+    facts = (PROFILE * 3)[:memory.MAX_FACTS]
+    stored = [{"fact": f} for f in facts]
+    print(f"{len(facts)} stored facts, {ROUNDS} rounds")
+
+    old = timeit.timeit(lambda: previous_check(stored, NEW_FACT), number=ROUNDS) / ROUNDS * 1e6
+    new = timeit.timeit(
+        lambda: memory._fact_is_duplicate_expr(memory._fact_entry(NEW_FACT, "general")), number=ROUNDS
+    ) / ROUNDS * 1e6
+    print(f"python, pairwise scan (old)          {old:8.1f} us/insert  (+ fetching every fact)")
+    print(f"python, entry + pipeline (new)       {new:8.1f} us/insert")
+
+    if not stand_in.REAL_MONGO:
+        print("server timings skipped: set TEST_MONGO_URI to a throwaway MongoDB")
+        return
+    current = [memory._fact_entry(f, "general") for f in facts]
+    print(f"server, facts with tokens/lower      {_server_us(current):8.1f} us/insert (median)")
+    print(f"server, legacy string facts          {_server_us(facts):8.1f} us/insert (median)")
+    memory.users_col.delete_one({"_id": "bench"})
+
+
+if __name__ == "__main__":
+    run()
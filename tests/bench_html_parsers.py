@@ -0,0 +1,90 @@
+"""
+Parse time and memory of the NSE scrapers on the saved pages, per HTML backend.
+
+    python -m tests.bench_html_parsers
+
+"full soup" is tests/reference_scrapers.py: how the scrapers parsed before
+the backends existed, one whole BeautifulSoup html.parser tree per page.
+Memory is how far RSS peaks above its starting point while a fresh process
+parses the board page repeated SCALE times, so selectolax's C-side
+allocations count too (tracemalloc wouldn't see them). Linux only: the peak
+is reset through /proc/self/clear_refs.
+"""
+import importlib.util
+import subprocess
+import sys
+import timeit
+
+import pytest
+
+from tests import stand_in  # noqa: F401  (environment before importing finance_tools)
+import finance_tools
+from tests import reference_scrapers
+from tests.test_html_parsers import BACKENDS, HTML, SCRAPES, scrape
+
+ROUNDS = 50
+SCALE = 20  # A large page, so the parse dominates the process's baseline
+
+
+def _variants():
+    yield "full soup (before)", None, None
+    for backend, features in BACKENDS:
+        if backend == "selectolax" and finance_tools.HTMLParser is None:
+            continue
+        if features == "lxml" and importlib.util.find_spec("lxml") is None:
+            continue
+        label = backend if backend == "selectolax" else f"bs4 strainer ({features})"
+        yield label, backend, features
+
+
+def _use(backend, features):
+    """Selects a backend; None means the reference scrapers. Returns the module to call."""
+    if backend is None:
+        return reference_scrapers
+    finance_tools.HTML_BACKEND = backend
+    finance_tools.BS4_FEATURES = features
+    return finance_tools
+
+
+def _peak_rss_growth_kb(backend, features):
+    out = subprocess.run(
+        [sys.executable, "-m", "tests.bench_html_parsers", "--rss", backend or "", features or ""],
+        capture_output=True, text=True, check=True,
+    )
+    return int(out.stdout.split()[-1])
+
+
+def _status_kb(field):
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(field + ":"))
+
+
+def _child_rss(backend, features):
+    module = _use(backend or None, features or None)
+    page = HTML["afx_board.html"] * SCALE
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")  # Reset the peak (VmHWM) to the current RSS
+    before = _status_kb("VmRSS")
+    module._parse_nse_board(page)
+    print(_status_kb("VmHWM") - before)
+
+
+def run():
+    print(f"{ROUNDS} rounds per page; memory = peak RSS growth parsing the board x{SCALE}")
+    print(f"{'':28}" + "".join(f"{page.removesuffix('.html'):>20}" for _, _, page in SCRAPES) + f"{'memory':>10}")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for label, backend, features in _variants():
+            module = _use(backend, features)
+            times = [
+                timeit.timeit(lambda: scrape(monkeypatch, module, *s), number=ROUNDS) / ROUNDS * 1e3
+                for s in SCRAPES
+            ]
+            memory = _peak_rss_growth_kb(backend, features)
+            print(f"{label:28}" + "".join(f"{t:17.2f} ms" for t in times) + f"{memory:7} KB")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--rss"]:
+        _child_rss(*sys.argv[2:4])
+    else:
+        run()
@@ -0,0 +1,77 @@
+"""
+Event-loop lag while many users chat at once, against a Mongo stand-in with
+a simulated network round trip on every call.
+
+    python -m tests.bench_loop_lag
+
+"blocking" calls memory.py's sync functions straight from the coroutines
+(how the bot used to do it); "async" goes through the executor-backed API.
+"""
+import asyncio
+import logging
+import statistics
+import time
+
+from tests import stand_in
+import memory
+
+DB_LATENCY = 0.02      # Seconds per database call (a nearby Atlas cluster)
+TURNS_PER_USER = 3
+HEARTBEAT = 0.01       # Lag = how late a 10 ms sleep wakes up
+
+
+async def _user(user_id, use_async):
+    for turn in range(TURNS_PER_USER):
+        if use_async:
+            await memory.get_conversation_context_async(user_id)
+        else:
+            memory.get_conversation_context(user_id)
+        await asyncio.sleep(0.05)  # The model "thinking"
+        parts = ([{"text": f"message {turn}"}], [{"text": f"reply {turn}"}])
+        if use_async:
+            await memory.save_exchange_async(user_id, *parts)
+        else:
+            memory.save_exchange(user_id, *parts)
+
+
+async def _heartbeat(lags, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT)
+        lags.append(time.perf_counter() - started - HEARTBEAT)
+
+
+async def run(users, use_async):
+    lags, stop = [], asyncio.Event()
+    beat = asyncio.create_task(_heartbeat(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(_user(str(u), use_async) for u in range(users)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await beat
+    lags.sort()
+    return {
+        "elapsed": elapsed,
+        "p50": statistics.median(lags) * 1000,
+        "p99": lags[int(len(lags) * 0.99) - 1] * 1000 if len(lags) > 1 else lags[0] * 1000,
+        "max": lags[-1] * 1000,
+    }
+
+
+def main():
+    # mongomock can't run the history-capping pipeline; the round trip is what's measured here
+    logging.getLogger("memory").setLevel(logging.CRITICAL)
+    stand_in.reset_memory()
+    memory.users_col = stand_in.SlowCollection(memory.users_col, DB_LATENCY)
+
+    print(f"{TURNS_PER_USER} turns/user, {DB_LATENCY * 1000:.0f} ms per DB call, {memory.MONGO_WORKERS} executor threads")
+    print(f"{'mode':<9} {'users':>5} {'wall s':>7} {'lag p50 ms':>11} {'p99 ms':>8} {'max ms':>8}")
+    for use_async in (False, True):
+        for users in (1, 10, 50):
+            r = asyncio.run(run(users, use_async))
+            mode = "async" if use_async else "blocking"
+            print(f"{mode:<9} {users:>5} {r['elapsed']:>7.2f} {r['p50']:>11.1f} {r['p99']:>8.1f} {r['max']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Per-message cost of routing and stock detection over the routing corpus.
+
+    python -m tests.bench_routing
+"""
+import timeit
+
+from tests import stand_in  # noqa: F401  (environment before importing main)
+import main
+from tests.reference_router import _route_to_model as reference_route
+from tests.test_routing import CORPUS
+
+ROUNDS = 200
+
+
+def per_message_us(func, cases):
+    total = timeit.timeit(lambda: [func(*c) for c in cases], number=ROUNDS)
+    return total / ROUNDS / len(cases) * 1e6
+
+
+def run():
+    cases = [(c["text"], bool(c["attachments"]), c["attachments"]) for c in CORPUS]
+    texts = [(c["text"],) for c in CORPUS]
+    print(f"{len(cases)} corpus messages, {ROUNDS} rounds")
+    print(f"route, uncompiled rule lists  {per_message_us(reference_route, cases):6.1f} us/msg")
+    print(f"route, compiled alternations  {per_message_us(main._route_to_model, cases):6.1f} us/msg")
+    print(f"stock detection               {per_message_us(main._detect_stock_query, texts):6.1f} us/msg")
+
+
+if __name__ == "__main__":
+    run()
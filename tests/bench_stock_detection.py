@@ -0,0 +1,47 @@
+"""
+Accuracy and per-message cost of stock detection on the labeled corpus.
+
+    python -m tests.bench_stock_detection
+
+"before" is tests/reference_stock_detector.py (NAME_TO_TICKER and the
+capture regexes). A true positive is the labeled symbol; naming the wrong
+stock counts as both a false positive and a miss.
+"""
+import timeit
+
+from tests import stand_in  # noqa: F401  (environment before importing main)
+import main
+from tests import reference_stock_detector
+from tests.test_stock_detection import CORPUS
+
+ROUNDS = 200
+
+
+def accuracy(detect):
+    tp = fp = fn = 0
+    for case in CORPUS:
+        got, want = detect(case["text"]), case["symbol"]
+        if got == want:
+            tp += want is not None
+            continue
+        fp += got is not None
+        fn += want is not None
+    return tp / ((tp + fp) or 1), tp / ((tp + fn) or 1), fp
+
+
+def per_message_us(detect):
+    total = timeit.timeit(lambda: [detect(c["text"]) for c in CORPUS], number=ROUNDS)
+    return total / ROUNDS / len(CORPUS) * 1e6
+
+
+def run():
+    labeled = sum(c["symbol"] is not None for c in CORPUS)
+    print(f"{len(CORPUS)} messages ({labeled} about a stock), {ROUNDS} rounds")
+    print(f"{'':10}{'precision':>10}{'recall':>8}{'false +':>9}{'us/msg':>8}")
+    for label, detect in [("before", reference_stock_detector._detect_stock_query), ("after", main._detect_stock_query)]:
+        precision, recall, false_positives = accuracy(detect)
+        print(f"{label:10}{precision:10.2f}{recall:8.2f}{false_positives:9}{per_message_us(detect):8.1f}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,56 @@
+"""
+Prompt size with a rolling summary vs. sending the whole conversation.
+
+    python -m tests.bench_summary [conversations.json]
+
+Each conversation is a list of messages plus the summary of the turns that
+scrolled out of memory.py's MAX_HISTORY window. The default set is
+tests/fixtures/conversations.json; pass an export of real histories in the
+same shape to measure those instead. Sizes use the bot's own per-model
+token estimates, so they track what _pack_history budgets against.
+"""
+import json
+import sys
+from pathlib import Path
+
+from tests import stand_in  # noqa: F401  (environment before importing main)
+import main
+import memory
+
+FIXTURE = Path(__file__).parent / "fixtures" / "conversations.json"
+MODEL = "gemini"
+
+
+def _tokens(messages):
+    return sum(main._estimate_message_tokens(m, MODEL) for m in messages)
+
+
+def _summary_tokens(summary):
+    """Extra context-prompt tokens the summary line adds."""
+    with_summary = main._build_context_prompt("now", "facts", summary)
+    without = main._build_context_prompt("now", "facts")
+    return int((len(with_summary) - len(without)) / main.TOKEN_ESTIMATES[MODEL]["chars_per_token"])
+
+
+def run(path=FIXTURE):
+    conversations = json.loads(Path(path).read_text(encoding="utf-8"))
+    worst_case = _summary_tokens("x" * memory.MAX_SUMMARY_CHARS)
+    print(f"{len(conversations)} conversations, window {memory.MAX_HISTORY} messages, "
+          f"summary cap ~{worst_case} tokens")
+    print(f"{'conversation':24} {'msgs':>5} {'full':>7} {'window+summary':>15} {'reduction':>10}")
+
+    totals = [0, 0]
+    for conv in conversations:
+        messages = conv["messages"]
+        full = _tokens(messages)
+        window = _tokens(main._pack_history(messages[-memory.MAX_HISTORY:], MODEL))
+        summarized = window + (_summary_tokens(conv["summary"]) if len(messages) > memory.MAX_HISTORY else 0)
+        totals[0] += full
+        totals[1] += summarized
+        print(f"{conv['id']:24} {len(messages):5} {full:7} {summarized:15} {1 - summarized / full:10.0%}")
+
+    print(f"{'total':24} {'':5} {totals[0]:7} {totals[1]:15} {1 - totals[1] / totals[0]:10.0%}")
+
+
+if __name__ == "__main__":
+    run(*sys.argv[1:])
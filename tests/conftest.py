@@ -0,0 +1,12 @@
+import pytest
+
+from tests import stand_in
+
+
+@pytest.fixture
+def mongo():
+    """memory.py on a clean database; yields the module."""
+    import memory
+    stand_in.reset_memory()
+    yield memory
+    stand_in.reset_memory()
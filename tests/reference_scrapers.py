@@ -0,0 +1,142 @@
+"""
+The NSE scrapers as they were before the pluggable HTML backends (a full
+BeautifulSoup html.parser tree per page), kept verbatim as the oracle for
+test_html_parsers.py and bench_html_parsers.py.
+"""
+import re
+
+import requests
+from bs4 import BeautifulSoup
+
+from finance_tools import BROWSER_HEADERS, NSE_TICKERS, _parse_signed, logger
+
+
+def _parse_nse_board(html):
+    """Parses the AFX listing table into {SYMBOL: result}. Columns are found by header name."""
+    soup = BeautifulSoup(html, "html.parser")
+    for table in soup.find_all("table"):
+        headers = [th.get_text(strip=True).lower() for th in table.find_all("th")]
+        if "ticker" not in headers or "price" not in headers:
+            continue
+        col = {header: i for i, header in enumerate(headers)}
+
+        board = {}
+        for row in table.find_all("tr"):
+            cells = [td.get_text(strip=True) for td in row.find_all("td")]
+            if len(cells) < len(headers):
+                continue
+            symbol = cells[col["ticker"]].upper()
+            try:
+                price = float(cells[col["price"]].replace(",", ""))
+            except ValueError:
+                continue
+            entry = {
+                "price": price,
+                "currency": "KES",
+                "name": NSE_TICKERS.get(symbol) or (cells[col["name"]] if "name" in col else symbol),
+                "source": "afx-board",
+            }
+            if "change" in col and cells[col["change"]]:
+                try:
+                    change = _parse_signed(cells[col["change"]])
+                    entry["change"] = change
+                    previous = price - change
+                    entry["change_pct"] = change / previous * 100 if previous else 0.0
+                except ValueError:
+                    pass
+            board[symbol] = entry
+        return board
+    return {}
+
+
+def _fetch_nse_from_afx(symbol):
+    """Scrape NSE stock data from afx.kwayisi.org."""
+    try:
+        url = f"https://afx.kwayisi.org/nseke/{symbol.lower()}/"
+        resp = requests.get(url, headers=BROWSER_HEADERS, timeout=10)
+        resp.raise_for_status()
+
+        soup = BeautifulSoup(resp.text, "html.parser")
+
+        rows = soup.find_all("tr")
+        data = {}
+        for row in rows:
+            cells = row.find_all("td")
+            if len(cells) >= 2:
+                key = cells[0].get_text(strip=True).lower()
+                val = cells[1].get_text(strip=True)
+                data[key] = val
+
+        price_str = data.get("last trade", data.get("close", data.get("previous close", "")))
+        if not price_str:
+            header = soup.find("h2")
+            if header:
+                price_match = re.search(r'([\d,]+\.?\d*)', header.get_text())
+                if price_match:
+                    return {
+                        "price": float(price_match.group(1).replace(",", "")),
+                        "currency": "KES",
+                        "name": NSE_TICKERS.get(symbol.upper(), symbol),
+                        "source": "afx",
+                    }
+            return None
+
+        price = float(re.sub(r'[^\d.]', '', price_str))
+        result = {
+            "price": price,
+            "currency": "KES",
+            "name": NSE_TICKERS.get(symbol.upper(), symbol),
+            "source": "afx",
+        }
+
+        change_str = data.get("change", "")
+        if change_str:
+            try:
+                change_val = float(re.sub(r'[^\d.\-]', '', change_str))
+                if "-" in change_str:
+                    change_val = -abs(change_val)
+                result["change"] = change_val
+            except ValueError:
+                pass
+
+        change_pct_str = data.get("% change", data.get("change %", ""))
+        if change_pct_str:
+            try:
+                pct_val = float(re.sub(r'[^\d.\-]', '', change_pct_str))
+                if "-" in change_pct_str:
+                    pct_val = -abs(pct_val)
+                result["change_pct"] = pct_val
+            except ValueError:
+                pass
+
+        return result
+
+    except Exception as e:
+        logger.error(f"AFX scrape failed for {symbol}: {e}")
+        raise  # Lets the circuit breaker see it
+
+
+
+
+def _fetch_nse_from_mystocks(symbol):
+    """Fallback scraper using mystocks.co.ke."""
+    try:
+        url = f"https://live.mystocks.co.ke/price/{symbol.upper()}"
+        resp = requests.get(url, headers=BROWSER_HEADERS, timeout=10)
+        resp.raise_for_status()
+
+        soup = BeautifulSoup(resp.text, "html.parser")
+        price_el = soup.find(class_=re.compile(r"price|last", re.IGNORECASE))
+        if price_el:
+            price_match = re.search(r'([\d,]+\.?\d*)', price_el.get_text())
+            if price_match:
+                return {
+                    "price": float(price_match.group(1).replace(",", "")),
+                    "currency": "KES",
+                    "name": NSE_TICKERS.get(symbol.upper(), symbol),
+                    "source": "mystocks",
+                }
+        return None
+    except Exception as e:
+        logger.error(f"MyStocks scrape failed for {symbol}: {e}")
+        raise  # Lets the circuit breaker see it
@@ -0,0 +1,59 @@
+"""
+The stock detector as it was before tickers.py (NAME_TO_TICKER plus five
+capture regexes), kept verbatim as the baseline for bench_stock_detection.py.
+"""
+import re
+
+# --- TICKER MAP ---
+NAME_TO_TICKER = {
+    "SAFARICOM": "SCOM", "EQUITY": "EQTY", "KCB": "KCB",
+    "COOPERATIVE": "COOP", "COOP": "COOP", "ABSA": "ABSA",
+    "STANBIC": "SBIC", "NCBA": "NCBA", "DTB": "DTB",
+    "DIAMOND TRUST": "DTB", "I&M": "IMH", "IM": "IMH",
+    "HF": "HF", "CIC": "CIC", "BRITAM": "BRIT", "JUBILEE": "JUB",
+    "LIBERTY": "LKN", "KENYA RE": "KNRE", "KENRE": "KNRE",
+    "EABL": "EABL", "BAT": "BAT", "BAMBURI": "BAMB",
+    "KENGEN": "KEGN", "KENYA POWER": "KPLC", "KPLC": "KPLC",
+    "TOTAL": "TOTAL", "AIRTEL": "AIRTEL", "CENTUM": "CTUM",
+    "SASINI": "SASN", "KAKUZI": "KUKZ", "NATION": "NMG",
+    "NATION MEDIA": "NMG", "STANDARD GROUP": "SGL",
+    "MICROSOFT": "MSFT", "APPLE": "AAPL", "GOOGLE": "GOOGL",
+    "ALPHABET": "GOOGL", "TESLA": "TSLA", "AMAZON": "AMZN",
+    "META": "META", "FACEBOOK": "META", "NVIDIA": "NVDA",
+    "NETFLIX": "NFLX", "AMD": "AMD", "INTEL": "INTC",
+    "BITCOIN": "BTC-USD", "ETHEREUM": "ETH-USD",
+}
+
+
+_STOCK_QUERY_RES = [
+    re.compile(p, re.IGNORECASE) for p in (
+        r'(?:current\s+)?(?:price|stock|shares?|value)\s+(?:of\s+|for\s+)?["\']?(\w[\w\s&]*\w?)["\']?',
+        r'["\']?(\w[\w\s&]*\w?)["\']?\s+(?:stock|shares?|price|current price)',
+        r'how\s+(?:is|are|did|has|much)\s+["\']?(\w[\w\s&]*\w?)["\']?\s+(?:stock|shares?|perform|doing|trading|priced)',
+        r'how\s+(?:is|are|did|has)\s+["\']?(\w[\w\s&]*\w?)["\']?\s+(?:on\s+(?:the\s+)?(?:nse|market|exchange))',
+        r'(?:tell\s+me\s+about|check|get|fetch|look\s+up)\s+["\']?(\w[\w\s&]*\w?)["\']?\s+(?:stock|shares?|price)',
+    )
+]
+_DOLLAR_TICKER_RE = re.compile(r'\$(\w{1,6})')
+# Every stock query pattern needs one of these words — skip the regexes otherwise
+_STOCK_QUERY_KEYWORDS = ("price", "stock", "share", "value", "perform", "doing", "trading", "nse", "market", "exchange")
+
+def _detect_stock_query(text):
+    lower = text.lower()
+    if any(k in lower for k in _STOCK_QUERY_KEYWORDS):
+        for pattern in _STOCK_QUERY_RES:
+            match = pattern.search(text)
+            if match:
+                raw = match.group(1).strip().upper()
+                if raw in NAME_TO_TICKER:
+                    return NAME_TO_TICKER[raw]
+                if len(raw) <= 6 and raw.isalpha():
+                    return raw
+                for word in raw.split():
+                    if word in NAME_TO_TICKER:
+                        return NAME_TO_TICKER[word]
+    dollar_match = _DOLLAR_TICKER_RE.search(text.upper())
+    if dollar_match:
+        ticker = dollar_match.group(1)
+        return NAME_TO_TICKER.get(ticker, ticker)
+    return None
@@ -0,0 +1,55 @@
+"""
+Environment for the tests and benchmarks: dummy API keys and an in-process
+MongoDB stand-in (mongomock), installed before any bot module is imported.
+
+mongomock can't evaluate the aggregation-pipeline updates memory.py uses
+(fact dedup, history capping), so tests that need them are skipped unless
+TEST_MONGO_URI points at a real (throwaway!) MongoDB.
+"""
+import os
+import tempfile
+import time
+import mongomock
+import pytest
+
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI")
+REAL_MONGO = bool(TEST_MONGO_URI)
+
+for _key in ("GEMINI_API_KEY", "ANTHROPIC_API_KEY", "ELEVENLABS_API_KEY", "ALPHA_VANTAGE_KEY"):
+    os.environ.setdefault(_key, "test")
+os.environ.setdefault("QUOTE_HISTORY_DB", os.path.join(tempfile.mkdtemp(prefix="emily-tests-"), "quotes.db"))
+
+if REAL_MONGO:
+    os.environ["MONGO_URI"] = TEST_MONGO_URI
+else:
+    os.environ["MONGO_URI"] = "mongodb://localhost:27017"
+    mongomock.patch(servers=(("localhost", 27017),)).start()
+
+requires_real_mongo = pytest.mark.skipif(not REAL_MONGO, reason="needs a real MongoDB; set TEST_MONGO_URI")
+
+
+class SlowCollection:
+    """Wraps a collection so every call first sleeps `latency` seconds, like a network round trip."""
+
+    def __init__(self, collection, latency):
+        self._collection = collection
+        self._latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            time.sleep(self._latency)
+            return attr(*args, **kwargs)
+        return call
+
+
+def reset_memory():
+    """Empties every collection and the profile cache."""
+    import memory
+    for col in (memory.users_col, memory.reminders_col, memory.extractions_col, memory.alerts_col):
+        col.delete_many({})
+    with memory._profile_cache_lock:
+        memory._profile_cache.clear()
@@ -0,0 +1,47 @@
+import json
+from pathlib import Path
+
+import pytest
+
+import memory
+from tests.agg_eval import evaluate
+from tests.stand_in import requires_real_mongo
+
+# New facts checked against stored profiles, labeled with the verdict of the
+# original Python word-set/substring check. Stored facts are plain dicts
+# (saved in today's format), legacy strings, or dicts flagged "legacy"
+# (saved before facts carried tokens).
+CORPUS = json.loads((Path(__file__).parent / "fixtures" / "fact_dedup_corpus.json").read_text(encoding="utf-8"))
+
+
+def _stored(existing):
+    facts = []
+    for f in existing:
+        if isinstance(f, dict) and f.get("legacy"):
+            facts.append({k: v for k, v in f.items() if k != "legacy"})
+        elif isinstance(f, dict):
+            facts.append(memory._fact_entry(f["fact"], "general"))
+        else:
+            facts.append(f)
+    return facts
+
+
+def _ids(case):
+    return f"{case['new'][:30]!r}-{'dup' if case['duplicate'] else 'new'}"
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=_ids)
+def test_dedup_expression_matches_previous_check(case):
+    entry = memory._fact_entry(case["new"], "general")
+    verdict = evaluate(memory._fact_is_duplicate_expr(entry), {"current": _stored(case["existing"])})
+    assert verdict == case["duplicate"]
+
+
+@requires_real_mongo
+@pytest.mark.parametrize("case", CORPUS, ids=_ids)
+def test_update_user_fact_dedups_like_previous_check(mongo, case):
+    facts = _stored(case["existing"])
+    mongo.users_col.insert_one({"_id": "dedup", "facts": facts})
+    mongo.update_user_fact("dedup", case["new"])
+    added = len(mongo.users_col.find_one({"_id": "dedup"})["facts"]) > len(facts)
+    assert added != case["duplicate"]
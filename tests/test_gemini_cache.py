@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors as genai_errors
+
+import main
+
+HISTORY = [{"role": "user", "parts": [{"text": "hi"}]}]
+REPLY = SimpleNamespace(usage_metadata=None, candidates=[])
+
+
+def _error(cls, code, status, message):
+    return cls(code, {"error": {"code": code, "status": status, "message": message}})
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Cached persona 'caches/old'; records generate calls and background deletes."""
+    calls, deleted = [], []
+    failures = []
+
+    async def fake_cache():
+        main._gemini_cache["name"] = "caches/old"
+        return "caches/old"
+
+    async def fake_generate(contents, config, on_text=None):
+        calls.append(config.cached_content)
+        if failures and config.cached_content:
+            raise failures.pop(0)
+        return "hello", REPLY
+
+    async def fake_delete(name):
+        deleted.append(name)
+
+    monkeypatch.setattr(main, "_get_gemini_cache", fake_cache)
+    monkeypatch.setattr(main, "_gemini_generate", fake_generate)
+    monkeypatch.setattr(main, "_delete_gemini_cache", fake_delete)
+    monkeypatch.setitem(main._gemini_cache, "retry_at", 0.0)
+    return SimpleNamespace(calls=calls, deleted=deleted, failures=failures)
+
+
+async def _respond():
+    result = await main._get_gemini_response(HISTORY, "context")
+    await asyncio.sleep(0)  # Let background deletes run
+    return result
+
+
+def test_transient_error_keeps_cache_and_goes_to_fallback(gemini):
+    gemini.failures.append(_error(genai_errors.ServerError, 503, "UNAVAILABLE", "overloaded"))
+    with pytest.raises(genai_errors.ServerError):
+        asyncio.run(_respond())
+    assert gemini.calls == ["caches/old"]  # No uncached re-send
+    assert main._gemini_cache["name"] == "caches/old"
+    assert gemini.deleted == []
+
+
+def test_missing_cache_is_dropped_and_request_resent_uncached(gemini):
+    gemini.failures.append(_error(genai_errors.ClientError, 404, "NOT_FOUND", "CachedContent not found"))
+    assert asyncio.run(_respond())[0] == "hello"
+    assert gemini.calls == ["caches/old", None]
+    assert main._gemini_cache["name"] is None
+    assert gemini.deleted == []  # Already gone server-side
+
+
+def test_invalid_cache_is_dropped_and_deleted(gemini):
+    gemini.failures.append(_error(
+        genai_errors.ClientError, 400, "INVALID_ARGUMENT", "cached_content is not valid for this model",
+    ))
+    assert asyncio.run(_respond())[0] == "hello"
+    assert gemini.calls == ["caches/old", None]
+    assert gemini.deleted == ["caches/old"]
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+import main
+
+ROUTE = "General chat (default)"
+
+
+@pytest.fixture
+def models(monkeypatch):
+    """Scripted Gemini/Claude: each call pops the next step list for that model."""
+    script = {"gemini": [], "claude": []}
+    calls = []
+
+    def fake(model):
+        async def respond(conversation_history, context_prompt, on_text=None):
+            calls.append(model)
+            for step in script[model].pop(0):
+                if isinstance(step, Exception):
+                    raise step
+                if isinstance(step, float):
+                    await asyncio.sleep(step)
+                else:
+                    await on_text(step)
+            return f"{model} reply", ""
+        return respond
+
+    monkeypatch.setattr(main, "_get_gemini_response", fake("gemini"))
+    monkeypatch.setattr(main, "_get_claude_response", fake("claude"))
+    monkeypatch.setattr(main, "HEDGE_REQUESTS", True)
+    monkeypatch.setattr(main, "_hedge_delay", lambda model: 0.05)
+    # Keep the scripted failures out of the health stats soft routing reads
+    monkeypatch.setattr(main, "_model_health", main.defaultdict(main._model_health.default_factory))
+    monkeypatch.setattr(main, "_model_latencies", {model: main.deque(maxlen=200) for model in main._model_latencies})
+    return script, calls
+
+
+async def _hedged():
+    shown = []
+
+    async def on_text(text):
+        shown.append(text)
+
+    result = await main._call_with_hedge("gemini", ROUTE, [], "context", on_text)
+    return result, shown
+
+
+def test_owner_failing_mid_stream_falls_back_to_cancelled_model(models):
+    script, calls = models
+    script["gemini"] = [[1.0], ["second try"]]             # Slow, then fine on its own
+    script["claude"] = [["partial", RuntimeError("stream reset")]]
+
+    (text, _, answered_by), shown = asyncio.run(_hedged())
+    assert (text, answered_by) == ("gemini reply", "gemini")
+    assert calls == ["gemini", "claude", "gemini"]
+    assert shown == ["partial", "second try"]
+
+
+def test_both_failing_still_raises(models):
+    script, _ = models
+    script["gemini"] = [[1.0], [RuntimeError("gemini down")]]
+    script["claude"] = [["partial", RuntimeError("claude down")]]
+
+    with pytest.raises(main.BothModelsFailed, match="claude down; gemini down"):
+        asyncio.run(_hedged())
+
+
+def test_first_to_finish_wins(models):
+    script, calls = models
+    script["gemini"] = [[1.0]]
+    script["claude"] = [["hello"]]
+
+    (text, _, answered_by), _ = asyncio.run(_hedged())
+    assert (text, answered_by) == ("claude reply", "claude")
+    assert calls == ["gemini", "claude"]
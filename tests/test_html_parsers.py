@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import pytest
+
+import finance_tools
+from tests import reference_scrapers
+
+HTML = {path.name: path.read_text(encoding="utf-8") for path in (Path(__file__).parent / "fixtures" / "html").glob("*.html")}
+
+# (HTML_BACKEND, bs4 tree builder)
+BACKENDS = [("bs4", "html.parser"), ("bs4", "lxml"), ("selectolax", "html.parser")]
+
+# (scraper, symbol, saved page)
+SCRAPES = [
+    ("_parse_nse_board", None, "afx_board.html"),
+    ("_fetch_nse_from_afx", "SCOM", "afx_scom.html"),
+    ("_fetch_nse_from_afx", "KQ", "afx_kq_suspended.html"),
+    ("_fetch_nse_from_afx", "EGAD", "afx_egad.html"),
+    ("_fetch_nse_from_mystocks", "SCOM", "mystocks_scom.html"),
+]
+
+
+def skip_unavailable(backend, features):
+    if backend == "selectolax" and finance_tools.HTMLParser is None:
+        pytest.skip("selectolax not installed")
+    if features == "lxml":
+        pytest.importorskip("lxml")
+
+
+def use_backend(monkeypatch, backend, features):
+    monkeypatch.setattr(finance_tools, "HTML_BACKEND", backend)
+    monkeypatch.setattr(finance_tools, "BS4_FEATURES", features)
+
+
+def scrape(monkeypatch, module, name, symbol, page):
+    """Runs one scraper from `module` against a saved page instead of the network."""
+    if symbol is None:
+        return getattr(module, name)(HTML[page])
+
+    class Response:
+        text = HTML[page]
+
+        def raise_for_status(self):
+            pass
+
+    monkeypatch.setattr(finance_tools.requests, "get", lambda url, **kwargs: Response())
+    return getattr(module, name)(symbol)
+
+
+@pytest.mark.parametrize("backend,features", BACKENDS)
+@pytest.mark.parametrize("name,symbol,page", SCRAPES, ids=[f"{s[0]}-{s[2]}" for s in SCRAPES])
+def test_scrapers_match_full_soup_parsing(monkeypatch, name, symbol, page, backend, features):
+    skip_unavailable(backend, features)
+    expected = scrape(monkeypatch, reference_scrapers, name, symbol, page)
+    use_backend(monkeypatch, backend, features)
+    assert scrape(monkeypatch, finance_tools, name, symbol, page) == expected
+
+
+@pytest.mark.parametrize("backend,features", BACKENDS[1:])
+@pytest.mark.parametrize("page", sorted(HTML))
+def test_helpers_agree_across_backends(monkeypatch, page, backend, features):
+    def parse_everything(html):
+        return (
+            finance_tools._html_rows(html),
+            finance_tools._html_tables(html),
+            finance_tools._html_first_text(html, "h2"),
+            finance_tools._html_class_text(html, finance_tools._MYSTOCKS_PRICE_CLASS),
+        )
+
+    skip_unavailable(backend, features)
+    use_backend(monkeypatch, *BACKENDS[0])
+    expected = parse_everything(HTML[page])
+    use_backend(monkeypatch, backend, features)
+    assert parse_everything(HTML[page]) == expected
+
+
+def test_reference_reads_the_fixtures(monkeypatch):
+    board = reference_scrapers._parse_nse_board(HTML["afx_board.html"])
+    assert (board["SCOM"]["price"], board["SCOM"]["change"]) == (17.1, 0.2)
+    assert board["BAT"]["price"] == 1234.5
+    assert "XPRS" not in board  # "--" price
+
+    scom = scrape(monkeypatch, reference_scrapers, "_fetch_nse_from_afx", "SCOM", "afx_scom.html")
+    assert (scom["price"], scom["change"], scom["change_pct"]) == (17.1, 0.2, 1.18)
+    kq = scrape(monkeypatch, reference_scrapers, "_fetch_nse_from_afx", "KQ", "afx_kq_suspended.html")
+    assert kq["price"] == 3.83  # From the <h2>: no quote table
+    mystocks = scrape(monkeypatch, reference_scrapers, "_fetch_nse_from_mystocks", "SCOM", "mystocks_scom.html")
+    assert mystocks["price"] == 17.1
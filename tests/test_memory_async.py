@@ -0,0 +1,19 @@
+import asyncio
+
+from tests import stand_in
+from tests import bench_loop_lag
+
+
+def test_async_api_matches_sync(mongo):
+    mongo.set_voice_mode("1", True)
+    sync = mongo.get_conversation_context("1")
+    assert asyncio.run(mongo.get_conversation_context_async("1")) == sync
+    assert sync["voice_mode"] is True
+
+
+def test_db_round_trips_stay_off_the_loop(mongo, monkeypatch):
+    latency = 0.05
+    monkeypatch.setattr(mongo, "users_col", stand_in.SlowCollection(mongo.users_col, latency))
+    result = asyncio.run(bench_loop_lag.run(users=20, use_async=True))
+    # Any DB call made on the loop would stall the heartbeat by a full round trip
+    assert result["max"] < latency * 1000
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+import main
+
+
+class _Ctx:
+    """Just enough of a commands.Context for the command callbacks."""
+
+    def __init__(self):
+        self.author = type("Author", (), {"id": 1})()
+        self.channel = type("Channel", (), {"id": 2})()
+        self.replies = []
+
+    async def reply(self, text):
+        self.replies.append(text)
+
+
+def _run(command, *args):
+    ctx = _Ctx()
+    asyncio.run(command.callback(ctx, *args))
+    return ctx.replies
+
+
+@pytest.fixture
+def holdings(mongo, monkeypatch):
+    mongo.users_col.insert_one({"_id": "1", "portfolio": {"SCOM": {"shares": 100.0, "cost": 15.0}}})
+    monkeypatch.setattr(main, "add_holding_async", lambda *args: pytest.fail("stored a bad holding"))
+    return mongo
+
+
+@pytest.mark.parametrize("shares,cost", [(float("nan"), None), (float("inf"), None), (10.0, float("nan")), (10.0, -1.0)])
+def test_add_rejects_non_finite_and_negative_numbers(holdings, shares, cost):
+    assert _run(main.portfolio_add, "SCOM", shares, cost) == [main.PORTFOLIO_USAGE]
+
+
+@pytest.mark.parametrize("price", ["nan", "inf", "-inf"])
+def test_alert_rejects_non_finite_prices(monkeypatch, price):
+    monkeypatch.setattr(main, "create_alert", lambda *args: pytest.fail("created an alert"))
+    assert _run(main.alert_command, "SCOM", price) == [main.ALERT_USAGE]
+    assert _run(main.alert_command, "SCOM", "above", float(price)) == [main.ALERT_USAGE]
+
+
+def test_remove_says_when_nothing_is_held(holdings):
+    assert _run(main.portfolio_remove, "KCB", None) == ["You don't hold any KCB. Check `!portfolio`."]
+    assert _run(main.portfolio_remove, "KCB", 5.0) == ["You don't hold any KCB. Check `!portfolio`."]
+    assert _run(main.portfolio_remove, "SCOM", float("nan")) == [main.PORTFOLIO_USAGE]
+
+    assert _run(main.portfolio_remove, "SCOM", 40.0) == ["Done, sold 40 SCOM."]
+    assert holdings.users_col.find_one({"_id": "1"})["portfolio"]["SCOM"]["shares"] == 60.0
+    assert _run(main.portfolio_remove, "SCOM", 61.0) == ["You only hold 60 SCOM, so I left it as is."]
+    assert holdings.users_col.find_one({"_id": "1"})["portfolio"]["SCOM"]["shares"] == 60.0
+    assert _run(main.portfolio_remove, "SCOM", None) == ["Done, removed all your SCOM."]
+    assert _run(main.portfolio_remove, "SCOM", None) == ["You don't hold any SCOM. Check `!portfolio`."]
+
+
+def test_selling_exactly_what_is_held_drops_the_position(holdings):
+    assert holdings.remove_holding("1", "SCOM", 100.0) == 100.0
+    assert "SCOM" not in holdings.users_col.find_one({"_id": "1"})["portfolio"]
+    assert holdings.remove_holding("1", "SCOM", 1.0) is None
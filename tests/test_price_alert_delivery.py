@@ -0,0 +1,60 @@
+import asyncio
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+import main
+
+ALERT = {"user_id": "1", "channel_id": "2", "symbol": "SCOM", "direction": "above", "target": 20.0}
+
+
+def _http_error(kind):
+    return kind(SimpleNamespace(status=403 if kind is discord.Forbidden else 404, reason="nope"), "nope")
+
+
+@pytest.mark.parametrize("text,request_", [
+    ("ping me when SCOM crosses 20", ("SCOM", None, 20.0)),
+    ("tell me if safaricom drops below 15.5", ("safaricom", "below", 15.5)),
+    ("remind me when my rent goes above 20000", None),
+    ("let me know if the weather is above 30", None),
+])
+def test_only_stock_subjects_are_taken_as_alerts(text, request_):
+    assert main._alert_request(text) == request_
+
+
+@pytest.fixture
+def discord_api(monkeypatch):
+    """The alert channel is gone; state["dm_error"] makes the DM fallback fail too."""
+    sent = []
+    state = {"dm_error": None}
+
+    async def fetch_channel(channel_id):
+        raise _http_error(discord.NotFound)
+
+    async def send(text):
+        if state["dm_error"]:
+            raise _http_error(state["dm_error"])
+        sent.append(text)
+
+    async def fetch_user(user_id):
+        return SimpleNamespace(send=send)
+
+    monkeypatch.setattr(main.bot, "get_channel", lambda channel_id: None)
+    monkeypatch.setattr(main.bot, "fetch_channel", fetch_channel)
+    monkeypatch.setattr(main.bot, "fetch_user", fetch_user)
+    return sent, state
+
+
+def test_missing_channel_falls_back_to_dm(discord_api):
+    sent, _ = discord_api
+    asyncio.run(main._send_price_alert(ALERT, 20.5))
+    assert len(sent) == 1 and "**SCOM**" in sent[0]
+
+
+@pytest.mark.parametrize("error", [discord.Forbidden, discord.NotFound])
+def test_closed_dms_do_not_raise(discord_api, error):
+    sent, state = discord_api
+    state["dm_error"] = error
+    asyncio.run(main._send_price_alert(ALERT, 20.5))
+    assert sent == []
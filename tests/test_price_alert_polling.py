@@ -0,0 +1,78 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import finance_tools
+import price_alerts
+
+MONDAY = datetime(2026, 10, 19, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.fixture
+def week(monkeypatch):
+    """Runs a week of 60 s polling passes on a fake clock; returns {symbol: [UTC datetimes polled]}."""
+    clock = [MONDAY]
+    polled = {}
+
+    def at():
+        return datetime.fromtimestamp(clock[0], timezone.utc)
+
+    def get_quotes(symbols):
+        for symbol in symbols:
+            polled.setdefault(symbol, []).append(at())
+        return {}
+
+    async def no_alerts(prices):
+        return []
+
+    monkeypatch.setattr(price_alerts, "time", SimpleNamespace(monotonic=lambda: clock[0]))
+    monkeypatch.setattr(price_alerts, "datetime", SimpleNamespace(now=lambda tz: at()))
+    monkeypatch.setattr(price_alerts, "us_market_is_open", lambda: finance_tools.us_market_is_open(at()))
+    monkeypatch.setattr(price_alerts, "get_quotes", get_quotes)
+    monkeypatch.setattr(price_alerts, "get_triggered_alerts_async", no_alerts)
+    monkeypatch.setattr(price_alerts, "_last_polled", {})
+    monkeypatch.setattr(price_alerts, "_global_polls", {"day": None, "count": 0})
+
+    def run(symbols):
+        async def watched():
+            return symbols
+
+        monkeypatch.setattr(price_alerts, "get_watched_symbols_async", watched)
+
+        async def passes():
+            while clock[0] < MONDAY + 7 * 86400:
+                await price_alerts.check_price_alerts()
+                clock[0] += price_alerts.ALERT_POLL_INTERVAL
+
+        asyncio.run(passes())
+        return polled
+
+    return run
+
+
+def _global_calls_per_day(polled):
+    return Counter(t.date() for symbol, times in polled.items() if symbol != "SCOM" for t in times)
+
+
+@pytest.mark.parametrize("symbols", [
+    ["NVDA"],
+    ["SCOM", "NVDA", "PLTR", "BTC-USD"],
+    ["SCOM"] + [f"S{i}" for i in range(15)],  # More symbols than the budget
+])
+def test_alert_polling_stays_inside_the_alpha_vantage_budget(week, symbols):
+    polled = week(symbols)
+    budget = finance_tools.ALPHA_VANTAGE_PER_DAY - price_alerts.ALERT_AV_RESERVE
+    assert max(_global_calls_per_day(polled).values()) <= budget
+    assert all(polled.get(symbol) for symbol in symbols)  # Nobody starves when oversubscribed
+    if "SCOM" in symbols:
+        assert len(polled["SCOM"]) == 7 * 86400 / price_alerts.ALERT_POLL_INTERVAL  # NSE is every pass
+
+
+def test_us_stocks_are_polled_only_while_the_us_market_is_open(week):
+    polled = week(["NVDA", "BTC-USD"])
+    assert all(finance_tools.us_market_is_open(t) for t in polled["NVDA"])
+    assert {t.weekday() for t in polled["NVDA"]} == {0, 1, 2, 3, 4}
+    assert {t.weekday() for t in polled["BTC-USD"]} == set(range(7))  # Crypto never closes
@@ -0,0 +1,39 @@
+def test_read_racing_a_write_does_not_cache_stale_profile(mongo, monkeypatch):
+    mongo.users_col.insert_one({"_id": "u1", "facts": [{"fact": "Likes tea"}]})
+    find_one = mongo.users_col.find_one
+
+    def find_then_write(*args, **kwargs):
+        doc = find_one(*args, **kwargs)
+        # update_user_fact lands after our read but before we cache it
+        mongo.users_col.update_one({"_id": "u1"}, {"$push": {"facts": {"fact": "Likes coffee"}}})
+        mongo._invalidate_profile("u1")
+        return doc
+
+    monkeypatch.setattr(mongo.users_col, "find_one", find_then_write)
+    assert mongo.get_conversation_context("u1")["facts"] == ("Likes tea",)
+    monkeypatch.setattr(mongo.users_col, "find_one", find_one)
+
+    assert mongo.get_conversation_context("u1")["facts"] == ("Likes tea", "Likes coffee")
+
+
+def test_write_through_racing_a_read_wins(mongo, monkeypatch):
+    find_one = mongo.users_col.find_one
+
+    def find_then_write(*args, **kwargs):
+        doc = find_one(*args, **kwargs)
+        mongo.set_voice_mode("u2", True)
+        return doc
+
+    monkeypatch.setattr(mongo.users_col, "find_one", find_then_write)
+    mongo.get_user_profile("u2")
+    monkeypatch.setattr(mongo.users_col, "find_one", find_one)
+
+    assert mongo.get_user_profile("u2")["voice_mode"] is True
+
+
+def test_cached_facts_cannot_be_changed_by_callers(mongo):
+    mongo.users_col.insert_one({"_id": "u3", "facts": ["Lives in Nairobi"]})
+    profile = mongo.get_user_profile("u3")
+    assert isinstance(profile["facts"], tuple)
+    profile["facts"] = ("Lives in Mombasa",)
+    assert mongo.get_user_profile("u3")["facts"] == ("Lives in Nairobi",)
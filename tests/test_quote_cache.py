@@ -0,0 +1,214 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import finance_tools
+
+CALLERS = 8
+
+
+@pytest.fixture
+def quotes(monkeypatch):
+    """Empty quote cache; `fetch` stands in for the network (slow enough for callers to overlap)."""
+    calls = []
+    state = {"fail": False}
+
+    def fetch(base_symbol, is_nse):
+        calls.append(base_symbol)
+        time.sleep(0.2)
+        if state["fail"]:
+            raise RuntimeError("source down")
+        return {"price": 17.1, "currency": "KES", "source": "afx"}
+
+    monkeypatch.setattr(finance_tools, "_fetch_quote", fetch)
+    monkeypatch.setattr(finance_tools, "record_quote", lambda *args: None)
+    monkeypatch.setattr(finance_tools, "_quote_cache", finance_tools.OrderedDict())
+    monkeypatch.setattr(finance_tools, "_quote_inflight", {})
+    return calls, state
+
+
+def _together(func):
+    start = threading.Barrier(CALLERS)
+
+    def call(_):
+        start.wait()
+        try:
+            return func()
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(CALLERS) as pool:
+        return list(pool.map(call, range(CALLERS)))
+
+
+def test_concurrent_misses_share_one_fetch(quotes):
+    calls, _ = quotes
+    results = _together(lambda: finance_tools._fetch_and_cache("SCOM", True))
+    assert calls == ["SCOM"]
+    assert all(r["price"] == 17.1 for r in results)
+    assert len({id(r) for r in results}) == CALLERS  # Each caller gets its own copy
+    assert finance_tools._quote_inflight == {}
+
+
+def test_waiters_get_the_leaders_failure_instead_of_refetching(quotes):
+    calls, state = quotes
+    state["fail"] = True
+    results = _together(lambda: finance_tools._fetch_and_cache("SCOM", True))
+    assert calls == ["SCOM"]
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert finance_tools._quote_inflight == {}
+
+    state["fail"] = False
+    assert finance_tools._fetch_and_cache("SCOM", True)["price"] == 17.1
+
+
+BOARD_HTML = (
+    "<table><tr><th>Ticker</th><th>Name</th><th>Price</th><th>Change</th></tr>"
+    "<tr><td>SCOM</td><td>Safaricom</td><td>17.10</td><td>+0.20</td></tr>"
+    "<tr><td>KCB</td><td>KCB Group</td><td>38.50</td><td>-0.15</td></tr></table>"
+)
+
+
+@pytest.fixture
+def board(monkeypatch):
+    """Expired board; the AFX request takes 0.3 s and is counted."""
+    requests_made = []
+
+    def get(url, **kwargs):
+        requests_made.append(url)
+        time.sleep(0.3)
+        return _Response(BOARD_HTML)
+
+    monkeypatch.setattr(finance_tools.requests, "get", get)
+    monkeypatch.setattr(finance_tools, "record_quotes", lambda rows: list(rows))
+    monkeypatch.setattr(finance_tools, "_nse_board", {"expires_at": 0.0, "rows": {}, "refreshes": 0, "inflight": None})
+    return requests_made
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+def test_board_refresh_is_shared_and_does_not_block_stats(board):
+    with ThreadPoolExecutor(CALLERS + 1) as pool:
+        boards = [pool.submit(finance_tools._get_nse_board) for _ in range(CALLERS)]
+        time.sleep(0.05)  # Scrape under way
+        started = time.monotonic()
+        stats = finance_tools.get_nse_board_stats()
+        assert time.monotonic() - started < 0.05
+        assert stats["refreshes"] == 0
+        assert all(b.result()["SCOM"]["price"] == 17.1 for b in boards)
+
+    assert len(board) == 1
+    assert finance_tools.get_nse_board_stats()["refreshes"] == 1
+    assert finance_tools._nse_board["inflight"] is None
+
+
+def test_failed_board_scrape_counts_once_against_the_breaker(board, monkeypatch):
+    def get(url, **kwargs):
+        board.append(url)
+        time.sleep(0.3)
+        raise finance_tools.requests.ConnectionError("AFX down")
+
+    monkeypatch.setattr(finance_tools.requests, "get", get)
+    monkeypatch.setattr(finance_tools, "_breakers", {"AFX board": finance_tools.CircuitBreaker("AFX board")})
+    monkeypatch.setattr(finance_tools, "_source_stats", {})
+
+    results = _together(lambda: finance_tools._timed_source("AFX board", lambda: finance_tools._fetch_nse_from_board("SCOM")))
+    assert results == [None] * CALLERS
+    assert len(board) == 1
+    breaker = finance_tools._breakers["AFX board"].snapshot()
+    assert (breaker["state"], breaker["failures"]) == ("closed", 1)
+    assert finance_tools._source_stats["AFX board"]["calls"] == 1
+
+
+def _expire_soon(symbols, seconds=10):
+    for symbol in symbols:
+        _, result = finance_tools._quote_cache[symbol]
+        finance_tools._quote_cache[symbol] = (time.monotonic() + seconds, result)
+
+
+def test_prefetch_refreshes_nse_from_one_board_scrape_and_skips_global(board, monkeypatch):
+    monkeypatch.setattr(finance_tools, "hot_tickers", lambda limit: ["SCOM", "KCB", "AAPL"])
+    monkeypatch.setattr(finance_tools, "_quote_cache", finance_tools.OrderedDict())
+    monkeypatch.setattr(finance_tools, "_prefetch_stats", {"runs": 0, "refreshed": 0, "skipped_global": 0})
+    monkeypatch.setattr(finance_tools, "_fetch_from_alphavantage", lambda *args: pytest.fail("used Alpha Vantage"))
+
+    assert finance_tools.prefetch_hot_quotes() == 2
+    assert len(board) == 1
+    assert finance_tools._prefetch_stats["skipped_global"] == 1
+
+    # Cached quotes are fresh: nothing to do
+    assert finance_tools.prefetch_hot_quotes() == 0
+    assert len(board) == 1
+
+    # Quotes about to expire while the board still has a while: nothing newer to cache
+    _expire_soon(["SCOM", "KCB"])
+    finance_tools._nse_board["expires_at"] = time.monotonic() + 3600
+    assert finance_tools.prefetch_hot_quotes() == 0
+    assert len(board) == 1
+
+    # Board about to expire too: the prefetcher forces one new scrape
+    finance_tools._nse_board["expires_at"] = time.monotonic() + 10
+    assert finance_tools.prefetch_hot_quotes() == 2
+    assert len(board) == 2
+    assert finance_tools._cache_expires_in("SCOM") > finance_tools.PREFETCH_INTERVAL
+
+
+@pytest.fixture
+def fx(monkeypatch):
+    """Expired FX rate; the feed takes 0.3 s and is counted."""
+    requests_made = []
+
+    def get(url, **kwargs):
+        requests_made.append(url)
+        time.sleep(0.3)
+        response = _Response("")
+        response.json = lambda: {"rates": {"KES": 130.5}}
+        return response
+
+    monkeypatch.setattr(finance_tools.requests, "get", get)
+    monkeypatch.setattr(finance_tools, "_fx", {"rate": None, "expires_at": 0.0, "inflight": None})
+    return requests_made
+
+
+def test_cold_fx_rate_is_fetched_once_for_all_callers(fx):
+    assert _together(finance_tools.get_usd_kes_rate) == [130.5] * CALLERS
+    assert len(fx) == 1
+    assert finance_tools._fx["inflight"] is None
+
+
+def test_expired_fx_rate_is_served_while_one_caller_refreshes(fx):
+    finance_tools._fx["rate"] = 129.0
+    with ThreadPoolExecutor(1) as pool:
+        refresh = pool.submit(finance_tools.get_usd_kes_rate)
+        time.sleep(0.05)  # Refresh under way
+        started = time.monotonic()
+        assert finance_tools.get_usd_kes_rate() == 129.0
+        assert time.monotonic() - started < 0.05
+        assert refresh.result() == 130.5
+    assert finance_tools.get_usd_kes_rate() == 130.5
+    assert len(fx) == 1
+
+
+def test_quota_denied_alpha_vantage_is_a_skip_not_a_call(monkeypatch):
+    breaker = finance_tools.CircuitBreaker("Alpha Vantage")
+    breaker.record_failure()
+    quota = finance_tools.TokenBucket(per_minute=5, per_day=25)
+    quota.exhaust(daily=True)
+    monkeypatch.setattr(finance_tools, "ALPHA_VANTAGE_KEY", "key")
+    monkeypatch.setattr(finance_tools, "_av_quota", quota)
+    monkeypatch.setattr(finance_tools, "_breakers", {"Alpha Vantage": breaker})
+    monkeypatch.setattr(finance_tools, "_source_stats", {})
+    monkeypatch.setattr(finance_tools.requests, "get", lambda *args, **kwargs: pytest.fail("called Alpha Vantage"))
+
+    assert finance_tools._timed_source("Alpha Vantage", lambda: finance_tools._fetch_from_alphavantage("NVDA", False)) is None
+    stats = finance_tools.get_quote_source_stats()["Alpha Vantage"]
+    assert (stats["calls"], stats["skipped"]) == (0, 1)
+    assert stats["breaker"]["failures"] == 1  # Neither reset by a "success" nor bumped
@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+import pytest
+
+import finance_tools
+import quote_history
+
+# (days ago, Nairobi time, price). The 00:30 sample is still the previous day in UTC.
+SAMPLES = [
+    (4, "10:00", 100.0), (4, "14:00", 102.0),
+    (3, "10:00", 101.0), (3, "14:00", 99.0),
+    (2, "00:30", 98.0), (2, "10:00", 104.0), (2, "14:00", 105.0),
+    (1, "10:00", 103.0), (1, "14:00", 110.0),
+]
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    """A fresh quote database holding SAMPLES for SCOM."""
+    monkeypatch.setattr(quote_history, "QUOTE_HISTORY_DB", str(tmp_path / "quotes.db"))
+    monkeypatch.setattr(quote_history, "_conn", None)
+    midnight = (time.time() + quote_history.EAT_OFFSET) // 86400 * 86400 - quote_history.EAT_OFFSET
+    for days_ago, clock, price in SAMPLES:
+        hours, minutes = map(int, clock.split(":"))
+        quote_history.record_quote("SCOM", price, ts=midnight - days_ago * 86400 + hours * 3600 + minutes * 60)
+    yield quote_history
+    quote_history._conn.close()
+
+
+def test_price_stats_over_nairobi_trading_days(history):
+    stats = history.price_stats("SCOM", days=30)
+    prices = [price for _, _, price in SAMPLES]
+    closes = np.array([102.0, 99.0, 105.0, 110.0])  # Last sample of each Nairobi day
+    returns = np.diff(closes) / closes[:-1]
+
+    assert stats["samples"] == len(SAMPLES)
+    assert stats["days_covered"] == 4
+    assert (stats["first"], stats["last"]) == (100.0, 110.0)
+    assert stats["change"] == pytest.approx(10.0)
+    assert stats["change_pct"] == pytest.approx(10.0)
+    assert (stats["min"], stats["max"]) == (98.0, 110.0)
+    assert stats["mean"] == pytest.approx(sum(prices) / len(prices))
+    assert stats["volatility_pct"] == pytest.approx(returns.std(ddof=1) * 100)
+
+
+def test_volatility_needs_three_closes(history):
+    stats = history.price_stats("SCOM", days=2)
+    assert stats["days_covered"] <= 2
+    assert stats["volatility_pct"] is None
+
+
+def test_same_bucket_keeps_the_later_price(history):
+    ts = time.time() - 60
+    history.record_quote("KCB", 38.0, ts=ts)
+    history.record_quote("KCB", 38.5, ts=ts)
+    assert history.price_stats("KCB")["samples"] == 1
+    assert history.price_stats("KCB")["last"] == 38.5
+
+
+def test_trend_reply(history):
+    reply = finance_tools.get_stock_trend("SCOM, 7")
+    assert "Safaricom (SCOM) — last 7 days" in reply
+    assert "+10.00 KES (+10.00%)" in reply
+    assert "over 4 days" in reply
+
+    assert finance_tools.get_stock_trend("KCB") == (
+        "*(I don't have price history for KCB yet — I start tracking it once someone asks.)*"
+    )
+
+
+def test_trend_days_are_clamped_to_what_is_kept(history):
+    reply = finance_tools.get_stock_trend("SCOM, 99999999999999999999d")
+    assert f"last {quote_history.RETENTION_DAYS} days" in reply
+    assert "last 2 days" in finance_tools.get_stock_trend("SCOM 2")
@@ -0,0 +1,30 @@
+import json
+import random
+from pathlib import Path
+
+import pytest
+
+import main
+from tests.reference_router import _route_to_model as reference_route
+
+# Real-style messages labeled with the (model, reason) the original router gave them
+CORPUS = json.loads((Path(__file__).parent / "fixtures" / "routing_corpus.json").read_text(encoding="utf-8"))
+ATTACHMENT_SETS = [[], ["image"], ["pdf"], ["text_file"], ["image", "text_file"]]
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=lambda c: f"{c['text'][:30]!r}{c['attachments'] or ''}")
+def test_routing_corpus(case):
+    routed = main._route_to_model(case["text"], bool(case["attachments"]), case["attachments"])
+    assert routed == (case["model"], case["reason"])
+
+
+def test_matches_reference_router_on_shuffled_messages():
+    """Word salad from the corpus hits rule overlaps and orderings real messages rarely do."""
+    rng = random.Random(13)
+    words = sorted({w for case in CORPUS for w in case["text"].split()}) + ["$scom", "vs", "```", "?", "!!"]
+    for _ in range(5000):
+        text = " ".join(rng.choices(words, k=rng.randint(1, 14)))
+        text = text.upper() if rng.random() < 0.1 else text
+        attachments = rng.choice(ATTACHMENT_SETS)
+        assert main._route_to_model(text, bool(attachments), attachments) == \
+            reference_route(text, bool(attachments), attachments), text
@@ -0,0 +1,39 @@
+import asyncio
+import json
+from pathlib import Path
+
+import pytest
+
+import main
+
+# Messages labeled with the stock they ask about, or null when they don't ask about one
+CORPUS = json.loads((Path(__file__).parent / "fixtures" / "stock_detection_corpus.json").read_text(encoding="utf-8"))
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=lambda c: repr(c["text"][:40]))
+def test_stock_detection_corpus(case):
+    assert main._detect_stock_query(case["text"]) == case["symbol"]
+
+
+@pytest.fixture
+def interest(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(main, "record_ticker_interest", recorded.append)
+    return recorded
+
+
+@pytest.fixture
+def quotes(monkeypatch):
+    def get_stock_price(symbol):
+        if symbol == "SCOM":
+            return "**SCOM**: KES 17.10"
+        return f"*(Manze, I couldn't find live prices for {symbol} right now.)*"
+
+    monkeypatch.setitem(main._TAG_HANDLERS, "stock", get_stock_price)
+
+
+def test_tags_record_interest_only_for_real_quotes(interest, quotes):
+    text, appendix = asyncio.run(main._resolve_tags("Here you go [STOCK: SCOM] [STOCK: TV]"))
+    assert text == "Here you go"
+    assert "KES 17.10" in appendix and "couldn't find" in appendix
+    assert interest == ["SCOM"]
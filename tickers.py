@@ -0,0 +1,225 @@
+import re
+import difflib
+from collections import namedtuple
+from functools import lru_cache
+
+# One place for everything Emily knows about ticker symbols.
+Ticker = namedtuple("Ticker", "symbol name exchange")
+
+# NSE tickers mapped to full names
+NSE_TICKERS = {
+    "SCOM": "Safaricom", "KCB": "KCB Group", "EQTY": "Equity Group",
+    "COOP": "Co-operative Bank", "ABSA": "ABSA Bank Kenya", "SBIC": "Stanbic Holdings",
+    "NCBA": "NCBA Group", "DTB": "Diamond Trust Bank", "IMH": "I&M Holdings",
+    "BKG": "BK Group", "HF": "HF Group", "CIC": "CIC Insurance",
+    "BRIT": "Britam Holdings", "JUB": "Jubilee Holdings", "LKN": "Liberty Kenya",
+    "KNRE": "Kenya Reinsurance", "EABL": "East African Breweries",
+    "BAT": "BAT Kenya", "BOC": "BOC Kenya", "CARB": "Carbacid Investments",
+    "BAMB": "Bamburi Cement", "ARM": "ARM Cement", "CRG": "Car & General",
+    "KEGN": "KenGen", "KPLC": "Kenya Power", "TOTAL": "TotalEnergies Kenya",
+    "UMME": "Umeme", "AIRTEL": "Airtel Africa",
+    "CTUM": "Centum Investment", "ICDC": "ICDC", "OCH": "Olympia Capital",
+    "SASN": "Sasini", "KUKZ": "Kakuzi", "LIMT": "Limuru Tea",
+    "WTK": "WPP Scangroup", "REA": "Rea Vipingo", "EGAD": "Eaagads",
+    "KAPC": "Kapchorua Tea", "HOME": "Home Afrika",
+    "UCHM": "Uchumi", "SGL": "Standard Group", "NMG": "Nation Media",
+    "TPS": "TPS Eastern Africa", "SCAN": "WPP Scangroup", "HAFR": "Flame Tree Group",
+    "FIRE": "Flame Tree Group", "KENO": "KenolKobil", "MSC": "Nairobi Securities",
+    "EVRD": "Eveready East Africa", "WILL": "Williamson Tea",
+}
+
+GLOBAL_TICKERS = {
+    "MSFT": ("Microsoft", "US"), "AAPL": ("Apple", "US"), "GOOGL": ("Alphabet", "US"),
+    "TSLA": ("Tesla", "US"), "AMZN": ("Amazon", "US"), "META": ("Meta", "US"),
+    "NVDA": ("Nvidia", "US"), "NFLX": ("Netflix", "US"), "AMD": ("AMD", "US"),
+    "INTC": ("Intel", "US"), "BTC-USD": ("Bitcoin", "CRYPTO"), "ETH-USD": ("Ethereum", "CRYPTO"),
+}
+
+# Nicknames and short forms people actually type (matched case-insensitively)
+ALIASES = {
+    "SAFARICOM": "SCOM", "SAF": "SCOM", "EQUITY": "EQTY", "EQUITY BANK": "EQTY",
+    "COOPERATIVE": "COOP", "CO-OP": "COOP", "COOP BANK": "COOP",
+    "STANBIC": "SBIC", "DIAMOND TRUST": "DTB", "I&M": "IMH", "IM": "IMH",
+    "BRITAM": "BRIT", "JUBILEE": "JUB", "LIBERTY": "LKN",
+    "KENYA RE": "KNRE", "KENRE": "KNRE", "BAMBURI": "BAMB", "KENGEN": "KEGN",
+    "KENYA POWER": "KPLC", "AIRTEL": "AIRTEL", "CENTUM": "CTUM",
+    "SASINI": "SASN", "KAKUZI": "KUKZ", "NATION": "NMG", "NATION MEDIA": "NMG",
+    "STANDARD GROUP": "SGL", "EAST AFRICAN BREWERIES": "EABL", "BREWERIES": "EABL",
+    "WPP SCANGROUP": "SCAN", "SCANGROUP": "SCAN", "WILLIAMSON TEA": "WILL",
+    "MICROSOFT": "MSFT", "APPLE": "AAPL", "GOOGLE": "GOOGL", "ALPHABET": "GOOGL",
+    "TESLA": "TSLA", "AMAZON": "AMZN", "META": "META", "FACEBOOK": "META",
+    "NVIDIA": "NVDA", "NETFLIX": "NFLX", "INTEL": "INTC",
+    "BITCOIN": "BTC-USD", "BTC": "BTC-USD", "ETHEREUM": "ETH-USD", "ETH": "ETH-USD",
+}
+
+# Everyday words that are also tickers or company names. As names they only
+# count when Capitalized; as symbols only when written in CAPS or with a $.
+AMBIGUOUS = {
+    "BAT", "TOTAL", "HOME", "FIRE", "WILL", "META", "ARM", "HF", "IM", "REA",
+    "SCAN", "CARB", "SAF", "BRIT", "EQUITY", "LIBERTY", "JUBILEE", "NATION",
+    "APPLE", "AMAZON", "INTEL", "ALPHABET", "BREWERIES", "CENTUM",
+}
+
+# Words that look like symbols in CAPS but never are
+_NOT_SYMBOLS = {
+    "I", "A", "NSE", "NYSE", "NASDAQ", "AMEX", "USD", "KES", "KSH", "CEO", "IPO", "ETF", "OK", "AI", "US", "UK",
+    # Kenyan savings and investment products: "buy shares in a SACCO" is not a ticker,
+    # even right before "shares"
+    "SACCO", "SACCOS", "MMF", "MMFS", "CHAMA", "CHAMAS", "REIT", "REITS", "IFB", "TBILL", "TBOND",
+    "CDS", "CDSC", "CMA", "FULIZA", "MSHWARI",
+}
+
+# Acronyms and CAPS words people type every day. Some are real US symbols
+# (IT, NOW, GDP), so they aren't ruled out: they just need a $, "stock" or
+# "shares" right after them, or a US exchange named in the message.
+_COMMON_CAPS = {
+    # Kenya
+    "KRA", "PAYE", "VAT", "NHIF", "NSSF", "SHA", "SHIF", "HELB", "CBK", "KCSE", "KCPE", "CBC", "IEBC",
+    "ODM", "UDA", "MP", "MCA", "JKIA", "SGR", "CBD", "KTN", "NTV", "MPESA", "PIN", "ATM", "SMS",
+    # Everyday acronyms
+    "TV", "IT", "HR", "CV", "ID", "DM", "PM", "AM", "PS", "NB", "PDF", "URL", "API", "USB", "WIFI",
+    "HP", "GDP", "ROI", "EPS", "PE", "CFO", "CTO", "GPT", "ML", "FAQ", "DIY", "UTC", "GMT", "HIV",
+    "DNA", "IQ", "PHD", "MBA", "CPA", "COVID", "USA", "EU", "UN", "WHO", "NGO", "BBC", "CNN",
+    "NBA", "NFL", "FIFA", "EPL", "EUR", "GBP", "FX",
+    # Chat
+    "LOL", "LMAO", "ROFL", "OMG", "BTW", "BRB", "IMO", "TBH", "FYI", "ASAP", "WTF",
+    # Emphasis
+    "REALLY", "VERY", "NOW", "PLEASE", "NOT", "ALL", "NEW", "BUY", "SELL", "HOLD", "TODAY", "HELP",
+}
+_EXCHANGE_RE = re.compile(r"\b(?:NYSE|NASDAQ|AMEX|wall street)\b", re.IGNORECASE)
+_STOCK_WORDS = {"stock", "stocks", "share", "shares"}
+
+FUZZY_CUTOFF = 0.8   # "safcom" → SAFARICOM scores 0.8
+FUZZY_MIN_LEN = 5    # Shorter words are too easy to mistake for each other
+
+_TOKEN_RE = re.compile(r"\$?[A-Za-z0-9][A-Za-z0-9&\-]*")
+
+
+def _build_index():
+    """Symbol → Ticker table and a token trie over symbols, names and aliases."""
+    table = {symbol: Ticker(symbol, name, "NSE") for symbol, name in NSE_TICKERS.items()}
+    table.update({symbol: Ticker(symbol, name, exchange) for symbol, (name, exchange) in GLOBAL_TICKERS.items()})
+
+    phrases = {}  # upper-case phrase -> (symbol, is_symbol)
+    for symbol in table:
+        phrases[symbol] = (symbol, True)
+    names = {}
+    for ticker in table.values():
+        names.setdefault(ticker.name.upper(), set()).add(ticker.symbol)
+    for name, symbols in names.items():
+        if len(symbols) == 1 and name not in phrases:  # Shared names (e.g. two WPP listings) stay ambiguous
+            phrases[name] = (symbols.pop(), False)
+    for alias, symbol in ALIASES.items():
+        phrases.setdefault(alias, (symbol, False))
+
+    trie = {}
+    for phrase, entry in phrases.items():
+        node = trie
+        for token in phrase.lower().split():
+            node = node.setdefault(token, {})
+        node[None] = entry  # None key marks the end of a phrase
+
+    fuzzy_vocab = sorted(
+        phrase.lower() for phrase, (_, is_symbol) in phrases.items()
+        if not is_symbol and " " not in phrase and len(phrase) >= FUZZY_MIN_LEN and phrase not in AMBIGUOUS
+    )
+    return table, trie, fuzzy_vocab
+
+
+_TICKERS, _TRIE, _FUZZY_VOCAB = _build_index()
+
+
+@lru_cache(maxsize=2048)
+def _fuzzy_lookup(word):
+    match = difflib.get_close_matches(word, _FUZZY_VOCAB, n=1, cutoff=FUZZY_CUTOFF)
+    return _TRIE[match[0]][None][0] if match else None
+
+
+def _accept(typed, canonical, is_symbol, dollar, shouting, lenient):
+    """Case rules that keep everyday words from turning into tickers."""
+    if dollar:
+        return True
+    if canonical not in AMBIGUOUS or lenient and not is_symbol:
+        return True
+    if shouting:
+        return False
+    # "TOTAL"/"HOME" as symbols need caps; "Apple"/"Equity"/"Meta" as names need a capital
+    return typed.isupper() if is_symbol and canonical not in ALIASES else typed[:1].isupper()
+
+
+def lookup(symbol):
+    """Ticker for an exact symbol (case-insensitive), or None."""
+    return _TICKERS.get(symbol.strip().lstrip("$").upper())
+
+
+def find_tickers(text, fuzzy=False, unknown_symbols=False, lenient=False):
+    """
+    Every ticker mentioned in `text`, in order, in one left-to-right scan.
+    At each word the trie is walked as far as it goes (longest phrase wins,
+    so "Kenya Power" beats "Kenya"). With `fuzzy`, unmatched words get a
+    typo-tolerant lookup against company names. With `unknown_symbols`,
+    CAPS words we don't know (like "PLTR") are returned as US tickers,
+    except everyday acronyms ("TV", "GDP") that aren't clearly meant as one.
+    `lenient` (the message is clearly about stocks) lets lower-case
+    everyday-word names like "equity" through.
+    """
+    words = [m.group(0).rstrip("-") for m in _TOKEN_RE.finditer(text)]
+    # Mostly-CAPS messages say nothing about which words are symbols
+    alpha = [w for w in words if w.lstrip("$").isalpha()]
+    shouting = sum(w.isupper() for w in alpha) * 2 > len(alpha)
+    found = []
+    i = 0
+    while i < len(words):
+        dollar = words[i].startswith("$")
+        first = words[i].lstrip("$")
+        node, j, best = _TRIE, i, None
+        while j < len(words):
+            node = node.get((words[j].lstrip("$") if j == i else words[j]).lower())
+            if node is None:
+                break
+            j += 1
+            if None in node:
+                best = (j, node[None])
+
+        ticker = None
+        if best:
+            end, (symbol, is_symbol) = best
+            typed = " ".join([first] + words[i + 1:end])
+            if _accept(typed, typed.upper(), is_symbol, dollar, shouting, lenient):
+                ticker = _TICKERS[symbol]
+                i = end
+        if ticker is None:
+            if fuzzy and len(first) >= FUZZY_MIN_LEN and first.isalpha():
+                symbol = _fuzzy_lookup(first.lower())
+                ticker = _TICKERS[symbol] if symbol else None
+            if ticker is None and (dollar or unknown_symbols and not shouting):
+                if first.isupper() and first.isalpha() and len(first) <= 6 and first not in _NOT_SYMBOLS:
+                    next_word = words[i + 1].lower() if i + 1 < len(words) else ""
+                    if (dollar or first not in _COMMON_CAPS or next_word in _STOCK_WORDS
+                            or _EXCHANGE_RE.search(text)):
+                        ticker = Ticker(first, first, "US")
+            i += 1
+        if ticker and ticker not in found:
+            found.append(ticker)
+    return found
+
+
+def resolve(term):
+    """
+    Best ticker for one name, alias or symbol (e.g. a [STOCK: ...] tag), or None.
+    The caller already knows it's a stock, so the everyday-word rules don't apply.
+    """
+    term = term.strip().lstrip("$")
+    ticker = lookup(term)
+    if ticker:
+        return ticker
+    node = _TRIE
+    for word in term.lower().split():
+        node = node.get(word)
+        if node is None:
+            break
+    else:
+        if None in node:
+            return _TICKERS[node[None][0]]
+    found = find_tickers(term, fuzzy=True)
+    return found[0] if found else None